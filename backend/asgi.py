@@ -0,0 +1,753 @@
+"""
+AltarMaker async API
+
+ASGI variant of the design and session routes, built on Quart and Motor so a
+single process can keep thousands of slow clients in flight without a thread
+per request. URLs, JSON bodies and the session cookie are the same as the
+Flask app, so a reverse proxy can route /api/designs and /api/sessions here
+while auth, admin and feedback stay on the WSGI workers.
+
+It also serves ``/api/sessions/<id>/live``, the WebSocket live-editing
+channel of ``collab.py``, which the Flask app cannot.
+
+Run with:
+    hypercorn -b 0.0.0.0:5001 asgi:app
+"""
+import asyncio
+import copy
+import hmac
+import json
+import os
+from datetime import datetime
+from functools import wraps
+from urllib.parse import urlsplit
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from quart import Quart, Response, g, request, jsonify, session, websocket
+from catalog import check_design_assets, init_catalog
+from collab import OPS_COLLECTION, CollabHub, MongoOpStore
+from design_schema import (
+    DesignValidationError, validate_live_message, validate_session_payload, validate_wall_design_payload, validate_clone_payload,
+    validate_wall_payload, validate_wall_patch_payload, validate_bulk_payload, check_payload_size,
+    check_storage_quota, storage_usage_pipeline
+)
+from documents import (
+    EXPORT_FORMAT, EXPORT_VERSION, WALL_NAMES, wall_design_document, wall_design_response, session_document,
+    session_update, serialize_session, clone_document, empty_wall_designs, apply_wall_patch, wall_etag,
+    wall_update, bulk_ids, bulk_results, export_session, replaced_wall_size
+)
+from element_codec import decode_wall_designs
+from slow_queries import slow_query_log
+from structured_logging import REQUEST_ID_HEADER, configure_logging, end_request, request_id
+from structured_logging import start_request as start_request_id
+from tracing import TRACEPARENT_HEADER, MongoCommandTracer, configure_tracing, end_trace, start_trace
+from metrics import (
+    CONTENT_TYPE, REGISTRY, MongoCommandMetrics, finish_request, response_sent, start_request, write_behind_collector
+)
+from wall_store import join_walls, load_walls_async, save_blobs_async, split_wall_designs, touch_blobs_async
+from write_behind import (
+    SESSION, AsyncWriteBehind, overlay_session, session_key, wall_designs_key, write_behind_window
+)
+
+import logging
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+app = Quart(__name__)
+app.config.from_object('config.Config')
+configure_logging(app.config)
+tracer = configure_tracing(app.config, app.instance_path)
+init_catalog(app)
+
+# Same dev origins the Flask app allows through CORS
+CORS_ORIGINS = {"http://localhost:5173", "http://127.0.0.1:5173"}
+
+client = None
+db = None
+hub = None
+writes = None
+
+
+@app.before_serving
+async def connect_database():
+    """Open the Motor client on the serving event loop"""
+    global client, db, hub, writes
+    listeners = [MongoCommandMetrics()] if app.config.get('METRICS_ENABLED', True) else []
+    slow_queries = slow_query_log(app.config, app.instance_path, client=lambda: client.delegate)
+    if slow_queries is not None:
+        listeners.append(slow_queries)
+    if tracer is not None:
+        listeners.append(MongoCommandTracer())
+    client = AsyncIOMotorClient(
+        os.getenv('MONGO_URI'),
+        maxPoolSize=int(os.getenv('ASYNC_MONGO_POOL_SIZE', 100)),
+        # Motor runs commands with the request's context, so they count towards its endpoint
+        event_listeners=listeners
+    )
+    db = client.altarmaker
+    writes = AsyncWriteBehind(
+        db,
+        window=write_behind_window(app.config),
+        max_delay=app.config.get('WRITE_BEHIND_MAX_DELAY', 5.0),
+    )
+    hub = CollabHub(
+        MongoOpStore(db, writes),
+        batch_interval=app.config.get('LIVE_BATCH_SECONDS', 0.05),
+        compact_every=app.config.get('LIVE_COMPACT_EVERY', 500),
+    )
+    REGISTRY.collector('write_behind', write_behind_collector(writes))
+    logger.info(f"Async MongoDB client ready: {db}")
+
+
+@app.after_serving
+async def close_database():
+    if hub is not None:
+        # Log and compact open rooms before the connection goes away
+        await hub.shutdown()
+    if writes is not None:
+        # Autosaves still waiting for their write
+        await writes.close()
+    if client is not None:
+        client.close()
+
+
+@app.before_request
+async def start_metrics():
+    start_request_id(request.headers.get(REQUEST_ID_HEADER))
+    if app.config.get('METRICS_ENABLED', True):
+        start_request(request.endpoint)
+    if tracer is not None:
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g.trace_span = start_trace(
+            f'{request.method} {rule}', request.headers.get(TRACEPARENT_HEADER),
+            app.config.get('TRACE_SAMPLE_RATE', 0.1),
+            {'http.request.method': request.method, 'http.route': rule, 'url.path': request.path,
+             'endpoint': request.endpoint or 'unmatched'},
+        )
+
+
+@app.after_request
+async def record_response(response):
+    response_sent(response.status_code, response.content_length)
+    if g.get('trace_span') is not None:
+        g.trace_span.set('http.response.status_code', response.status_code)
+    if request_id():
+        response.headers[REQUEST_ID_HEADER] = request_id()
+    return response
+
+
+@app.teardown_request
+async def finish_metrics(exc=None):
+    finish_request(request.method, request.content_length)
+    end_request()
+    root = g.pop('trace_span', None)
+    if root is not None:
+        end_trace(root, root.attributes.get('http.response.status_code'), exc)
+
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """Same as the Flask app's /metrics, for this process"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return jsonify({'error': 'Not found'}), 404
+    token = app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Authentication required'}), 401
+    return Response(REGISTRY.exposition(), content_type=CONTENT_TYPE)
+
+
+@app.after_request
+async def add_cors_headers(response):
+    origin = request.headers.get('Origin')
+    if origin in CORS_ORIGINS and request.path.startswith('/api/'):
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, PATCH, DELETE, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, If-Match, If-None-Match, traceparent'
+        response.headers['Access-Control-Expose-Headers'] = 'ETag, X-Request-ID'
+        response.headers['Access-Control-Max-Age'] = '600'
+        response.headers['Vary'] = 'Origin'
+    return response
+
+
+def trusted_origin(origin, host):
+    """Whether a WebSocket handshake comes from one of our pages.
+
+    Browsers send the session cookie on cross-site WebSocket handshakes and
+    CORS does not apply, so the Origin header is the only check.
+    """
+    if not origin:
+        return False
+    if origin in CORS_ORIGINS or origin == app.config.get('APP_URL'):
+        return True
+    return bool(host) and urlsplit(origin).netloc == host
+
+
+def get_current_user():
+    """Get current user from the shared session cookie"""
+    if session.get('logged_in'):
+        return {
+            'user_id': session.get('user_id'),
+            'username': session.get('username'),
+            'role': session.get('role')
+        }
+    return None
+
+
+def require_auth(f):
+    """Decorator to require authentication"""
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        user_data = get_current_user()
+        if not user_data:
+            return jsonify({'error': 'Authentication required'}), 401
+
+        request.user_data = user_data
+        return await f(*args, **kwargs)
+    return decorated_function
+
+
+async def check_quota(user_id, size_bytes, exclude_id=None):
+    """Reject saves that push the user's sessions over their storage quota"""
+    quota = app.config.get('USER_STORAGE_QUOTA_BYTES')
+    if not quota:
+        return
+    usage = await db.sessions.aggregate(storage_usage_pipeline(user_id, exclude_id)).to_list(1)
+    check_storage_quota(usage[0]['total'] if usage else 0, size_bytes, quota)
+
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    try:
+        await client.admin.command('ping')
+        return jsonify({
+            'status': 'healthy',
+            'message': 'AltarMaker API is running',
+            'database': 'connected'
+        })
+    except Exception:
+        return jsonify({
+            'status': 'unhealthy',
+            'message': 'Database connection failed',
+            'database': 'disconnected'
+        }), 500
+
+
+@app.route('/api/designs/wall-designs', methods=['GET'])
+@require_auth
+async def get_wall_designs():
+    """Get wall designs for current user"""
+    try:
+        user_id = request.user_data['user_id']
+
+        pending = writes.pending(wall_designs_key(user_id))
+        # Decoding works in place; the pending save is still to be written
+        wall_design = copy.deepcopy(pending.document) if pending else await db.wall_designs.find_one(
+            {'user_id': user_id},
+            sort=[('created_at', -1)]
+        )
+
+        body = wall_design_response(wall_design)
+        failure = writes.failure(wall_designs_key(user_id))
+        if failure:
+            body['saveError'] = failure[1]
+        return jsonify(body)
+    except Exception as e:
+        logger.error(f"Error getting wall designs: {e}")
+        return jsonify({'error': 'Failed to get wall designs'}), 500
+
+
+@app.route('/api/designs/wall-designs', methods=['POST'])
+@require_auth
+async def save_wall_designs():
+    """Save wall designs for current user"""
+    try:
+        user_id = request.user_data['user_id']
+        body = await request.get_data()
+        check_payload_size(len(body), app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = await request.get_json()
+        validate_wall_design_payload(data)
+        unknown_assets = check_design_assets(data.get('wallDesigns'), app)
+        if unknown_assets:
+            return jsonify({'error': 'Design references unknown catalog assets', 'assets': unknown_assets}), 400
+
+
+        failure = await writes.save(wall_designs_key(user_id), wall_design_document(user_id, data))
+        if failure:
+            return jsonify({'error': failure[1]}), failure[0]
+
+        return jsonify({
+            'success': True,
+            'message': 'Wall designs saved successfully'
+        })
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        logger.error(f"Error saving wall designs: {e}")
+        return jsonify({'error': 'Failed to save wall designs'}), 500
+
+
+@app.route('/api/sessions', methods=['GET'])
+@require_auth
+async def get_sessions():
+    """Get all sessions for the authenticated user"""
+    try:
+        user_id = request.user_data['user_id']
+        sessions = [session_data async for session_data in db.sessions.find({'user_id': user_id})]
+        pending = {entry.key[2]: entry for entry in writes.pending_for(SESSION, user_id)}
+        for session_data in sessions:
+            if str(session_data['_id']) in pending:
+                overlay_session(session_data, pending[str(session_data['_id'])])
+        await load_walls_async(db, sessions)
+        for session_data in sessions:
+            serialize_session(session_data)
+
+        return jsonify({'sessions': sessions}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/sessions', methods=['POST'])
+@require_auth
+async def save_session():
+    """Save a new session"""
+    try:
+        user_id = request.user_data['user_id']
+        body = await request.get_data()
+        check_payload_size(len(body), app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = await request.get_json()
+        validate_session_payload(data)
+        unknown_assets = check_design_assets(data.get('wall_designs'), app)
+        if unknown_assets:
+            return jsonify({'error': 'Design references unknown catalog assets', 'assets': unknown_assets}), 400
+
+        await check_quota(user_id, len(body))
+
+        session_data, blobs = session_document(user_id, data, len(body))
+        await save_blobs_async(db, blobs)
+        result = await db.sessions.insert_one(session_data)
+        session_data['_id'] = result.inserted_id
+        join_walls([session_data], blobs)
+        serialize_session(session_data)
+
+        return jsonify({
+            'message': 'Session saved successfully',
+            'session': session_data
+        }), 201
+
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+@require_auth
+async def get_session(session_id):
+    """Get a specific session"""
+    try:
+        user_id = request.user_data['user_id']
+
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+
+        session_data = await db.sessions.find_one({
+            '_id': ObjectId(session_id),
+            'user_id': user_id
+        })
+
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+
+        pending = writes.pending(session_key(user_id, session_id))
+        if pending:
+            overlay_session(session_data, pending)
+        await load_walls_async(db, [session_data])
+        serialize_session(session_data)
+        body = {'session': session_data}
+        failure = writes.failure(session_key(user_id, session_id))
+        if failure:
+            body['save_error'] = failure[1]
+        return jsonify(body), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/sessions/<session_id>', methods=['PUT'])
+@require_auth
+async def update_session(session_id):
+    """Update a session"""
+    try:
+        user_id = request.user_data['user_id']
+
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+
+        body = await request.get_data()
+        check_payload_size(len(body), app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = await request.get_json()
+        validate_session_payload(data)
+        unknown_assets = check_design_assets(data.get('wall_designs'), app)
+        if unknown_assets:
+            return jsonify({'error': 'Design references unknown catalog assets', 'assets': unknown_assets}), 400
+
+        await check_quota(user_id, len(body), exclude_id=ObjectId(session_id))
+
+        update_data, blobs = session_update(data, len(body))
+        session_data = await db.sessions.find_one({'_id': ObjectId(session_id), 'user_id': user_id}, {'ops_seq': 1})
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+
+        failure = await writes.save(session_key(user_id, session_id), update_data, blobs,
+                                    guard={'ops_seq': session_data.get('ops_seq')})
+        if failure:
+            return jsonify({'error': failure[1]}), failure[0]
+
+        return jsonify({'message': 'Session updated successfully'}), 200
+
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+@require_auth
+async def delete_session(session_id):
+    """Delete a session"""
+    try:
+        user_id = request.user_data['user_id']
+
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+
+        writes.discard(session_key(user_id, session_id))
+        result = await db.sessions.delete_one({
+            '_id': ObjectId(session_id),
+            'user_id': user_id
+        })
+
+        if result.deleted_count == 0:
+            return jsonify({'error': 'Session not found'}), 404
+        await db[OPS_COLLECTION].delete_many({'session_id': session_id})
+
+        return jsonify({'message': 'Session deleted successfully'}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/sessions/bulk', methods=['POST'])
+@require_auth
+async def bulk_sessions():
+    """Delete, rename, export or fetch many sessions in one request"""
+    try:
+        user_id = request.user_data['user_id']
+        body = await request.get_data()
+        check_payload_size(len(body), app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = await request.get_json(silent=True)
+        validate_bulk_payload(data)
+
+        action = data['action']
+        ids = bulk_ids(data)
+        object_ids = [ObjectId(session_id) for session_id in ids if ObjectId.is_valid(session_id)]
+        query = {'_id': {'$in': object_ids}, 'user_id': user_id}
+
+        for session_id in ids:
+            if action == 'delete':
+                writes.discard(session_key(user_id, session_id))
+            elif writes.pending(session_key(user_id, session_id)):
+                await writes.flush(session_key(user_id, session_id))
+
+        if action in ('export', 'fetch'):
+            sessions = await load_walls_async(db, await db.sessions.find(query).to_list(None))
+        else:
+            sessions = await db.sessions.find(query, {'_id': 1}).to_list(None)
+        found = {str(session_data['_id']): session_data for session_data in sessions}
+
+        if action == 'delete' and found:
+            await db.sessions.delete_many({'_id': {'$in': [s['_id'] for s in sessions]}, 'user_id': user_id})
+            await db[OPS_COLLECTION].delete_many({'session_id': {'$in': list(found)}})
+        elif action == 'rename' and found:
+            now = datetime.utcnow()
+            await db.sessions.bulk_write([
+                UpdateOne(
+                    {'_id': session_data['_id'], 'user_id': user_id},
+                    {'$set': {'session_name': data['names'][session_id], 'updated_at': now}}
+                )
+                for session_id, session_data in found.items()
+            ], ordered=False)
+
+        if action == 'fetch':
+            return jsonify({'results': bulk_results(ids, found, lambda s: {'session': serialize_session(s)})}), 200
+        results = bulk_results(ids, found)
+        if action == 'export':
+            response = jsonify({
+                'format': EXPORT_FORMAT,
+                'version': EXPORT_VERSION,
+                'exported_at': datetime.utcnow().isoformat() + 'Z',
+                'sessions': [export_session(found[session_id]) for session_id in ids if session_id in found],
+                'results': results
+            })
+            response.headers['Content-Disposition'] = 'attachment; filename="altarmaker-sessions.json"'
+            return response
+        return jsonify({'results': results}), 200
+
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/sessions/<session_id>/clone', methods=['POST'])
+@require_auth
+async def clone_session(session_id):
+    """Copy a session, sharing its wall blobs"""
+    try:
+        user_id = request.user_data['user_id']
+
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+
+        data = await request.get_json(silent=True) or {}
+        validate_clone_payload(data)
+
+        await writes.flush(session_key(user_id, session_id))
+        parent = await db.sessions.find_one({'_id': ObjectId(session_id), 'user_id': user_id})
+        if not parent:
+            return jsonify({'error': 'Session not found'}), 404
+
+        wall_designs, blobs = split_wall_designs(decode_wall_designs(parent.get('wall_designs')))
+        if blobs:
+            await save_blobs_async(db, blobs)
+            await db.sessions.update_one(
+                {'_id': parent['_id'], 'updated_at': parent.get('updated_at')},
+                {'$set': {'wall_designs': wall_designs}}
+            )
+            parent['wall_designs'] = wall_designs
+
+        await check_quota(user_id, parent.get('size_bytes') or 0)
+
+        await touch_blobs_async(db, [parent])
+        session_data = clone_document(parent, user_id, data.get('session_name'))
+        result = await db.sessions.insert_one(session_data)
+        session_data['_id'] = result.inserted_id
+        session_data.pop('wall_designs')
+        serialize_session(session_data)
+
+        return jsonify({
+            'message': 'Session cloned successfully',
+            'session': session_data
+        }), 201
+
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def wall_response(body, etag, status=200):
+    response = jsonify(body)
+    response.status_code = status
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+async def find_wall(session_id, wall, *fields):
+    if not ObjectId.is_valid(session_id):
+        raise DesignValidationError('Invalid session ID')
+    if wall not in WALL_NAMES:
+        raise DesignValidationError(f"wall must be one of {', '.join(WALL_NAMES)}")
+    await writes.flush(session_key(request.user_data['user_id'], session_id))
+    projection = {f'wall_designs.{wall}': 1, **{field: 1 for field in fields}}
+    return await db.sessions.find_one(
+        {'_id': ObjectId(session_id), 'user_id': request.user_data['user_id']}, projection
+    )
+
+
+# What saving one wall reads besides the wall, as in the Flask routes
+WALL_SAVE_FIELDS = ('user_id', 'room_type', 'wall_structure', 'size_bytes', 'wall_sizes')
+
+
+async def resolved_wall(session_data, wall):
+    current = (session_data.get('wall_designs') or {}).get(wall)
+    resolved = (await load_walls_async(db, [{'wall_designs': {wall: dict(current) if current else None}}]))[0]
+    return decode_wall_designs(resolved['wall_designs'])[wall]
+
+
+async def check_wall_quota(session_data, wall, design, old_design=None):
+    size_bytes = replaced_wall_size(session_data, wall, design, old_design)
+    await check_quota(session_data['user_id'], size_bytes, exclude_id=session_data['_id'])
+    return size_bytes
+
+
+async def save_wall(session_data, wall, design, size_bytes=None):
+    """Replace one wall, honouring If-Match like the Flask route"""
+    current = (session_data.get('wall_designs') or {}).get(wall)
+    query = {'_id': session_data['_id'], 'user_id': session_data['user_id']}
+    if request.if_match:
+        if not request.if_match.contains(wall_etag(current)):
+            return wall_response({'error': 'Wall has been modified'}, wall_etag(current), 412)
+        query[f'wall_designs.{wall}'] = current
+
+    update_data, blobs = wall_update(session_data, wall, design, size_bytes)
+    await save_blobs_async(db, blobs)
+    result = await db.sessions.update_one(query, {'$set': update_data})
+    if result.matched_count == 0:
+        return jsonify({'error': 'Wall has been modified'}), 412
+
+    etag = wall_etag(update_data[f'wall_designs.{wall}'])
+    return wall_response({'message': 'Wall updated successfully', 'etag': etag}, etag)
+
+
+@app.route('/api/sessions/<session_id>/walls/<wall>', methods=['GET'])
+@require_auth
+async def get_session_wall(session_id, wall):
+    """Get one wall of a session, with an ETag of its content"""
+    try:
+        session_data = await find_wall(session_id, wall)
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+
+        etag = wall_etag((session_data.get('wall_designs') or {}).get(wall))
+        if request.if_none_match.contains(etag):
+            response = Response('', status=304)
+            response.set_etag(etag)
+            return response
+
+        await load_walls_async(db, [session_data])
+        design = decode_wall_designs(session_data.get('wall_designs') or {}).get(wall)
+        return wall_response({'wall': wall, 'design': design or empty_wall_designs()[wall]}, etag)
+
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/sessions/<session_id>/walls/<wall>', methods=['PUT'])
+@require_auth
+async def put_session_wall(session_id, wall):
+    """Replace one wall of a session"""
+    try:
+        body = await request.get_data()
+        check_payload_size(len(body), app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = await request.get_json(silent=True)
+        validate_wall_payload(data)
+        unknown_assets = check_design_assets({wall: data}, app)
+        if unknown_assets:
+            return jsonify({'error': 'Design references unknown catalog assets', 'assets': unknown_assets}), 400
+
+
+        session_data = await find_wall(session_id, wall, *WALL_SAVE_FIELDS)
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+        recorded = wall in (session_data.get('wall_sizes') or {})
+        old_design = None if recorded else await resolved_wall(session_data, wall)
+        size_bytes = await check_wall_quota(session_data, wall, data, old_design)
+
+        return await save_wall(session_data, wall, data, size_bytes)
+
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/sessions/<session_id>/walls/<wall>', methods=['PATCH'])
+@require_auth
+async def patch_session_wall(session_id, wall):
+    """Edit one wall of a session: {wallpaper?, upsert?: [elements], delete?: [ids]}"""
+    try:
+        body = await request.get_data()
+        check_payload_size(len(body), app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = await request.get_json(silent=True)
+        validate_wall_patch_payload(data)
+        unknown_assets = check_design_assets({wall: {'wallpaper': data.get('wallpaper'), 'elements': data.get('upsert')}}, app)
+        if unknown_assets:
+            return jsonify({'error': 'Design references unknown catalog assets', 'assets': unknown_assets}), 400
+
+
+        session_data = await find_wall(session_id, wall, *WALL_SAVE_FIELDS)
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+
+        current = await resolved_wall(session_data, wall)
+        design = apply_wall_patch(current, data)
+        validate_wall_payload(design)
+        size_bytes = await check_wall_quota(session_data, wall, design, current)
+
+        return await save_wall(session_data, wall, design, size_bytes)
+
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.websocket('/api/sessions/<session_id>/live')
+async def live_session(session_id):
+    """Live-editing channel of one session (protocol in collab.py).
+
+    Query: ``client`` (the tab's id from an earlier hello, so resent ops are
+    recognised) and ``since`` (last seq the tab has applied).
+    """
+    if not trusted_origin(websocket.headers.get('Origin'), websocket.headers.get('Host')):
+        await websocket.close(1008, 'Origin not allowed')
+        return
+    user_data = get_current_user()
+    if not user_data:
+        await websocket.close(1008, 'Authentication required')
+        return
+    if not ObjectId.is_valid(session_id):
+        await websocket.close(1008, 'Invalid session ID')
+        return
+
+    room, connection = await hub.join(session_id, user_data['user_id'], websocket.args.get('client'))
+    if room is None:
+        await websocket.close(1008, 'Session not found')
+        return
+    await websocket.accept()
+    hub.resend(room, connection, websocket.args.get('since', 0, type=int))
+
+    async def send():
+        while True:
+            message = await connection.queue.get()
+            if message is None:
+                return
+            await websocket.send(message)
+
+    sender = asyncio.ensure_future(send())
+    try:
+        while not sender.done():
+            receive = asyncio.ensure_future(websocket.receive())
+            await asyncio.wait({receive, sender}, return_when=asyncio.FIRST_COMPLETED)
+            if not receive.done():
+                receive.cancel()
+                break
+            try:
+                data = json.loads(receive.result())
+                validate_live_message(data)
+            except (ValueError, DesignValidationError) as e:
+                details = e.message if isinstance(e, DesignValidationError) else 'Invalid JSON'
+                connection.send(json.dumps({'type': 'error', 'error': details}))
+                continue
+            if data['type'] == 'since':
+                hub.resend(room, connection, data.get('seq', 0))
+            else:
+                hub.submit(room, connection, data.get('ops') or [])
+    finally:
+        sender.cancel()
+        hub.leave(room, connection)
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=int(os.getenv('ASYNC_PORT', 5001)))
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+AltarMaker Asset Pipeline
+
+Builds resized WebP (and AVIF, when Pillow supports it) variants of the
+decoration catalog and wallpapers in ``frontend/public`` at several widths,
+plus a JSON manifest with dimensions and content hashes. Run it before
+``npm run build`` so Vite copies ``public/variants`` into ``dist``.
+
+The build is incremental: a source is only reprocessed when its content hash
+changes or one of its outputs is missing. Work is spread over a process pool.
+
+Usage:
+    python asset_pipeline.py [--workers N] [--force]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+PUBLIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend', 'public')
+
+# Catalog folders under frontend/public that get variants
+SOURCE_DIRS = ('images', 'wallpapers', 'welcomeimages')
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+VARIANTS_DIR = 'variants'
+MANIFEST_NAME = 'manifest.json'
+
+BREAKPOINTS = (128, 256, 512, 1024)
+
+# Output format -> (mimetype, Pillow save options)
+FORMATS = {
+    'avif': ('image/avif', {'quality': 55}),
+    'webp': ('image/webp', {'quality': 80, 'method': 4}),
+}
+
+
+def file_hash(path):
+    """Short sha256 content hash"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def available_formats():
+    from PIL import features
+    return [fmt for fmt in FORMATS if features.check(fmt)]
+
+
+def target_widths(width):
+    """Breakpoints below the source width, plus the source width itself"""
+    return [bp for bp in BREAKPOINTS if bp < width] + [width]
+
+
+def variant_path(source, width, fmt, content_hash):
+    """``variants/images/candle1-256-<hash>.webp``; the hash makes it immutable"""
+    stem = os.path.splitext(source)[0]
+    return f"{VARIANTS_DIR}/{stem}-{width}-{content_hash[:10]}.{fmt}"
+
+
+def build_variants(job):
+    """Process-pool worker: write every variant of one source image"""
+    from PIL import Image
+
+    public_dir, source, content_hash, formats = job
+    with Image.open(os.path.join(public_dir, source)) as image:
+        image.load()
+        width, height = image.size
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+
+        variants = []
+        for target_width in target_widths(width):
+            target_height = max(1, round(height * target_width / width))
+            resized = image if target_width == width else image.resize(
+                (target_width, target_height), Image.LANCZOS
+            )
+            for fmt in formats:
+                rel_path = variant_path(source, target_width, fmt, content_hash)
+                out_path = os.path.join(public_dir, rel_path)
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                resized.save(out_path, format=fmt.upper(), **FORMATS[fmt][1])
+                variants.append({
+                    'path': rel_path,
+                    'format': fmt,
+                    'width': target_width,
+                    'height': target_height,
+                    'bytes': os.path.getsize(out_path),
+                })
+
+    return {
+        'source': source,
+        'hash': content_hash,
+        'width': width,
+        'height': height,
+        'bytes': os.path.getsize(os.path.join(public_dir, source)),
+        'variants': variants,
+    }
+
+
+def find_sources(public_dir):
+    sources = []
+    for folder in SOURCE_DIRS:
+        root = os.path.join(public_dir, folder)
+        if not os.path.isdir(root):
+            continue
+        for dirpath, _, filenames in os.walk(root):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(SOURCE_EXTENSIONS):
+                    full = os.path.join(dirpath, filename)
+                    sources.append(os.path.relpath(full, public_dir).replace(os.sep, '/'))
+    return sorted(sources)
+
+
+def load_manifest(public_dir):
+    path = os.path.join(public_dir, VARIANTS_DIR, MANIFEST_NAME)
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {'assets': {}}
+
+
+def is_current(public_dir, entry, content_hash, formats):
+    """True when a manifest entry matches the source and its files exist"""
+    if not entry or entry.get('hash') != content_hash:
+        return False
+    if {v['format'] for v in entry['variants']} != set(formats):
+        return False
+    return all(os.path.isfile(os.path.join(public_dir, v['path'])) for v in entry['variants'])
+
+
+def remove_stale(public_dir, old_entries, new_entries):
+    """Delete variant files no longer referenced by the manifest"""
+    keep = {v['path'] for entry in new_entries.values() for v in entry['variants']}
+    removed = 0
+    for entry in old_entries.values():
+        for variant in entry.get('variants', []):
+            if variant['path'] not in keep:
+                try:
+                    os.remove(os.path.join(public_dir, variant['path']))
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
+
+
+def run(public_dir=PUBLIC_DIR, workers=None, force=False):
+    """Build missing or outdated variants and rewrite the manifest"""
+    formats = available_formats()
+    old_entries = load_manifest(public_dir).get('assets', {})
+
+    entries, jobs = {}, []
+    for source in find_sources(public_dir):
+        content_hash = file_hash(os.path.join(public_dir, source))
+        entry = old_entries.get(source)
+        if not force and is_current(public_dir, entry, content_hash, formats):
+            entries[source] = entry
+        else:
+            jobs.append((public_dir, source, content_hash, formats))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for entry in pool.map(build_variants, jobs):
+                entries[entry['source']] = entry
+
+    removed = remove_stale(public_dir, old_entries, entries)
+
+    manifest = {
+        'formats': formats,
+        'breakpoints': list(BREAKPOINTS),
+        'assets': dict(sorted(entries.items())),
+    }
+    manifest_path = os.path.join(public_dir, VARIANTS_DIR, MANIFEST_NAME)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+
+    return {'processed': len(jobs), 'unchanged': len(entries) - len(jobs), 'removed': removed}
+
+
+class VariantManifest:
+    """Read side of the manifest for the web server, reloaded when it changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._assets = {}
+
+    def assets(self, static_folder):
+        path = os.path.join(static_folder, VARIANTS_DIR, MANIFEST_NAME)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return {}
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        if key != self._key:
+            with self._lock:
+                if key != self._key:
+                    try:
+                        with open(path) as fh:
+                            self._assets = json.load(fh).get('assets', {})
+                    except (OSError, ValueError):
+                        self._assets = {}
+                    self._key = key
+        return self._assets
+
+    def select(self, static_folder, source, accepted_formats, width=None):
+        """Best variant for a client, or None to serve the original.
+
+        Prefers the formats in ``accepted_formats`` order, then the smallest
+        variant at least ``width`` wide (the full-size one without a width).
+        """
+        entry = self.assets(static_folder).get(source)
+        if not entry:
+            return None
+        for fmt in accepted_formats:
+            candidates = sorted(
+                (v for v in entry['variants'] if v['format'] == fmt), key=lambda v: v['width']
+            )
+            if not candidates:
+                continue
+            if width:
+                for variant in candidates:
+                    if variant['width'] >= width:
+                        return variant
+            return candidates[-1]
+        return None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--public-dir', default=PUBLIC_DIR)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help='rebuild every variant')
+    args = parser.parse_args()
+
+    result = run(args.public_dir, workers=args.workers, force=args.force)
+    logger.info(
+        f"✅ {result['processed']} processed, {result['unchanged']} unchanged, "
+        f"{result['removed']} stale files removed"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
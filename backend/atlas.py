@@ -0,0 +1,313 @@
+"""
+Texture atlas packing
+
+Packs a set of images into power-of-two sheets with a MaxRects bin packer
+(best short side fit) and records where each image landed in a JSON
+manifest. Atlases are cached on disk under a key derived from the hashes of
+the images they hold, so the same set of assets is only ever packed once.
+
+Used by the 3D scene export (one texture per sheet instead of one per
+element), the wall renderer (element layers already rasterised at a scale)
+and the catalog sprite sheets.
+"""
+import io
+import json
+import math
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+ATLAS_VERSION = 1
+MAX_ATLAS_SIZE = 4096
+PADDING = 2  # Transparent gutter so linear filtering does not bleed
+
+
+def next_power_of_two(value):
+    return 1 << max(0, math.ceil(math.log2(max(value, 1))))
+
+
+class MaxRectsBin:
+    """One sheet's free space as a list of maximal free rectangles"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.free = [(0, 0, width, height)]
+        self.used_area = 0
+
+    def insert(self, width, height):
+        """Place a box with the best short side fit; (x, y) or None"""
+        best, best_score = None, None
+        for fx, fy, fw, fh in self.free:
+            if width <= fw and height <= fh:
+                score = (min(fw - width, fh - height), max(fw - width, fh - height))
+                if best_score is None or score < best_score:
+                    best, best_score = (fx, fy), score
+        if best is None:
+            return None
+        self._split(best[0], best[1], width, height)
+        self.used_area += width * height
+        return best
+
+    def _split(self, x, y, width, height):
+        right, bottom = x + width, y + height
+        kept, pieces = [], []
+        for fx, fy, fw, fh in self.free:
+            if x >= fx + fw or right <= fx or y >= fy + fh or bottom <= fy:
+                kept.append((fx, fy, fw, fh))
+                continue
+            # Keep the parts of the free rectangle around the placed box
+            if x > fx:
+                pieces.append((fx, fy, x - fx, fh))
+            if right < fx + fw:
+                pieces.append((right, fy, fx + fw - right, fh))
+            if y > fy:
+                pieces.append((fx, fy, fw, y - fy))
+            if bottom < fy + fh:
+                pieces.append((fx, bottom, fw, fy + fh - bottom))
+        self.free = kept + _prune(pieces, kept)
+
+
+def _contains(outer, inner):
+    ox, oy, ow, oh = outer
+    x, y, w, h = inner
+    return x >= ox and y >= oy and x + w <= ox + ow and y + h <= oy + oh
+
+
+def _prune(pieces, kept):
+    """New free rectangles not contained in another one.
+
+    ``kept`` rectangles were already maximal and each piece lies inside a
+    rectangle that was split, so only the pieces need checking.
+    """
+    pieces = sorted(set(pieces), key=lambda r: r[2] * r[3], reverse=True)
+    result = []
+    for piece in pieces:
+        if not any(_contains(other, piece) for other in result) and not any(_contains(other, piece) for other in kept):
+            result.append(piece)
+    return result
+
+
+def maxrects_pack(sizes, max_size=MAX_ATLAS_SIZE, padding=PADDING):
+    """Pack (width, height) boxes into as few sheets as needed.
+
+    Each sheet starts at the power-of-two size its remaining boxes' area
+    suggests and doubles until they fit or it reaches ``max_size``; what
+    still does not fit goes to the next sheet. Boxes must already be at most
+    ``max_size - padding`` on each side.
+
+    Returns ([(sheet width, sheet height)], [(sheet, x, y) per box]).
+    """
+    order = sorted(range(len(sizes)), key=lambda i: (-max(sizes[i]), -min(sizes[i])))
+    placements = [None] * len(sizes)
+    sheets = []
+    while order:
+        area = sum((sizes[i][0] + padding) * (sizes[i][1] + padding) for i in order)
+        widest = max(sizes[i][0] for i in order) + padding
+        tallest = max(sizes[i][1] for i in order) + padding
+        width = min(max_size, next_power_of_two(max(widest, math.sqrt(area))))
+        height = min(max_size, next_power_of_two(max(tallest, area / width)))
+        while True:
+            sheet = MaxRectsBin(width, height)
+            placed, left = [], []
+            for i in order:
+                position = sheet.insert(sizes[i][0] + padding, sizes[i][1] + padding)
+                (placed if position else left).append((i, position))
+            if not left or (width >= max_size and height >= max_size):
+                break
+            # Grow the shorter side first to stay close to square
+            if width <= height and width < max_size:
+                width *= 2
+            else:
+                height *= 2
+        for i, (x, y) in placed:
+            placements[i] = (len(sheets), x, y)
+        sheets.append((width, height))
+        order = [i for i, _ in left]
+    return sheets, placements
+
+
+def shelf_pack(sizes, max_size=MAX_ATLAS_SIZE, padding=PADDING):
+    """Baseline shelf packer (rows of boxes, tallest first) for comparison.
+
+    Same return shape as ``maxrects_pack``.
+    """
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    placements = [None] * len(sizes)
+    sheets = []
+    while order:
+        area = sum((sizes[i][0] + padding) * (sizes[i][1] + padding) for i in order)
+        widest = max(sizes[i][0] for i in order) + padding
+        width = min(max_size, next_power_of_two(max(widest, math.sqrt(area))))
+        x = y = shelf_height = 0
+        left = []
+        for i in order:
+            w, h = sizes[i][0] + padding, sizes[i][1] + padding
+            if x + w > width:
+                x, y, shelf_height = 0, y + shelf_height, 0
+            if y + h > max_size:
+                left.append(i)
+                continue
+            placements[i] = (len(sheets), x, y)
+            x += w
+            shelf_height = max(shelf_height, h)
+        skipped = set(left)
+        used = max(placements[i][2] + sizes[i][1] + padding for i in order if i not in skipped)
+        sheets.append((width, next_power_of_two(used)))
+        order = left
+    return sheets, placements
+
+
+def fill_ratio(sheets, sizes):
+    """Share of the sheets' pixels covered by images"""
+    total = sum(w * h for w, h in sheets)
+    return sum(w * h for w, h in sizes) / total if total else 0.0
+
+
+def atlas_key(image_keys, *params):
+    """Cache key for an atlas of the given images (order-insensitive)"""
+    import hashlib
+
+    payload = json.dumps([ATLAS_VERSION, sorted(set(image_keys)), params], separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Atlas:
+    """Packed sheets plus their manifest"""
+
+    def __init__(self, manifest, sheets=None, root=None):
+        self.manifest = manifest
+        self.root = root
+        self._sheets = sheets
+
+    @property
+    def key(self):
+        return self.manifest['key']
+
+    def sheet_path(self, index):
+        return os.path.join(self.root, self.manifest['sheets'][index]['file'])
+
+    def sheet_png(self, index):
+        """Encoded sheet, straight from the cache when it is on disk"""
+        if self.root is None:
+            out = io.BytesIO()
+            self.sheets[index].save(out, format='PNG')
+            return out.getvalue()
+        with open(self.sheet_path(index), 'rb') as fh:
+            return fh.read()
+
+    @property
+    def sheets(self):
+        """Sheet images, loaded from the cache on first use"""
+        from PIL import Image
+
+        if self._sheets is None:
+            self._sheets = []
+            for index in range(len(self.manifest['sheets'])):
+                with Image.open(self.sheet_path(index)) as sheet:
+                    self._sheets.append(sheet.convert('RGBA'))
+        return self._sheets
+
+    def rect(self, image_key):
+        return self.manifest['images'].get(image_key)
+
+    def image(self, image_key):
+        """Crop one packed image back out, at its packed size"""
+        rect = self.rect(image_key)
+        if rect is None:
+            return None
+        x, y = rect['x'], rect['y']
+        return self.sheets[rect['sheet']].crop((x, y, x + rect['width'], y + rect['height']))
+
+
+def build_atlas(images, key=None, max_size=MAX_ATLAS_SIZE, packer=maxrects_pack):
+    """Pack ``{image key: RGBA image}`` into an Atlas.
+
+    Images too large for a sheet are scaled down to fit; the manifest keeps
+    their original size as ``source_width``/``source_height``.
+    """
+    from PIL import Image
+
+    keys = list(images)
+    limit = max_size - PADDING
+    sizes = []
+    for image_key in keys:
+        width, height = images[image_key].size
+        factor = min(1.0, limit / width, limit / height)
+        sizes.append((max(1, int(width * factor)), max(1, int(height * factor))))
+
+    sheet_sizes, placements = packer(sizes, max_size)
+    sheets = [Image.new('RGBA', size, (0, 0, 0, 0)) for size in sheet_sizes]
+    entries = {}
+    for image_key, size, (sheet, x, y) in zip(keys, sizes, placements):
+        image = images[image_key]
+        if image.size != size:
+            image = image.resize(size, Image.LANCZOS)
+        sheets[sheet].paste(image, (x, y))
+        entries[image_key] = {
+            'sheet': sheet, 'x': x, 'y': y, 'width': size[0], 'height': size[1],
+            'source_width': images[image_key].width, 'source_height': images[image_key].height,
+        }
+
+    key = key or atlas_key(keys, max_size)
+    manifest = {
+        'key': key,
+        'version': ATLAS_VERSION,
+        'sheets': [
+            {
+                'file': f'{key}-{index}.png', 'width': w, 'height': h,
+                'fill': round(fill_ratio([(w, h)], [s for s, p in zip(sizes, placements) if p[0] == index]), 4),
+            }
+            for index, (w, h) in enumerate(sheet_sizes)
+        ],
+        'images': entries,
+    }
+    return Atlas(manifest, sheets)
+
+
+class AtlasCache:
+    """Atlases on disk: ``<key>.json`` manifests next to ``<key>-<n>.png``"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def manifest_path(self, key):
+        return os.path.join(self.root, f'{key}.json')
+
+    def get(self, key):
+        if not self.root:
+            return None
+        try:
+            with open(self.manifest_path(key)) as fh:
+                return Atlas(json.load(fh), root=self.root)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, atlas, compress_level=6):
+        if not self.root:
+            return atlas
+        os.makedirs(self.root, exist_ok=True)
+        for index, sheet in enumerate(atlas.sheets):
+            path = os.path.join(self.root, atlas.manifest['sheets'][index]['file'])
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            sheet.save(tmp_path, format='PNG', compress_level=compress_level)
+            os.replace(tmp_path, path)
+        # Manifest last, so a visible manifest always has its sheets
+        path = self.manifest_path(atlas.key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(atlas.manifest, fh, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        atlas.root = self.root
+        return atlas
+
+    def get_or_build(self, key, load_images, max_size=MAX_ATLAS_SIZE):
+        """Cached atlas for ``key``, packing ``load_images()`` on a miss"""
+        atlas = self.get(key)
+        if atlas is None:
+            atlas = self.put(build_atlas(load_images(), key, max_size))
+            logger.info(f"Packed atlas {key[:12]}: {len(atlas.manifest['images'])} images on "
+                        f"{len(atlas.manifest['sheets'])} sheet(s)")
+        return atlas
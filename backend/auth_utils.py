@@ -0,0 +1,50 @@
+"""
+Session-based authentication helpers shared by the API blueprints.
+"""
+from functools import wraps
+from flask import request, jsonify, session
+
+
+def create_user_session(user_id, username, role):
+    """Create user session data"""
+    session['user_id'] = str(user_id)
+    session['username'] = username
+    session['role'] = role
+    session['logged_in'] = True
+    # Lifetime comes from PERMANENT_SESSION_LIFETIME in config
+    session.permanent = True
+
+def get_current_user():
+    """Get current user from session"""
+    if session.get('logged_in'):
+        return {
+            'user_id': session.get('user_id'),
+            'username': session.get('username'),
+            'role': session.get('role')
+        }
+    return None
+
+def require_auth(f):
+    """Decorator to require authentication"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user_data = get_current_user()
+        if not user_data:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        request.user_data = user_data
+        return f(*args, **kwargs)
+    return decorated_function
+
+def require_admin(f):
+    """Decorator to require admin role"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not hasattr(request, 'user_data'):
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        if request.user_data.get('role') != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        return f(*args, **kwargs)
+    return decorated_function
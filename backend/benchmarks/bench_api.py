@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+API benchmark scenarios with a baseline report to diff across releases
+
+Seeds a dataset (``dataset.py``) and times the main API paths through the
+Flask test client:
+
+  register         POST /api/auth/register (new user, password hash, email)
+  login            POST /api/auth/login
+  load_session     GET  /api/sessions/<id>
+  list_sessions    GET  /api/sessions
+  admin_stats      GET  /api/admin/stats
+  list_feedback    GET  /api/feedback
+  save_session     POST /api/sessions with a generated design
+  update_session   PUT  /api/sessions/<id> (write-behind off: every save writes)
+  submit_feedback  POST /api/feedback
+
+Reads run before writes, so they always see the seeded data.
+
+MongoDB is ``mongomock`` by default, which is enough to compare the Python
+side of two releases. ``--mongo-uri`` runs against a local ``mongod``
+instead, in a scratch database (``--db``) that is dropped afterwards.
+
+Each scenario runs ``--iterations`` times, or for at most ``--seconds``.
+The report has p50/p95/p99, throughput and body sizes per scenario, plus
+the commit, Python version, backend and dataset. ``--save`` writes it as
+JSON. ``--compare`` prints the change against an earlier report and exits
+1 when a scenario's p50 got slower by more than ``--threshold``.
+``--locust-csv`` turns the ``*_stats.csv`` of a ``locustfile.py`` run into
+the same report format, so load tests can be saved and compared too.
+
+Usage:
+    python benchmarks/bench_api.py --save benchmarks/baselines/mongomock.json
+    python benchmarks/bench_api.py --compare benchmarks/baselines/mongomock.json
+    python benchmarks/bench_api.py --mongo-uri mongodb://localhost:27017 --scenarios login,load_session
+    python benchmarks/bench_api.py --locust-csv run_stats.csv --save load.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from dataset import ADMIN_USERNAME, BENCH_PASSWORD, Dataset, seed, username  # noqa: E402
+
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ('register', 'login', 'load_session', 'list_sessions', 'admin_stats', 'list_feedback',
+             'save_session', 'update_session', 'submit_feedback')
+
+REPORT_VERSION = 1
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def bench_app(mongo_uri=None, dbname='altarmaker_bench'):
+    """A testing app with background work off and MongoDB at ``mongo_uri`` (mongomock if None)"""
+    # Read by config.py at import
+    for key, value in (('MAINTENANCE_INTERVAL_SECONDS', '0'), ('DELETION_SWEEP_SECONDS', '0'),
+                       ('WRITE_BEHIND_SECONDS', '0'), ('SLOW_QUERY_ENABLED', 'false'),
+                       ('TRACING_ENABLED', 'false'), ('LOG_LEVEL', 'ERROR')):
+        os.environ.setdefault(key, value)
+
+    from app import create_app
+
+    app = create_app('testing')
+    # Flask-Mail suppresses sends under TESTING; these only get past the config check
+    app.config.update(MAIL_USERNAME='bench', MAIL_PASSWORD='bench', MAIL_DEFAULT_SENDER='bench@example.com')
+    if mongo_uri:
+        # Before the first query, so the lazy client connects here instead
+        mongo = app.extensions['mongo']
+        mongo.uri, mongo.dbname, mongo.client_factory = mongo_uri, dbname, 'pymongo.MongoClient'
+
+    # create_app routes the root logger through structured logging; keep the table plain
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return app
+
+
+def backend_name(app):
+    mongo = app.extensions['mongo']
+    if mongo.client_factory.startswith('mongomock'):
+        import mongomock
+        return f'mongomock {mongomock.__version__}'
+    return f"mongod {mongo.client.server_info()['version']}"
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Bench:
+    """Seeded app, logged-in clients and pre-encoded request bodies"""
+
+    def __init__(self, app, summary, seed_value, payloads=20):
+        self.app = app
+        self.summary = summary
+        self.data = Dataset(seed_value + 1)
+        self.run_id = f'{int(time.time()) % 100000}'
+        self.anon = app.test_client()
+        self.user = self.login(app.test_client(), username(0))
+        self.admin = self.login(app.test_client(), ADMIN_USERNAME, role='admin')
+        self.session_ids = summary['session_ids'][username(0)]
+        # Encoded up front, so generating and serializing designs is not timed
+        self.designs = [json.dumps(self.data.session_payload()) for _ in range(payloads)]
+        self.feedback = [json.dumps(self.data.feedback()) for _ in range(payloads)]
+
+    @staticmethod
+    def login(client, name, role='user'):
+        response = client.post('/api/auth/login', json={'username': name, 'password': BENCH_PASSWORD, 'role': role})
+        if response.status_code != 200:
+            raise RuntimeError(f"Could not log in as {name}: {response.status_code} {response.get_data(as_text=True)}")
+        return client
+
+    def request(self, scenario, i):
+        """(client, method, path, body) of iteration ``i``"""
+        users = self.summary['users'] - 1
+        if scenario == 'register':
+            return self.anon, 'POST', '/api/auth/register', json.dumps(
+                self.data.registration(f'bench-new-{self.run_id}-{i}'))
+        if scenario == 'login':
+            return self.anon, 'POST', '/api/auth/login', json.dumps(
+                {'username': username(i % users), 'password': BENCH_PASSWORD})
+        if scenario == 'save_session':
+            return self.user, 'POST', '/api/sessions', self.designs[i % len(self.designs)]
+        if scenario == 'update_session':
+            session_id = self.session_ids[i % len(self.session_ids)]
+            return self.user, 'PUT', f'/api/sessions/{session_id}', self.designs[i % len(self.designs)]
+        if scenario == 'load_session':
+            return self.user, 'GET', f'/api/sessions/{self.session_ids[i % len(self.session_ids)]}', None
+        if scenario == 'list_sessions':
+            return self.user, 'GET', '/api/sessions', None
+        if scenario == 'admin_stats':
+            return self.admin, 'GET', '/api/admin/stats', None
+        if scenario == 'submit_feedback':
+            return self.anon, 'POST', '/api/feedback', self.feedback[i % len(self.feedback)]
+        if scenario == 'list_feedback':
+            return self.anon, 'GET', '/api/feedback', None
+        raise ValueError(f'Unknown scenario {scenario}')
+
+    def run(self, scenario, iterations, seconds, warmup=3):
+        latencies, errors, request_bytes, response_bytes = [], 0, 0, 0
+        for i in range(warmup):
+            client, method, path, body = self.request(scenario, -1 - i)
+            client.open(path, method=method, data=body, content_type='application/json')
+        deadline = time.perf_counter() + seconds
+        for i in range(iterations):
+            client, method, path, body = self.request(scenario, i)
+            started = time.perf_counter()
+            response = client.open(path, method=method, data=body, content_type='application/json')
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 300:
+                errors += 1
+                if errors == 1:
+                    logger.warning(f"{scenario}: {response.status_code} {response.get_data(as_text=True)[:200]}")
+            request_bytes += len(body or '')
+            response_bytes += len(response.get_data())
+            if time.perf_counter() > deadline:
+                break
+        return stats(latencies, errors, request_bytes, response_bytes)
+
+
+def stats(latencies, errors, request_bytes, response_bytes):
+    count = len(latencies)
+    return {
+        'count': count,
+        'errors': errors,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': round(_percentile(latencies, 0.5) * 1000, 3),
+        'p95_ms': round(_percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3),
+        'ops_per_s': round(count / sum(latencies), 1),
+        'request_kb': round(request_bytes / count / 1024, 1),
+        'response_kb': round(response_bytes / count / 1024, 1),
+    }
+
+
+def run_benchmarks(args):
+    app = bench_app(args.mongo_uri, args.db)
+    with app.app_context():
+        from extensions import get_db
+
+        db = get_db()
+        if args.mongo_uri:
+            if args.db == 'altarmaker':
+                raise SystemExit("Refusing to benchmark against the application database; use a separate --db")
+            db.client.drop_database(args.db)
+        summary = seed(db, args.users, args.sessions_per_user, args.feedback, args.seed)
+        backend = backend_name(app)
+    logger.info(f"Seeded {summary['users']} users, {summary['sessions']} sessions "
+                f"({summary['session_mb']} MB), {summary['feedback']} feedback on {backend} "
+                f"in {summary['seconds']}s")
+
+    bench = Bench(app, summary, args.seed)
+    results = {}
+    try:
+        for scenario in [name for name in SCENARIOS if name in args.scenarios]:
+            results[scenario] = bench.run(scenario, args.iterations, args.seconds)
+            row = results[scenario]
+            logger.info(f"{scenario:<16}{row['count']:>6}{row['errors']:>7}{row['p50_ms']:>10.2f}"
+                        f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['ops_per_s']:>10.1f}")
+    finally:
+        if args.mongo_uri and not args.keep:
+            with app.app_context():
+                get_db().client.drop_database(args.db)
+
+    return {
+        'version': REPORT_VERSION,
+        'kind': 'bench_api',
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': backend,
+        'dataset': {key: summary[key] for key in ('users', 'sessions', 'session_mb', 'feedback', 'seed')},
+        'iterations': args.iterations,
+        'scenarios': results,
+    }
+
+
+def locust_report(path):
+    """A report from locust's ``--csv`` ``*_stats.csv``"""
+    results = {}
+    with open(path, newline='') as fh:
+        for row in csv.DictReader(fh):
+            if row['Name'] == 'Aggregated':
+                continue
+            count = int(row['Request Count'])
+            results[f"{row['Type']} {row['Name']}"] = {
+                'count': count,
+                'errors': int(row['Failure Count']),
+                'mean_ms': round(float(row['Average Response Time']), 3),
+                'p50_ms': float(row['50%']),
+                'p95_ms': float(row['95%']),
+                'p99_ms': float(row['99%']),
+                'max_ms': float(row['Max Response Time']),
+                'ops_per_s': round(float(row['Requests/s']), 1),
+                'response_kb': round(float(row['Average Content Size']) / 1024, 1),
+            }
+    return {
+        'version': REPORT_VERSION,
+        'kind': 'locust',
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'source': os.path.basename(path),
+        'scenarios': results,
+    }
+
+
+def compare(baseline, report, threshold):
+    """Log the change of each scenario; returns the names that regressed"""
+    regressed = []
+    logger.info(f"baseline {baseline.get('commit')} ({baseline.get('created_at')}, "
+                f"{baseline.get('backend') or baseline.get('kind')}) "
+                f"vs {report.get('commit')} ({report.get('backend') or report.get('kind')})")
+    if baseline.get('dataset') != report.get('dataset'):
+        logger.warning(f"Datasets differ: {baseline.get('dataset')} vs {report.get('dataset')}")
+    logger.info(f"{'scenario':<28}{'p50 was':>10}{'p50 now':>10}{'change':>9}{'p95 was':>10}{'p95 now':>10}"
+                f"{'change':>9}")
+    for name in sorted(set(baseline['scenarios']) | set(report['scenarios'])):
+        old, new = baseline['scenarios'].get(name), report['scenarios'].get(name)
+        if old is None or new is None:
+            logger.info(f"{name:<28}{'only in ' + ('report' if old is None else 'baseline'):>40}")
+            continue
+        p50 = (new['p50_ms'] - old['p50_ms']) / old['p50_ms'] if old['p50_ms'] else 0
+        p95 = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0
+        flag = ''
+        if p50 > threshold:
+            flag = '  slower'
+            regressed.append(name)
+        elif p50 < -threshold:
+            flag = '  faster'
+        if new.get('errors') and not old.get('errors'):
+            flag += '  errors'
+        logger.info(f"{name:<28}{old['p50_ms']:>10.2f}{new['p50_ms']:>10.2f}{p50:>+9.0%}"
+                    f"{old['p95_ms']:>10.2f}{new['p95_ms']:>10.2f}{p95:>+9.0%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), type=lambda value: value.split(','))
+    parser.add_argument('--iterations', type=int, default=100, help='timed requests per scenario')
+    parser.add_argument('--seconds', type=float, default=10.0, help='longest a scenario runs')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--sessions-per-user', type=int, default=5)
+    parser.add_argument('--feedback', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--mongo-uri', default=os.getenv('BENCH_MONGO_URI'),
+                        help='local mongod to use instead of mongomock')
+    parser.add_argument('--db', default='altarmaker_bench', help='scratch database on --mongo-uri')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch database')
+    parser.add_argument('--locust-csv', help="report a locust run's *_stats.csv instead of running scenarios")
+    parser.add_argument('--save', help='write the report here as JSON')
+    parser.add_argument('--compare', help='an earlier report to compare with')
+    parser.add_argument('--threshold', type=float, default=0.15, help='p50 change that counts as a regression')
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown and not args.locust_csv:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    if args.users < 1 or args.sessions_per_user < 1:
+        parser.error('the session scenarios need --users and --sessions-per-user of at least 1')
+
+    if args.locust_csv:
+        report = locust_report(args.locust_csv)
+    else:
+        logger.info(f"{'scenario':<16}{'n':>6}{'errors':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+        report = run_benchmarks(args)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as fh:
+            # Sorted and indented, so two reports diff line by line
+            json.dump(report, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        logger.info(f"Report written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        regressed = compare(baseline, report, args.threshold)
+        if regressed:
+            logger.info(f"{len(regressed)} scenarios slower than the baseline by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Texture atlas packing time and fill ratio
+
+Packs random box sizes (sticker- and frame-like) and, when the public dir
+is available, the real catalog thumbnails with the MaxRects packer used by
+``atlas.build_atlas`` and with the simple shelf packer, and reports time,
+sheet count and how much of the power-of-two sheets (``fill``) and of the
+area the boxes actually span (``tight``) is covered.
+
+Usage:
+    python benchmarks/bench_atlas.py --boxes 50,200,1000
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from atlas import MAX_ATLAS_SIZE, PADDING, fill_ratio, maxrects_pack, shelf_pack  # noqa: E402
+from catalog import ATLAS_THUMBNAIL_SIZE, Catalog  # noqa: E402
+
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PACKERS = (('maxrects', maxrects_pack), ('shelf', shelf_pack))
+DEFAULT_PUBLIC_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'frontend', 'public')
+
+
+def random_sizes(count):
+    return [(random.randint(16, 320), random.randint(16, 320)) for _ in range(count)]
+
+
+def catalog_sizes(public_dir, size=ATLAS_THUMBNAIL_SIZE):
+    """Thumbnail sizes of the catalog images, as the catalog atlas packs them"""
+    sizes = []
+    for entry in Catalog(public_dir).entries():
+        if entry['width'] and entry['height']:
+            factor = min(1.0, size / entry['width'], size / entry['height'])
+            sizes.append((max(1, round(entry['width'] * factor)), max(1, round(entry['height'] * factor))))
+    return sizes
+
+
+def used_extent(sizes, sheets, placements):
+    """Per sheet, the bounding box actually covered by boxes"""
+    extent = [(0, 0)] * len(sheets)
+    for (w, h), (sheet, x, y) in zip(sizes, placements):
+        extent[sheet] = (max(extent[sheet][0], x + w + PADDING), max(extent[sheet][1], y + h + PADDING))
+    return extent
+
+
+def check(sizes, sheets, placements):
+    """Every box inside its sheet and no two boxes overlapping"""
+    boxes = {}
+    for (w, h), (sheet, x, y) in zip(sizes, placements):
+        assert x + w + PADDING <= sheets[sheet][0] and y + h + PADDING <= sheets[sheet][1]
+        boxes.setdefault(sheet, []).append((x, y, x + w + PADDING, y + h + PADDING))
+    for rects in boxes.values():
+        rects.sort()
+        for i, a in enumerate(rects):
+            for b in rects[i + 1:]:
+                if b[0] >= a[2]:
+                    break
+                assert a[3] <= b[1] or b[3] <= a[1], (a, b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--boxes', default='50,200,1000',
+                        type=lambda value: [int(v) for v in value.split(',')])
+    parser.add_argument('--public-dir', default=DEFAULT_PUBLIC_DIR)
+    parser.add_argument('--max-size', type=int, default=MAX_ATLAS_SIZE)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(7)
+    cases = [(f'random {count}', random_sizes(count)) for count in args.boxes]
+    if os.path.isdir(args.public_dir):
+        cases.append(('catalog', catalog_sizes(args.public_dir)))
+
+    logger.info(f"{'case':>14}{'packer':>10}{'ms':>10}{'sheets':>8}{'fill':>8}{'tight':>8}  sheet sizes")
+    for name, sizes in cases:
+        for packer_name, packer in PACKERS:
+            sheets, placements = packer(sizes, args.max_size)
+            check(sizes, sheets, placements)
+            ms = min(timeit.repeat(lambda: packer(sizes, args.max_size), number=1, repeat=args.repeat)) * 1000
+            logger.info(f"{name:>14}{packer_name:>10}{ms:>10.1f}{len(sheets):>8}{fill_ratio(sheets, sizes):>8.1%}"
+                        f"{fill_ratio(used_extent(sizes, sheets, placements), sizes):>8.1%}  "
+                        + ', '.join(f'{w}x{h}' for w, h in sheets))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Storage size and speed of the columnar element codec
+
+Generates realistic sessions (four walls of stickers and frames, some with
+embedded cropped-image data URLs) and compares the BSON size and
+encode/decode time of plain element arrays against ``element_codec``.
+
+Usage:
+    python benchmarks/bench_codec.py --elements 10,50,200
+"""
+import argparse
+import base64
+import os
+import random
+import sys
+import timeit
+import uuid
+
+import bson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from documents import WALL_NAMES  # noqa: E402
+from element_codec import encode_wall_designs, decode_wall_designs  # noqa: E402
+
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STICKERS = [f'/images/{name}{i}.png' for name, count in
+            (('garland', 11), ('flower', 8), ('candle', 4), ('walldecor', 16)) for i in range(1, count + 1)]
+
+# A small cropped photo, as the frame cropper produces
+CROPPED_IMAGE = 'data:image/png;base64,' + base64.b64encode(os.urandom(6 * 1024)).decode()
+
+
+def make_element():
+    if random.random() < 0.8:
+        return {
+            'id': str(uuid.uuid4()), 'type': 'sticker', 'content': random.choice(STICKERS),
+            'x': round(random.uniform(0, 900), 2), 'y': round(random.uniform(0, 600), 2),
+            'width': random.choice((100, 150, 200)), 'height': random.choice((100, 150, 200)),
+        }
+    return {
+        'id': str(uuid.uuid4()), 'type': 'frame', 'frameType': random.choice(('square', 'circle', 'rounded')),
+        'content': CROPPED_IMAGE if random.random() < 0.5 else None,
+        'x': random.uniform(0, 900), 'y': random.uniform(0, 600), 'width': 200, 'height': 200,
+        'borderColor': '#%06X' % random.randint(0, 0xFFFFFF),
+    }
+
+
+def make_wall_designs(count):
+    return {
+        wall: {'elements': [make_element() for _ in range(count)], 'wallpaper': '/wallpapers/design2.png'}
+        for wall in WALL_NAMES
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--elements', default='5,20,50,200',
+                        type=lambda value: [int(v) for v in value.split(',')])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(7)
+    logger.info(f"{'elements/wall':>14}{'plain KB':>10}{'packed KB':>11}{'ratio':>8}"
+                f"{'encode ms':>11}{'decode ms':>11}")
+    for count in args.elements:
+        designs = make_wall_designs(count)
+        plain = bson.encode({'wall_designs': designs})
+        packed_designs = encode_wall_designs(designs)
+        packed = bson.encode({'wall_designs': packed_designs})
+
+        assert decode_wall_designs(bson.decode(packed)['wall_designs']) == designs
+
+        encode = min(timeit.repeat(lambda: bson.encode({'wall_designs': encode_wall_designs(designs)}),
+                                   number=1, repeat=args.repeat))
+        decode = min(timeit.repeat(lambda: decode_wall_designs(bson.decode(packed)['wall_designs']),
+                                   number=1, repeat=args.repeat))
+        logger.info(f"{count:>14}{len(plain) / 1024:>10.1f}{len(packed) / 1024:>11.1f}"
+                    f"{len(plain) / len(packed):>7.2f}x{encode * 1000:>11.3f}{decode * 1000:>11.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
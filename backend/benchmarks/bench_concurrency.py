@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark: sync (gunicorn/Flask) vs async (hypercorn/Quart) API
+
+Starts each server as a subprocess, holds an increasing number of concurrent
+keep-alive clients against one endpoint and reports throughput, latency and
+the resident memory of the server process tree. Comparing the two rows at the
+same RSS shows how many concurrent clients each stack can carry per MB.
+
+Usage:
+    python benchmarks/bench_concurrency.py --path /api/health --levels 50,200,1000
+
+Both servers need MONGO_URI and SECRET_KEY in the environment (or .env).
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    'sync': ['gunicorn', '-w', '2', '--threads', '8', '-b', '127.0.0.1:{port}', 'app:app'],
+    'async': ['hypercorn', '-w', '1', '-b', '127.0.0.1:{port}', 'asgi:app'],
+}
+
+
+def rss_mb(pid):
+    """Resident memory of a process and its children, in MB"""
+    pids = [pid]
+    try:
+        out = subprocess.run(['pgrep', '-P', str(pid)], capture_output=True, text=True).stdout
+        pids += [int(p) for p in out.split()]
+    except FileNotFoundError:
+        pass
+
+    total_kb = 0
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/status') as fh:
+                for line in fh:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+async def client(host, port, path, cookie, deadline, latencies, errors):
+    """One keep-alive client issuing requests until the deadline"""
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        errors.append('connect')
+        return
+
+    headers = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n"
+    if cookie:
+        headers += f"Cookie: session={cookie}\r\n"
+    request_bytes = (headers + "\r\n").encode()
+
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(request_bytes)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':', 1)[1])
+            await reader.readexactly(length)
+
+            if not status_line.startswith(b'HTTP/1.1 2'):
+                errors.append(status_line.strip().decode(errors='replace'))
+            latencies.append(time.perf_counter() - start)
+    except (OSError, asyncio.IncompleteReadError):
+        errors.append('disconnect')
+    finally:
+        writer.close()
+
+
+async def run_level(url, concurrency, duration, cookie):
+    parts = urlsplit(url)
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        client(parts.hostname, parts.port, parts.path or '/', cookie, deadline, latencies, errors)
+        for _ in range(concurrency)
+    ))
+    return latencies, errors
+
+
+def wait_for_server(url, timeout=20):
+    parts = urlsplit(url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((parts.hostname, parts.port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def bench_target(name, port, args):
+    cmd = [part.format(port=port) for part in TARGETS[name]]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}{args.path}"
+    rows = []
+    try:
+        if not wait_for_server(url):
+            logger.info(f"❌ {name} server did not start: {' '.join(cmd)}")
+            return rows
+
+        for level in args.levels:
+            latencies, errors = asyncio.run(run_level(url, level, args.duration, args.cookie))
+            memory = rss_mb(proc.pid)
+            ok = len(latencies)
+            rows.append({
+                'target': name,
+                'concurrency': level,
+                'rps': ok / args.duration,
+                'p50_ms': statistics.median(latencies) * 1000 if latencies else 0,
+                'p99_ms': (sorted(latencies)[int(ok * 0.99) - 1] * 1000) if ok >= 100 else 0,
+                'errors': len(errors),
+                'rss_mb': memory,
+            })
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=10)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', default='/api/health')
+    parser.add_argument('--levels', default='50,200,1000',
+                        type=lambda value: [int(v) for v in value.split(',')])
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--cookie', default=os.getenv('BENCH_SESSION_COOKIE'),
+                        help='session cookie value for authenticated routes')
+    parser.add_argument('--targets', default='sync,async')
+    args = parser.parse_args()
+
+    rows = []
+    for offset, name in enumerate(args.targets.split(',')):
+        rows += bench_target(name, 5100 + offset, args)
+
+    logger.info(f"{'target':<8}{'clients':>9}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}"
+                f"{'errors':>8}{'RSS MB':>9}{'req/s/MB':>10}")
+    for row in rows:
+        per_mb = row['rps'] / row['rss_mb'] if row['rss_mb'] else 0
+        logger.info(f"{row['target']:<8}{row['concurrency']:>9}{row['rps']:>10.1f}{row['p50_ms']:>9.1f}"
+                    f"{row['p99_ms']:>9.1f}{row['errors']:>8}{row['rss_mb']:>9.1f}{per_mb:>10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Speed of the batched wall geometry queries
+
+Generates walls of randomly placed elements and times the NumPy queries in
+``geometry`` (overlaps through the grid index, nearest neighbours, alignment
+guides) against the pairwise Python loop a client-side check would run.
+
+Usage:
+    python benchmarks/bench_geometry.py --elements 100,1000,5000
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geometry import (  # noqa: E402
+    WALL_WIDTH, WALL_HEIGHT, element_arrays, overlaps, nearest_neighbours, alignment_guides
+)
+
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Past this the O(n^2) baseline takes too long to be worth timing
+MAX_PAIRWISE = 2000
+
+
+def make_elements(count):
+    return [
+        {
+            'id': str(i), 'type': 'sticker',
+            'x': round(random.uniform(0, WALL_WIDTH), 1), 'y': round(random.uniform(0, WALL_HEIGHT), 1),
+            'width': random.choice((20, 40, 80)), 'height': random.choice((20, 40, 80)),
+        }
+        for i in range(count)
+    ]
+
+
+def pairwise_overlaps(elements):
+    found = []
+    for i, a in enumerate(elements):
+        for b in elements[i + 1:]:
+            if (a['x'] < b['x'] + b['width'] and b['x'] < a['x'] + a['width']
+                    and a['y'] < b['y'] + b['height'] and b['y'] < a['y'] + a['height']):
+                found.append((a['id'], b['id']))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--elements', default='100,500,2000,10000',
+                        type=lambda value: [int(v) for v in value.split(',')])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(7)
+    logger.info(f"{'elements':>9}{'pairwise ms':>13}{'overlaps ms':>13}{'nearest ms':>12}{'guides ms':>11}")
+    for count in args.elements:
+        elements = make_elements(count)
+
+        def best(fn):
+            return min(timeit.repeat(fn, number=1, repeat=args.repeat)) * 1000
+
+        boxes = element_arrays(elements)
+        assert len(overlaps(boxes, max_pairs=None)[0]) == len(pairwise_overlaps(elements[:MAX_PAIRWISE])) or count > MAX_PAIRWISE
+        pairwise = f'{best(lambda: pairwise_overlaps(elements)):>13.1f}' if count <= MAX_PAIRWISE else f"{'-':>13}"
+        logger.info(f"{count:>9}{pairwise}"
+                    f"{best(lambda: overlaps(element_arrays(elements), max_pairs=None)):>13.1f}"
+                    f"{best(lambda: nearest_neighbours(boxes)):>12.1f}"
+                    f"{best(lambda: alignment_guides(boxes)):>11.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the application factory
+
+Each sample runs in a fresh interpreter so import costs are measured cold:
+  import   - time to import the ``app`` module
+  create   - time for ``create_app(config_name)``
+  request  - time for the first test-client request (triggers lazy setup)
+
+Usage:
+    python benchmarks/bench_startup.py --runs 20 --config testing
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE = """
+import json, time
+t0 = time.perf_counter()
+import app as module
+t1 = time.perf_counter()
+application = module.create_app({config!r})
+t2 = time.perf_counter()
+application.test_client().get({path!r})
+t3 = time.perf_counter()
+print(json.dumps({{'import': t1 - t0, 'create': t2 - t1, 'request': t3 - t2}}))
+"""
+
+
+def sample(config_name, path):
+    code = SAMPLE.format(config=config_name, path=path)
+    out = subprocess.run(
+        [sys.executable, '-c', code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--config', default='testing')
+    parser.add_argument('--path', default='/api/auth/status')
+    args = parser.parse_args()
+
+    samples = [sample(args.config, args.path) for _ in range(args.runs)]
+
+    logger.info(f"{'phase':<10}{'median ms':>12}{'max ms':>10}")
+    for phase in ('import', 'create', 'request'):
+        values = [s[phase] * 1000 for s in samples]
+        logger.info(f"{phase:<10}{statistics.median(values):>12.2f}{max(values):>10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
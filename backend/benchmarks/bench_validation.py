@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Design validator overhead vs payload size
+
+Builds session payloads with a growing number of elements per wall and times
+``validate_session_payload`` against ``json.loads`` of the same body, so the
+validator's cost can be read as a fraction of parsing.
+
+Usage:
+    python benchmarks/bench_validation.py --elements 10,100,500
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from design_schema import validate_session_payload  # noqa: E402
+from documents import WALL_NAMES  # noqa: E402
+
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def make_element(index):
+    kind = random.choice(('sticker', 'frame'))
+    element = {
+        'id': f'el-{index:06d}',
+        'type': kind,
+        'content': f'/images/garland{random.randint(1, 11)}.png' if kind == 'sticker' else None,
+        'x': random.uniform(0, 900),
+        'y': random.uniform(0, 600),
+        'width': random.uniform(20, 300),
+        'height': random.uniform(20, 300),
+    }
+    if kind == 'frame':
+        element.update(frameType=random.choice(('square', 'circle', 'rounded')), borderColor='#A1B2C3')
+    return element
+
+
+def make_payload(elements_per_wall):
+    return {
+        'session_name': 'Benchmark',
+        'room_type': 'livingroom',
+        'room_dimensions': {'length': 12, 'width': 10, 'height': 8},
+        'selected_wall': 'front',
+        'wall_designs': {
+            wall: {
+                'elements': [make_element(i) for i in range(elements_per_wall)],
+                'wallpaper': '/wallpapers/design1.png',
+            }
+            for wall in WALL_NAMES
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--elements', default='10,50,100,250,500',
+                        type=lambda value: [int(v) for v in value.split(',')])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(42)
+    logger.info(f"{'elements/wall':>14}{'body KB':>10}{'parse ms':>10}{'validate ms':>13}{'MB/s':>9}{'overhead':>10}")
+    for count in args.elements:
+        payload = make_payload(count)
+        body = json.dumps(payload)
+
+        parse = min(timeit.repeat(lambda: json.loads(body), number=1, repeat=args.repeat))
+        validate = min(timeit.repeat(lambda: validate_session_payload(payload), number=1, repeat=args.repeat))
+
+        logger.info(f"{count:>14}{len(body) / 1024:>10.1f}{parse * 1000:>10.3f}{validate * 1000:>13.3f}"
+                    f"{len(body) / validate / 1e6:>9.1f}{validate / parse:>9.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Reproducible synthetic data for the API benchmarks and load tests
+
+Generates, from a seed:
+- users: ``bench-user-<n>``, plus the admin ``bench-admin``, all verified,
+  with the password ``BENCH_PASSWORD``;
+- sessions: four walls each. Element counts are log-normal (median about 25
+  per wall, some walls empty, a long tail into the hundreds). Stickers and
+  wallpapers come from the catalog. About one element in ten is a frame
+  holding an embedded photo, a data URL of 1-200 KB;
+- feedback entries.
+
+Sessions are stored the way ``POST /api/sessions`` stores them (wall blobs
+plus references), so every route reads them as real data. The same seed
+always produces the same content.
+
+Usage:
+    python benchmarks/dataset.py --mongo-uri mongodb://localhost:27017 --db altarmaker_bench \\
+        --users 200 --sessions-per-user 3 --drop
+
+The app always uses the ``altarmaker`` database. To load-test a server,
+seed that name on a throwaway ``mongod`` with ``--db altarmaker
+--allow-app-db``.
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_codec import STICKERS  # noqa: E402
+from documents import WALL_NAMES, session_document  # noqa: E402
+from wall_store import save_blobs  # noqa: E402
+
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BENCH_PASSWORD = 'bench-password'
+ADMIN_USERNAME = 'bench-admin'
+
+WALLPAPERS = [f'/wallpapers/design{i}.png' for i in range(1, 4)]
+ROOM_TYPES = ('living_room', 'bedroom', 'prayer_room', 'hallway')
+
+
+def username(index):
+    return f'bench-user-{index}'
+
+
+class Dataset:
+    """Deterministic generator of users, session payloads and feedback"""
+
+    def __init__(self, seed=7, median_elements=25, image_share=0.1):
+        self.rng = random.Random(seed)
+        self.median_elements = median_elements
+        self.image_share = image_share
+        self._password_hash = None
+
+    def _id(self):
+        return f'{self.rng.getrandbits(64):016x}'
+
+    def element_count(self):
+        if self.rng.random() < 0.2:
+            return 0
+        count = self.rng.lognormvariate(math.log(self.median_elements), 0.9)
+        return min(300, max(1, round(count)))
+
+    def image(self):
+        """A data URL of random (incompressible, like a photo) bytes, 1-200 KB"""
+        size = min(200 * 1024, max(1024, round(self.rng.lognormvariate(math.log(12 * 1024), 1.0))))
+        return 'data:image/jpeg;base64,' + base64.b64encode(self.rng.randbytes(size)).decode()
+
+    def element(self):
+        if self.rng.random() >= self.image_share:
+            size = self.rng.choice((100, 150, 200))
+            return {
+                'id': self._id(), 'type': 'sticker', 'content': self.rng.choice(STICKERS),
+                'x': round(self.rng.uniform(0, 900), 2), 'y': round(self.rng.uniform(0, 600), 2),
+                'width': size, 'height': size, 'rotation': self.rng.choice((0, 0, 0, 15, -15, 90)),
+            }
+        return {
+            'id': self._id(), 'type': 'frame', 'frameType': self.rng.choice(('square', 'circle', 'rounded')),
+            'content': self.image(),
+            'x': round(self.rng.uniform(0, 900), 2), 'y': round(self.rng.uniform(0, 600), 2),
+            'width': 200, 'height': 200, 'borderColor': '#%06X' % self.rng.randint(0, 0xFFFFFF),
+        }
+
+    def wall_designs(self):
+        designs = {}
+        for wall in WALL_NAMES:
+            count = self.element_count()
+            designs[wall] = {
+                'elements': [self.element() for _ in range(count)],
+                'wallpaper': self.rng.choice(WALLPAPERS) if count or self.rng.random() < 0.5 else None,
+            }
+        return designs
+
+    def session_payload(self, name=None):
+        """A ``POST /api/sessions`` body"""
+        return {
+            'session_name': name or f'Bench design {self._id()[:6]}',
+            'room_type': self.rng.choice(ROOM_TYPES),
+            'room_dimensions': {'length': self.rng.choice((10, 12, 15)), 'width': self.rng.choice((10, 12)),
+                                'height': 9},
+            'wall_designs': self.wall_designs(),
+            'selected_wall': self.rng.choice(WALL_NAMES),
+        }
+
+    def registration(self, name):
+        """A ``POST /api/auth/register`` body"""
+        return {'username': name, 'email': f'{name}@bench.example.com', 'password': BENCH_PASSWORD}
+
+    def feedback(self):
+        """A ``POST /api/feedback`` body"""
+        words = ('altar', 'design', 'love', 'easy', 'frames', 'stickers', 'export', 'wallpaper', 'slow', 'great')
+        return {
+            'name': f'Visitor {self._id()[:4]}',
+            'email': f'visitor-{self._id()[:8]}@bench.example.com',
+            'message': ' '.join(self.rng.choice(words) for _ in range(self.rng.randint(5, 60))),
+            'rating': self.rng.randint(1, 5),
+        }
+
+    def user_document(self, name, role='user'):
+        from werkzeug.security import generate_password_hash
+
+        if self._password_hash is None:
+            # Hashing is deliberately slow; every bench user shares one hash
+            self._password_hash = generate_password_hash(BENCH_PASSWORD)
+        return {
+            'username': name,
+            'email': f'{name}@bench.example.com',
+            'password': self._password_hash,
+            'role': role,
+            'email_verified': True,
+            'verification_token': None,
+            'created_at': datetime.utcnow() - timedelta(days=self.rng.randint(0, 365)),
+            'last_login': None,
+        }
+
+
+def create_indexes(db):
+    """The indexes ``database.py`` creates, on ``db``"""
+    from database import DatabaseManager
+
+    manager = DatabaseManager()
+    manager.db = db
+    manager.create_indexes()
+
+
+def seed(db, users=100, sessions_per_user=3, feedback=200, seed=7):
+    """Insert a dataset into ``db``; returns counts, sizes and the ids the benchmarks use"""
+    started = time.perf_counter()
+    data = Dataset(seed)
+    create_indexes(db)
+
+    admin = data.user_document(ADMIN_USERNAME, role='admin')
+    user_docs = [data.user_document(username(i)) for i in range(users)]
+    db.users.insert_many([admin] + user_docs)
+
+    session_bytes = 0
+    session_ids = {}
+    for index, user in enumerate(user_docs):
+        # The first user always has the average number, for the per-user scenarios
+        count = sessions_per_user if index == 0 else data.rng.randint(0, 2 * sessions_per_user)
+        documents = []
+        for _ in range(count):
+            payload = data.session_payload()
+            size_bytes = len(json.dumps(payload))
+            session_bytes += size_bytes
+            document, blobs = session_document(str(user['_id']), payload, size_bytes)
+            save_blobs(db, blobs)
+            documents.append(document)
+        if documents:
+            result = db.sessions.insert_many(documents)
+            session_ids[username(index)] = [str(_id) for _id in result.inserted_ids]
+
+    entries = [data.feedback() for _ in range(feedback)]
+    for entry in entries:
+        entry.update(date=datetime.utcnow().isoformat(), approved=data.rng.random() < 0.5)
+    if entries:
+        db.feedback.insert_many(entries)
+
+    return {
+        'users': users + 1,
+        'sessions': sum(len(ids) for ids in session_ids.values()),
+        'session_mb': round(session_bytes / 1024 / 1024, 1),
+        'feedback': feedback,
+        'seed': seed,
+        'seconds': round(time.perf_counter() - started, 1),
+        'session_ids': session_ids,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=os.getenv('BENCH_MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default='altarmaker_bench')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--sessions-per-user', type=int, default=3)
+    parser.add_argument('--feedback', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--drop', action='store_true', help='drop the database first')
+    parser.add_argument('--allow-app-db', action='store_true',
+                        help='allow --db altarmaker, on a mongod used only for load tests')
+    args = parser.parse_args()
+
+    if args.db == 'altarmaker' and not args.allow_app_db:
+        logger.error("Refusing to seed the application database; use a separate --db or --allow-app-db")
+        return 1
+
+    from pymongo import MongoClient
+
+    client = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000)
+    if args.drop:
+        client.drop_database(args.db)
+    summary = seed(client[args.db], args.users, args.sessions_per_user, args.feedback, args.seed)
+    logger.info(f"Seeded {args.db}: {summary['users']} users, {summary['sessions']} sessions "
+                f"({summary['session_mb']} MB of designs), {summary['feedback']} feedback entries "
+                f"in {summary['seconds']}s")
+    logger.info(f"Log in as {username(0)} / {BENCH_PASSWORD}, or {ADMIN_USERNAME} with role admin")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
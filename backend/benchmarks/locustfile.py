@@ -0,0 +1,121 @@
+"""
+Load test of a running API, against a database seeded by ``dataset.py``
+
+Three kinds of simulated users:
+- designers (most of the traffic) log in as a seeded user. They load and
+  list their sessions, autosave (PUT) and now and then save a new design;
+- visitors read and submit feedback, log in and occasionally register;
+- admins poll the stats page.
+
+Usage:
+    mongod --dbpath /tmp/bench-db --port 27018   # Throwaway; the app always uses 'altarmaker'
+    python benchmarks/dataset.py --mongo-uri mongodb://localhost:27018 --db altarmaker --allow-app-db \\
+        --users 200 --drop
+    MONGO_URI=mongodb://localhost:27018 FLASK_ENV=production gunicorn -w 4 -b 127.0.0.1:5000 app:app
+    locust -f benchmarks/locustfile.py --host http://127.0.0.1:5000 \\
+        --headless -u 100 -r 10 -t 5m --csv run
+    python benchmarks/bench_api.py --locust-csv run_stats.csv --save benchmarks/baselines/load.json
+
+Set ``BENCH_USERS`` to the ``--users`` the database was seeded with (100). Leave the
+server's mail settings empty so registrations send nothing.
+"""
+import itertools
+import json
+import os
+import random
+import sys
+
+from locust import HttpUser, between, task
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dataset import ADMIN_USERNAME, BENCH_PASSWORD, Dataset, username  # noqa: E402
+
+BENCH_USERS = int(os.getenv('BENCH_USERS', 100))
+BENCH_SEED = int(os.getenv('BENCH_SEED', 7))
+
+_user_numbers = itertools.count()
+
+
+def login(client, name, role='user'):
+    with client.post('/api/auth/login', json={'username': name, 'password': BENCH_PASSWORD, 'role': role},
+                     catch_response=True) as response:
+        if response.status_code != 200:
+            response.failure(f'Could not log in as {name}: {response.status_code}')
+
+
+class Designer(HttpUser):
+    weight = 10
+    wait_time = between(1, 5)
+
+    def on_start(self):
+        number = next(_user_numbers)
+        self.data = Dataset(BENCH_SEED + 1000 + number)
+        login(self.client, username(number % BENCH_USERS))
+        response = self.client.get('/api/sessions')
+        self.session_ids = [s['_id'] for s in response.json().get('sessions', [])] if response.ok else []
+        # Generated once per simulated user; building designs is not what is measured
+        self.designs = [json.dumps(self.data.session_payload()) for _ in range(3)]
+
+    def _post_design(self, method, path, name):
+        return self.client.request(method, path, data=random.choice(self.designs), name=name,
+                                   headers={'Content-Type': 'application/json'})
+
+    @task(5)
+    def load_session(self):
+        if self.session_ids:
+            self.client.get(f'/api/sessions/{random.choice(self.session_ids)}', name='/api/sessions/[id]')
+
+    @task(2)
+    def list_sessions(self):
+        self.client.get('/api/sessions')
+
+    @task(3)
+    def update_session(self):
+        if self.session_ids:
+            self._post_design('PUT', f'/api/sessions/{random.choice(self.session_ids)}', '/api/sessions/[id]')
+
+    @task(1)
+    def save_session(self):
+        response = self._post_design('POST', '/api/sessions', '/api/sessions')
+        if response.status_code == 201:
+            self.session_ids.append(response.json()['session']['_id'])
+
+
+class Visitor(HttpUser):
+    weight = 3
+    wait_time = between(2, 8)
+
+    def on_start(self):
+        self.number = next(_user_numbers)
+        self.data = Dataset(BENCH_SEED + 1000 + self.number)
+        self.registered = itertools.count()
+
+    @task(5)
+    def list_feedback(self):
+        self.client.get('/api/feedback')
+
+    @task(1)
+    def submit_feedback(self):
+        self.client.post('/api/feedback', json=self.data.feedback())
+
+    @task(2)
+    def login(self):
+        login(self.client, username(random.randrange(BENCH_USERS)))
+
+    @task(1)
+    def register(self):
+        name = f'bench-load-{os.getpid()}-{self.number}-{next(self.registered)}'
+        self.client.post('/api/auth/register', json=self.data.registration(name))
+
+
+class Admin(HttpUser):
+    weight = 1
+    wait_time = between(5, 15)
+
+    def on_start(self):
+        login(self.client, ADMIN_USERNAME, role='admin')
+
+    @task
+    def stats(self):
+        self.client.get('/api/admin/stats')
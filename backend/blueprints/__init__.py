@@ -0,0 +1,19 @@
+"""
+API blueprints, registered by ``app.create_app``.
+"""
+from flask import request
+
+
+def request_size():
+    """Size of the request body in bytes; chunked bodies have no Content-Length"""
+    if request.content_length is not None:
+        return request.content_length
+    return len(request.get_data(cache=True))
+
+
+def register_blueprints(app):
+    """Register every blueprint on the app"""
+    from blueprints import health, auth, designs, sessions, admin, feedback, catalog, metrics, frontend
+
+    for module in (health, auth, designs, sessions, admin, feedback, catalog, metrics, frontend):
+        app.register_blueprint(module.bp)
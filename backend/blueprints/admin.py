@@ -0,0 +1,282 @@
+"""
+Admin blueprint: user management and statistics
+"""
+from datetime import datetime
+from bson import ObjectId
+from flask import Blueprint, request, jsonify
+from werkzeug.security import generate_password_hash
+
+from auth_utils import require_auth, require_admin
+from documents import serialize_session
+from extensions import db
+from maintenance import SWEEPS, get_maintenance, last_report
+from user_deletion import JOBS_COLLECTION, get_user_deletion, job_response
+from wall_store import load_walls
+from write_behind import SESSION, WALL_DESIGNS, get_write_behind
+
+bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+
+@bp.route('/users', methods=['GET'])
+@require_auth
+@require_admin
+def get_all_users():
+    """Get all users (admin only)"""
+    try:
+        users = list(db.users.find({}, {'password': 0}))
+        
+        # Convert ObjectId to string
+        for user in users:
+            user['_id'] = str(user['_id'])
+        
+        return jsonify({'users': users}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/users', methods=['POST'])
+@require_auth
+@require_admin
+def create_admin_user():
+    """Create a new admin user (admin only)"""
+    try:
+        data = request.get_json()
+        username = data.get('username')
+        password = data.get('password')
+        email = data.get('email')
+        
+        if not username or not password or not email:
+            return jsonify({'error': 'Username, password, and email are required'}), 400
+        
+        # Check if user already exists
+        existing_user = db.users.find_one({'$or': [{'email': email}, {'username': username}]})
+        if existing_user:
+            return jsonify({'error': 'User with this email or username already exists'}), 409
+        
+        # Create new admin user
+        user_data = {
+            'username': username,
+            'email': email,
+            'password': generate_password_hash(password),
+            'role': 'admin',
+            'created_at': datetime.utcnow(),
+            'last_login': None,
+            'created_by': request.user_data['user_id']
+        }
+        
+        result = db.users.insert_one(user_data)
+        user_data['_id'] = str(result.inserted_id)
+        del user_data['password']
+        
+        return jsonify({
+            'message': 'Admin user created successfully',
+            'user': user_data
+        }), 201
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/users/<user_id>', methods=['DELETE'])
+@require_auth
+@require_admin
+def delete_user(user_id):
+    """Delete a user (admin only).
+
+    Only the account is removed here; their sessions, wall designs and other
+    data are deleted by a background job (user_deletion.py), whose progress
+    is at /api/admin/deletion-jobs/<user_id>.
+    """
+    try:
+        # Validate ObjectId
+        if not ObjectId.is_valid(user_id):
+            return jsonify({'error': 'Invalid user ID'}), 400
+        
+        # Don't allow admin to delete themselves
+        if user_id == request.user_data['user_id']:
+            return jsonify({'error': 'Cannot delete your own account'}), 400
+        
+        user = db.users.find_one_and_delete({'_id': ObjectId(user_id)}, {'username': 1, 'email': 1})
+        
+        if user is None:
+            return jsonify({'error': 'User not found'}), 404
+        
+        # Saves still buffered for the user would recreate their data
+        buffer = get_write_behind()
+        for kind in (SESSION, WALL_DESIGNS):
+            for entry in buffer.pending_for(kind, user_id):
+                buffer.discard(entry.key)
+        
+        job = get_user_deletion().enqueue(db, user, requested_by=request.user_data['user_id'])
+        
+        return jsonify({
+            'message': 'User deleted; their data is being removed',
+            'job': job_response(job)
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/deletion-jobs', methods=['GET'])
+@require_auth
+@require_admin
+def get_deletion_jobs():
+    """Recent user deletion jobs, newest first (admin only)"""
+    try:
+        query = {}
+        if request.args.get('status'):
+            query['status'] = request.args['status']
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        jobs = db[JOBS_COLLECTION].find(query).sort('created_at', -1).limit(limit)
+        return jsonify({'jobs': [job_response(job) for job in jobs]}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/deletion-jobs/<user_id>', methods=['GET'])
+@require_auth
+@require_admin
+def get_deletion_job(user_id):
+    """Status and progress of the deletion job for a user (admin only)"""
+    try:
+        job = db[JOBS_COLLECTION].find_one({'_id': user_id})
+        if job is None:
+            return jsonify({'error': 'Deletion job not found'}), 404
+        return jsonify({'job': job_response(job)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/maintenance', methods=['GET'])
+@require_auth
+@require_admin
+def get_maintenance_report():
+    """Report of the last maintenance run (admin only)"""
+    try:
+        return jsonify({
+            'running': get_maintenance().running,
+            'last_run': last_report(db)
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/maintenance', methods=['POST'])
+@require_auth
+@require_admin
+def run_maintenance():
+    """Start a maintenance run in the background (admin only)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        sweeps = data.get('sweeps') or list(SWEEPS)
+        if not isinstance(sweeps, list) or any(sweep not in SWEEPS for sweep in sweeps):
+            return jsonify({'error': f"sweeps must be a list of: {', '.join(SWEEPS)}"}), 400
+        dry_run = bool(data.get('dry_run', False))
+        
+        if not get_maintenance().run_in_background(tuple(sweeps), dry_run):
+            return jsonify({'error': 'A maintenance run is already in progress'}), 409
+        
+        return jsonify({
+            'message': 'Maintenance started',
+            'sweeps': sweeps,
+            'dry_run': dry_run
+        }), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/users/<user_id>/promote', methods=['PUT'])
+@require_auth
+@require_admin
+def promote_user_to_admin(user_id):
+    """Promote a user to admin role (admin only)"""
+    try:
+        # Validate ObjectId
+        if not ObjectId.is_valid(user_id):
+            return jsonify({'error': 'Invalid user ID'}), 400
+        
+        # Don't allow admin to promote themselves (they're already admin)
+        if user_id == request.user_data['user_id']:
+            return jsonify({'error': 'You are already an admin'}), 400
+        
+        # Update user role to admin
+        result = db.users.update_one(
+            {'_id': ObjectId(user_id)},
+            {'$set': {'role': 'admin', 'updated_at': datetime.utcnow()}}
+        )
+        
+        if result.matched_count == 0:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if result.modified_count == 0:
+            return jsonify({'error': 'User is already an admin'}), 400
+        
+        return jsonify({'message': 'User promoted to admin successfully'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/users/<user_id>/demote', methods=['PUT'])
+@require_auth
+@require_admin
+def demote_admin_to_user(user_id):
+    """Demote an admin to regular user role (admin only)"""
+    try:
+        # Validate ObjectId
+        if not ObjectId.is_valid(user_id):
+            return jsonify({'error': 'Invalid user ID'}), 400
+        
+        # Don't allow admin to demote themselves
+        if user_id == request.user_data['user_id']:
+            return jsonify({'error': 'You cannot demote yourself'}), 400
+        
+        # Update user role to user
+        result = db.users.update_one(
+            {'_id': ObjectId(user_id)},
+            {'$set': {'role': 'user', 'updated_at': datetime.utcnow()}}
+        )
+        
+        if result.matched_count == 0:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if result.modified_count == 0:
+            return jsonify({'error': 'User is already a regular user'}), 400
+        
+        return jsonify({'message': 'Admin demoted to regular user successfully'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/stats', methods=['GET'])
+@require_auth
+@require_admin
+def get_admin_stats():
+    """Get admin statistics"""
+    try:
+        total_users = db.users.count_documents({})
+        total_sessions = db.sessions.count_documents({})
+        admin_users = db.users.count_documents({'role': 'admin'})
+        regular_users = db.users.count_documents({'role': 'user'})
+        
+        # Get recent activity
+        recent_sessions = load_walls(db, list(db.sessions.find().sort('created_at', -1).limit(10)))
+        for session in recent_sessions:
+            serialize_session(session)
+        
+        stats = {
+            'total_users': total_users,
+            'total_sessions': total_sessions,
+            'admin_users': admin_users,
+            'regular_users': regular_users,
+            'recent_sessions': recent_sessions,
+            'write_behind': get_write_behind().stats()
+        }
+        
+        return jsonify(stats), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
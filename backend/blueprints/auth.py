@@ -0,0 +1,306 @@
+"""
+Authentication blueprint: registration, email verification and login
+"""
+from datetime import datetime
+from flask import Blueprint, request, jsonify, session
+from werkzeug.security import generate_password_hash, check_password_hash
+import logging
+
+from auth_utils import create_user_session, get_current_user
+from email_utils import generate_verification_token, send_verification_email, send_welcome_email, verify_token
+from extensions import db
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('auth', __name__, url_prefix='/api/auth')
+
+
+@bp.route('/register', methods=['POST'])
+def register():
+    """Register a new user"""
+    try:
+        data = request.get_json()
+        username = data.get('username')
+        password = data.get('password')
+        email = data.get('email')
+        role = data.get('role', 'user')
+        
+        if not username or not password or not email:
+            return jsonify({'error': 'Username, password, and email are required'}), 400
+        
+        # Validate email format
+        if '@' not in email or '.' not in email:
+            return jsonify({'error': 'Please enter a valid email address'}), 400
+        
+        # Prevent admin registration through public API
+        if role == 'admin':
+            return jsonify({'error': 'Admin registration is not allowed through public API'}), 403
+        
+        # Check if user already exists
+        try:
+            existing_user = db.users.find_one({'$or': [{'email': email}, {'username': username}]})
+            if existing_user:
+                return jsonify({'error': 'User with this email or username already exists'}), 409
+            
+            with span('password.hash'):
+                password_hash = generate_password_hash(password)
+            
+            # Create new user (always as regular user)
+            user_data = {
+                'username': username,
+                'email': email,
+                'password': password_hash,
+                'role': 'user',  # Always create as user
+                'email_verified': False,
+                'verification_token': None,
+                'created_at': datetime.now(),
+                'last_login': None
+            }
+            
+            # Insert user into database
+            result = db.users.insert_one(user_data)
+            user_id = result.inserted_id
+            
+            # Generate verification token and update user
+            token = generate_verification_token(email)
+            db.users.update_one(
+                {'_id': user_id},
+                {'$set': {'verification_token': token}}
+            )
+            
+            # Send verification email
+            email_sent = send_verification_email(email, token)
+            
+            user_data['_id'] = str(user_id)
+            del user_data['password']
+            del user_data['verification_token']
+            
+            if email_sent:
+                return jsonify({
+                    'message': 'Registration successful! Please check your email to verify your account.',
+                    'user': user_data,
+                    'email_sent': True
+                }), 201
+            else:
+                # If email sending fails, we still create the user but notify them to contact support
+                return jsonify({
+                    'message': 'Registration successful, but we encountered an issue sending the verification email. Please try logging in or contact support.',
+                    'user': user_data,
+                    'email_sent': False
+                }), 201
+            
+        except Exception as e:
+            logger.exception(f"Database error during registration: {e}")
+            return jsonify({'error': 'Database connection error'}), 500
+        
+    except Exception as e:
+        logger.exception(f"Error in register: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@bp.route('/verify-email', methods=['GET'])
+def verify_email():
+    """Verify user's email using the verification token"""
+    try:
+        token = request.args.get('token')
+        if not token:
+            return jsonify({'error': 'Verification token is required'}), 400
+        
+        # Verify token and get email
+        email = verify_token(token)
+        
+        if not email:
+            logger.info("Email verification with an invalid or expired token")
+            return jsonify({'error': 'Invalid or expired verification link'}), 400
+        
+        # Find user by email (case-insensitive search)
+        user = db.users.find_one({
+            'email': {'$regex': f'^{email}$', '$options': 'i'},
+            'verification_token': token
+        })
+
+        if not user:
+            # Try to find if user exists but with different case
+            user_with_email = db.users.find_one({
+                'email': {'$regex': f'^{email}$', '$options': 'i'}
+            })
+            if user_with_email:
+                logger.info(f"Email verification for {email} with a token that is no longer current")
+            return jsonify({
+                'error': 'Invalid verification link or user not found',
+                'details': 'The verification link is invalid or has expired. Please request a new verification email.'
+            }), 404
+        
+        # Update user as verified
+        db.users.update_one(
+            {'_id': user['_id']},
+            {
+                '$set': {
+                    'email_verified': True,
+                    'verification_token': None  # Clear the token after verification
+                }
+            }
+        )
+        
+        # Send welcome email
+        try:
+            send_welcome_email(email, user['username'])
+            logger.debug(f"Welcome email sent to {email}")
+        except Exception as e:
+            logger.warning(f"Failed to send welcome email: {e}")
+            # Continue even if welcome email fails
+        
+        # Return success response with redirect URL
+        return jsonify({
+            'message': 'Email verified successfully!',
+            'redirect': '/login?verified=true',
+            'user_id': str(user['_id']),
+            'email': user['email']
+        }), 200
+        
+    except Exception as e:
+        logger.exception(f"Error in verify_email: {e}")
+        return jsonify({
+            'error': 'An error occurred during email verification',
+            'details': str(e)
+        }), 500
+        return jsonify({'error': 'An error occurred during email verification'}), 500
+
+
+@bp.route('/login', methods=['POST'])
+def login():
+    """Login user"""
+    try:
+        data = request.get_json()
+        username = data.get('username')
+        password = data.get('password')
+        role = data.get('role', 'user')
+        
+        if not username or not password:
+            return jsonify({'error': 'Username and password are required'}), 400
+        
+        try:
+            # Find user by username or email
+            user = db.users.find_one({
+                '$or': [
+                    {'username': username},
+                    {'email': username}
+                ]
+            })
+            
+            if not user:
+                return jsonify({'error': 'Invalid credentials'}), 401
+            
+            # Check password
+            with span('password.verify'):
+                password_ok = check_password_hash(user['password'], password)
+            if not password_ok:
+                return jsonify({'error': 'Invalid credentials'}), 401
+            
+            # Check role if specified
+            if role and user.get('role') != role:
+                return jsonify({'error': f'Invalid role. Expected {role}'}), 401
+            
+            # Check if user is active
+            if not user.get('is_active', True):
+                return jsonify({'error': 'Your account has been deactivated. Please contact support.'}), 403
+            
+            # Check if email is verified
+            if not user.get('email_verified', False):
+                return jsonify({
+                    'error': 'Please verify your email before logging in. Check your inbox for the verification link.'
+                }), 403
+            
+            # Update last login
+            db.users.update_one(
+                {'_id': user['_id']},
+                {'$set': {'last_login': datetime.now()}}
+            )
+            
+            # Create user session
+            create_user_session(user['_id'], user['username'], user['role'])
+            
+            user_data = {
+                '_id': str(user['_id']),
+                'username': user['username'],
+                'email': user.get('email'),
+                'role': user['role'],
+                'created_at': user['created_at'],
+                'last_login': user['last_login']
+            }
+            
+            return jsonify({
+                'message': 'Login successful',
+                'user': user_data
+            }), 200
+            
+        except Exception as e:
+            logger.exception(f"Database error during login: {e}")
+            return jsonify({'error': 'Database connection error'}), 500
+        
+    except Exception as e:
+        logger.exception(f"Error in login: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@bp.route('/logout', methods=['POST'])
+def logout():
+    """Logout user by clearing session"""
+    session.clear()
+    return jsonify({'message': 'Logout successful'}), 200
+
+
+@bp.route('/status', methods=['GET'])
+def auth_status():
+    """Check if user is currently authenticated"""
+    user_data = get_current_user()
+    if user_data:
+        return jsonify({
+            'authenticated': True,
+            'user': user_data
+        })
+    else:
+        return jsonify({
+            'authenticated': False,
+            'user': None
+        }), 401
+
+
+@bp.route('/resend-verification', methods=['POST'])
+def resend_verification():
+    """Resend verification email"""
+    try:
+        data = request.get_json()
+        email = data.get('email')
+        
+        if not email:
+            return jsonify({'error': 'Email is required'}), 400
+        
+        # Find user by email
+        user = db.users.find_one({'email': email})
+        if not user:
+            return jsonify({'error': 'No account found with this email'}), 404
+            
+        if user.get('email_verified', False):
+            return jsonify({'message': 'Email is already verified'}), 200
+            
+        # Generate new verification token
+        token = generate_verification_token(email)
+        
+        # Update user with new token
+        db.users.update_one(
+            {'_id': user['_id']},
+            {'$set': {'verification_token': token}}
+        )
+        
+        # Resend verification email
+        send_verification_email(email, token)
+        
+        return jsonify({
+            'message': 'Verification email has been resent. Please check your inbox.'
+        }), 200
+        
+    except Exception as e:
+        logger.exception(f"Error in resend_verification: {e}")
+        return jsonify({'error': 'Failed to resend verification email'}), 500
@@ -0,0 +1,74 @@
+"""
+Decoration catalog blueprint
+"""
+import hashlib
+import os
+from concurrent.futures import TimeoutError as RenderTimeout
+
+from flask import Blueprint, Response, jsonify, request, send_from_directory
+
+from atlas import AtlasCache
+from catalog import ATLAS_THUMBNAIL_SIZE, catalog_atlas_job, catalog_atlas_key, get_catalog
+from renderer import get_renderer
+
+bp = Blueprint('catalog', __name__, url_prefix='/api/catalog')
+
+
+@bp.route('', methods=['GET'])
+def get_catalog_assets():
+    """
+    List catalog assets, optionally filtered by ?category= and ?tag=
+    Public and cacheable; clients revalidate with If-None-Match
+    """
+    category = request.args.get('category') or None
+    tag = request.args.get('tag') or None
+    catalog = get_catalog()
+
+    response = Response(catalog.response_body(category, tag), mimetype='application/json')
+    response.set_etag(hashlib.sha1(f"{catalog.etag}|{category}|{tag}".encode()).hexdigest())
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    return response.make_conditional(request)
+
+
+def _atlas_dir():
+    # Separate from the render atlases, which hold users' designs
+    return os.path.join(get_renderer().cache_dir, 'catalog_atlas')
+
+
+@bp.route('/atlas', methods=['GET'])
+def get_catalog_atlas():
+    """
+    Sprite atlas of catalog thumbnails for the same ?category= and ?tag=
+    filters. Returns the atlas manifest (images keyed by src) with a URL per
+    sheet; sheets are content-addressed and cached forever.
+    """
+    try:
+        entries = get_catalog().entries(request.args.get('category') or None, request.args.get('tag') or None)
+        key = catalog_atlas_key(entries)
+        atlas = AtlasCache(_atlas_dir()).get(key)
+        if atlas is not None:
+            manifest = atlas.manifest
+        else:
+            renderer = get_renderer()
+            job = (entries, get_catalog().public_dir, _atlas_dir(), ATLAS_THUMBNAIL_SIZE)
+            manifest = renderer.pool.submit(catalog_atlas_job, job).result(renderer.timeout)
+
+        sheets = [dict(sheet, url=f"/api/catalog/atlas/{sheet['file']}") for sheet in manifest['sheets']]
+        response = jsonify(dict(manifest, sheets=sheets))
+        response.set_etag(key)
+        response.headers['Cache-Control'] = 'public, max-age=300'
+        return response.make_conditional(request)
+    except RenderTimeout:
+        return jsonify({'error': 'Atlas packing timed out'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/atlas/<filename>', methods=['GET'])
+def get_catalog_atlas_sheet(filename):
+    """One atlas sheet; names embed the atlas key, so they never change"""
+    if not filename.endswith('.png'):
+        return jsonify({'error': 'Not found'}), 404
+    response = send_from_directory(_atlas_dir(), filename, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
@@ -0,0 +1,154 @@
+"""
+Wall designs blueprint
+"""
+import copy
+import logging
+from bson import ObjectId
+from flask import Blueprint, request, jsonify, current_app
+
+from auth_utils import require_auth
+from blueprints import request_size
+from catalog import check_design_assets
+from design_schema import (
+    DesignValidationError, validate_wall_design_payload, validate_geometry_payload, check_payload_size
+)
+from design_templates import get_templates
+from documents import wall_design_document, wall_design_response
+from element_codec import decode_elements
+from extensions import db
+from geometry import QUERIES, geometry_report
+from wall_store import load_walls
+from write_behind import get_write_behind, session_key, wall_designs_key
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('designs', __name__, url_prefix='/api/designs')
+
+
+@bp.route('/wall-designs', methods=['GET'])
+@require_auth
+def get_wall_designs():
+    """Get wall designs for current user"""
+    try:
+        user_id = request.user_data['user_id']
+        
+        # Get the most recent wall design for the user; a pending save is newer
+        buffer = get_write_behind()
+        pending = buffer.pending(wall_designs_key(user_id))
+        # Decoding works in place; the pending save is still to be written
+        wall_design = copy.deepcopy(pending.document) if pending else db.wall_designs.find_one(
+            {'user_id': user_id},
+            sort=[('created_at', -1)]
+        )
+        
+        body = wall_design_response(wall_design)
+        failure = buffer.failure(wall_designs_key(user_id))
+        if failure:
+            body['saveError'] = failure[1]
+        return jsonify(body)
+    except Exception as e:
+        logger.exception(f"Error getting wall designs: {e}")
+        return jsonify({'error': 'Failed to get wall designs'}), 500
+
+
+@bp.route('/wall-designs', methods=['POST'])
+@require_auth
+def save_wall_designs():
+    """Save wall designs for current user"""
+    try:
+        user_id = request.user_data['user_id']
+        check_payload_size(request_size(), current_app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = request.get_json()
+        
+        validate_wall_design_payload(data)
+        unknown_assets = check_design_assets(data.get('wallDesigns'))
+        if unknown_assets:
+            return jsonify({'error': 'Design references unknown catalog assets', 'assets': unknown_assets}), 400
+        
+        # Only walls with actual content are kept
+        wall_design_data = wall_design_document(user_id, data)
+        
+        # Insert new wall design record, once per burst of autosaves
+        failure = get_write_behind().save(wall_designs_key(user_id), wall_design_data)
+        if failure:
+            return jsonify({'error': failure[1]}), failure[0]
+        
+        return jsonify({
+            'success': True,
+            'message': 'Wall designs saved successfully'
+        })
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        logger.exception(f"Error saving wall designs: {e}")
+        return jsonify({'error': 'Failed to save wall designs'}), 500
+
+
+@bp.route('/geometry', methods=['POST'])
+@require_auth
+def design_geometry():
+    """Batched overlap, bounds, nearest-neighbour and alignment queries for a wall"""
+    try:
+        user_id = request.user_data['user_id']
+        check_payload_size(request_size(), current_app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = request.get_json()
+        
+        validate_geometry_payload(data)
+        wall = data.get('wall', 'front')
+        room_dimensions = data.get('room_dimensions')
+        
+        if 'elements' in data:
+            elements = data['elements']
+        elif data.get('session_id'):
+            # Query a saved wall instead of posting its elements
+            if not ObjectId.is_valid(data['session_id']):
+                return jsonify({'error': 'Invalid session ID'}), 400
+            
+            get_write_behind().flush(session_key(user_id, data['session_id']))
+            session_data = db.sessions.find_one(
+                {'_id': ObjectId(data['session_id']), 'user_id': user_id},
+                {f'wall_designs.{wall}': 1, 'room_dimensions': 1}
+            )
+            if not session_data:
+                return jsonify({'error': 'Session not found'}), 404
+            
+            load_walls(db, [session_data])
+            stored_wall = (session_data.get('wall_designs') or {}).get(wall) or {}
+            elements = decode_elements(stored_wall.get('elements')) or []
+            room_dimensions = room_dimensions or session_data.get('room_dimensions')
+        else:
+            return jsonify({'error': 'Provide elements or a session_id'}), 400
+        
+        report = geometry_report(
+            elements,
+            queries=data.get('queries') or QUERIES,
+            wall=wall,
+            room_dimensions=room_dimensions,
+            k=data.get('k', 1),
+            tolerance=data.get('tolerance', 2.0)
+        )
+        return jsonify(report)
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        logger.exception(f"Error running geometry queries: {e}")
+        return jsonify({'error': 'Failed to run geometry queries'}), 500
+
+
+@bp.route('/templates', methods=['GET'])
+@require_auth
+def get_popular_templates():
+    """Popular designs across all users, optionally filtered by ?room_type="""
+    try:
+        templates, refreshed_at = get_templates().templates()
+        room_type = request.args.get('room_type')
+        if room_type:
+            templates = [template for template in templates if template['room_type'] == room_type]
+        limit = request.args.get('limit', 20, type=int)
+        return jsonify({
+            'templates': templates[:max(limit or 0, 0)],
+            'refreshed_at': refreshed_at
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
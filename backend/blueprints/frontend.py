@@ -0,0 +1,26 @@
+"""
+Frontend serving blueprint for the React build
+"""
+from flask import Blueprint
+
+from static_files import index_cache, send_static
+
+bp = Blueprint('frontend', __name__)
+
+
+@bp.route('/')
+def serve_home():
+    """Serve the React app home page"""
+    return index_cache.response()
+
+
+@bp.route('/<path:path>')
+def serve_static(path):
+    """Serve static files from the React build"""
+    return send_static(path)
+
+
+@bp.app_errorhandler(404)
+def not_found(e):
+    """Handle React Router routes by serving index.html"""
+    return index_cache.response()
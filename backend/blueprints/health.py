@@ -0,0 +1,31 @@
+"""
+Health check blueprint
+"""
+from flask import Blueprint, jsonify
+from extensions import ping_database
+
+bp = Blueprint('health', __name__, url_prefix='/api')
+
+
+@bp.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    try:
+        if ping_database():
+            return jsonify({
+                'status': 'healthy', 
+                'message': 'AltarMaker API is running',
+                'database': 'connected'
+            })
+        else:
+            return jsonify({
+                'status': 'unhealthy',
+                'message': 'Database connection failed',
+                'database': 'disconnected'
+            }), 500
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e),
+            'database': 'error'
+        }), 500
@@ -0,0 +1,21 @@
+"""
+Metrics blueprint: Prometheus scrape endpoint
+"""
+import hmac
+
+from flask import Blueprint, Response, current_app, jsonify, request
+
+from metrics import CONTENT_TYPE, REGISTRY
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request, MongoDB and SMTP metrics of this worker (Prometheus text format)"""
+    if not current_app.config.get('METRICS_ENABLED', True):
+        return jsonify({'error': 'Not found'}), 404
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Authentication required'}), 401
+    return Response(REGISTRY.exposition(), content_type=CONTENT_TYPE)
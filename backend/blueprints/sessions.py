@@ -0,0 +1,603 @@
+"""
+Saved design sessions blueprint
+"""
+from concurrent.futures import TimeoutError as RenderTimeout
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from flask import Blueprint, Response, request, jsonify, current_app, send_file
+
+from auth_utils import require_auth
+from blueprints import request_size
+from catalog import check_design_assets, get_catalog
+from collab import OPS_COLLECTION
+from design_schema import (
+    DesignValidationError, validate_session_payload, validate_clone_payload, validate_wall_payload,
+    validate_wall_patch_payload, validate_bulk_payload, check_payload_size, check_storage_quota,
+    storage_usage_pipeline
+)
+from documents import (
+    EXPORT_FORMAT, EXPORT_VERSION, WALL_NAMES, apply_wall_patch, bulk_ids, bulk_results, clone_document,
+    empty_wall_designs, export_session, replaced_wall_size, session_document, session_update, serialize_session,
+    wall_etag, wall_update
+)
+from element_codec import decode_wall_designs
+from extensions import db
+from renderer import FORMATS, design_hash, get_renderer
+from scene import SCENE_VERSION, scene_job
+from wall_store import join_walls, load_walls, save_blobs, split_wall_designs, touch_blobs
+from write_behind import SESSION, get_write_behind, overlay_session, session_key
+
+bp = Blueprint('sessions', __name__, url_prefix='/api/sessions')
+
+
+def check_quota(user_id, size_bytes, exclude_id=None):
+    """Reject saves that push the user's sessions over their storage quota"""
+    quota = current_app.config.get('USER_STORAGE_QUOTA_BYTES')
+    if not quota:
+        return
+    usage = next(db.sessions.aggregate(storage_usage_pipeline(user_id, exclude_id)), None)
+    check_storage_quota(usage['total'] if usage else 0, size_bytes, quota)
+
+
+@bp.route('', methods=['GET'])
+@require_auth
+def get_sessions():
+    """Get all sessions for the authenticated user"""
+    try:
+        user_id = request.user_data['user_id']
+        sessions = list(db.sessions.find({'user_id': user_id}))
+        pending = {entry.key[2]: entry for entry in get_write_behind().pending_for(SESSION, user_id)}
+        for session in sessions:
+            if str(session['_id']) in pending:
+                overlay_session(session, pending[str(session['_id'])])
+        load_walls(db, sessions)
+        
+        # Convert ObjectId to string
+        for session in sessions:
+            serialize_session(session)
+        
+        return jsonify({'sessions': sessions}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('', methods=['POST'])
+@require_auth
+def save_session():
+    """Save a new session"""
+    try:
+        user_id = request.user_data['user_id']
+        size_bytes = request_size()
+        check_payload_size(size_bytes, current_app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = request.get_json()
+        
+        validate_session_payload(data)
+        unknown_assets = check_design_assets(data.get('wall_designs'))
+        if unknown_assets:
+            return jsonify({'error': 'Design references unknown catalog assets', 'assets': unknown_assets}), 400
+        
+        check_quota(user_id, size_bytes)
+        
+        session_data, blobs = session_document(user_id, data, size_bytes)
+        
+        # Blobs first, so a stored session never points at a missing wall
+        save_blobs(db, blobs)
+        result = db.sessions.insert_one(session_data)
+        session_data['_id'] = result.inserted_id
+        join_walls([session_data], blobs)
+        serialize_session(session_data)
+        
+        return jsonify({
+            'message': 'Session saved successfully',
+            'session': session_data
+        }), 201
+        
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/<session_id>', methods=['GET'])
+@require_auth
+def get_session(session_id):
+    """Get a specific session"""
+    try:
+        user_id = request.user_data['user_id']
+        
+        # Validate ObjectId
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+        
+        session_data = db.sessions.find_one({
+            '_id': ObjectId(session_id),
+            'user_id': user_id
+        })
+        
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        buffer = get_write_behind()
+        pending = buffer.pending(session_key(user_id, session_id))
+        if pending:
+            overlay_session(session_data, pending)
+        load_walls(db, [session_data])
+        serialize_session(session_data)
+        body = {'session': session_data}
+        # The stored session is older than the client's last save
+        failure = buffer.failure(session_key(user_id, session_id))
+        if failure:
+            body['save_error'] = failure[1]
+        return jsonify(body), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/<session_id>', methods=['PUT'])
+@require_auth
+def update_session(session_id):
+    """Update a session"""
+    try:
+        user_id = request.user_data['user_id']
+        
+        # Validate ObjectId
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+        
+        size_bytes = request_size()
+        check_payload_size(size_bytes, current_app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = request.get_json()
+        
+        validate_session_payload(data)
+        unknown_assets = check_design_assets(data.get('wall_designs'))
+        if unknown_assets:
+            return jsonify({'error': 'Design references unknown catalog assets', 'assets': unknown_assets}), 400
+        
+        check_quota(user_id, size_bytes, exclude_id=ObjectId(session_id))
+        
+        update_data, blobs = session_update(data, size_bytes)
+        
+        # ops_seq guards the write: live-editing ops folded in after this
+        # request are not overwritten by it
+        session_data = db.sessions.find_one({'_id': ObjectId(session_id), 'user_id': user_id}, {'ops_seq': 1})
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        # Autosaves in a burst become one write; only edited walls store blobs
+        failure = get_write_behind().save(session_key(user_id, session_id), update_data, blobs,
+                                          guard={'ops_seq': session_data.get('ops_seq')})
+        if failure:
+            return jsonify({'error': failure[1]}), failure[0]
+            
+        return jsonify({'message': 'Session updated successfully'}), 200
+        
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/<session_id>', methods=['DELETE'])
+@require_auth
+def delete_session(session_id):
+    """Delete a session"""
+    try:
+        user_id = request.user_data['user_id']
+        
+        # Validate ObjectId
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+        
+        # One write, scoped to the owner
+        get_write_behind().discard(session_key(user_id, session_id))
+        result = db.sessions.delete_one({
+            '_id': ObjectId(session_id),
+            'user_id': user_id
+        })
+        
+        if result.deleted_count == 0:
+            return jsonify({'error': 'Session not found'}), 404
+        db[OPS_COLLECTION].delete_many({'session_id': session_id})
+        
+        return jsonify({'message': 'Session deleted successfully'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/bulk', methods=['POST'])
+@require_auth
+def bulk_sessions():
+    """Delete, rename, export or fetch many sessions in one request.
+
+    Body: {"action": "delete"|"export"|"fetch", "ids": [...]} or
+    {"action": "rename", "names": {"<id>": "<name>"}}. The ids are looked
+    up with one ``$in`` query scoped by user_id and written with one
+    ``delete_many``/``bulk_write``; results come back per id, in order.
+    """
+    try:
+        user_id = request.user_data['user_id']
+        check_payload_size(request_size(), current_app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = request.get_json(silent=True)
+        validate_bulk_payload(data)
+        
+        action = data['action']
+        ids = bulk_ids(data)
+        object_ids = [ObjectId(session_id) for session_id in ids if ObjectId.is_valid(session_id)]
+        query = {'_id': {'$in': object_ids}, 'user_id': user_id}
+        
+        # Pending autosaves of these sessions are dropped or written first
+        buffer = get_write_behind()
+        for session_id in ids:
+            if action == 'delete':
+                buffer.discard(session_key(user_id, session_id))
+            elif buffer.pending(session_key(user_id, session_id)):
+                buffer.flush(session_key(user_id, session_id))
+        
+        if action in ('export', 'fetch'):
+            sessions = load_walls(db, list(db.sessions.find(query)))
+        else:
+            sessions = list(db.sessions.find(query, {'_id': 1}))
+        found = {str(session['_id']): session for session in sessions}
+        
+        if action == 'delete' and found:
+            db.sessions.delete_many({'_id': {'$in': [session['_id'] for session in sessions]}, 'user_id': user_id})
+            db[OPS_COLLECTION].delete_many({'session_id': {'$in': list(found)}})
+        elif action == 'rename' and found:
+            now = datetime.utcnow()
+            db.sessions.bulk_write([
+                UpdateOne(
+                    {'_id': session['_id'], 'user_id': user_id},
+                    {'$set': {'session_name': data['names'][session_id], 'updated_at': now}}
+                )
+                for session_id, session in found.items()
+            ], ordered=False)
+        
+        if action == 'fetch':
+            return jsonify({'results': bulk_results(ids, found, lambda s: {'session': serialize_session(s)})}), 200
+        results = bulk_results(ids, found)
+        if action == 'export':
+            response = jsonify({
+                'format': EXPORT_FORMAT,
+                'version': EXPORT_VERSION,
+                'exported_at': datetime.utcnow().isoformat() + 'Z',
+                'sessions': [export_session(found[session_id]) for session_id in ids if session_id in found],
+                'results': results
+            })
+            response.headers['Content-Disposition'] = 'attachment; filename="altarmaker-sessions.json"'
+            return response
+        return jsonify({'results': results}), 200
+        
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/<session_id>/clone', methods=['POST'])
+@require_auth
+def clone_session(session_id):
+    """Copy a session without copying its walls.
+
+    The copy references the parent's wall blobs; editing either one stores
+    new blobs for the walls it changes. Optional body: {"session_name": ...}
+    """
+    try:
+        user_id = request.user_data['user_id']
+        
+        # Validate ObjectId
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+        
+        data = request.get_json(silent=True) or {}
+        validate_clone_payload(data)
+        
+        get_write_behind().flush(session_key(user_id, session_id))
+        parent = db.sessions.find_one({'_id': ObjectId(session_id), 'user_id': user_id})
+        if not parent:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        # Sessions saved before wall blobs embed their walls: move them to
+        # blobs once, so the parent and the copy share them from now on
+        wall_designs, blobs = split_wall_designs(decode_wall_designs(parent.get('wall_designs')))
+        if blobs:
+            save_blobs(db, blobs)
+            db.sessions.update_one(
+                {'_id': parent['_id'], 'updated_at': parent.get('updated_at')},
+                {'$set': {'wall_designs': wall_designs}}
+            )
+            parent['wall_designs'] = wall_designs
+        
+        check_quota(user_id, parent.get('size_bytes') or 0)
+        
+        # A sweep releasing the parent's blobs meanwhile must keep them
+        touch_blobs(db, [parent])
+        session_data = clone_document(parent, user_id, data.get('session_name'))
+        result = db.sessions.insert_one(session_data)
+        session_data['_id'] = result.inserted_id
+        # The walls are the parent's; clients already have them
+        session_data.pop('wall_designs')
+        serialize_session(session_data)
+        
+        return jsonify({
+            'message': 'Session cloned successfully',
+            'session': session_data
+        }), 201
+        
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def wall_response(body, etag, status=200):
+    response = jsonify(body)
+    response.status_code = status
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# What saving one wall reads besides the wall: owner, structure hash inputs and sizes
+WALL_SAVE_FIELDS = ('user_id', 'room_type', 'wall_structure', 'size_bytes', 'wall_sizes')
+
+
+def find_wall(session_id, user_id, wall, *fields):
+    """The session with only ``wall`` (and ``fields``) projected, or None"""
+    get_write_behind().flush(session_key(user_id, session_id))
+    projection = {f'wall_designs.{wall}': 1, **{field: 1 for field in fields}}
+    return db.sessions.find_one({'_id': ObjectId(session_id), 'user_id': user_id}, projection)
+
+
+def stored_wall(session_data, wall):
+    return (session_data.get('wall_designs') or {}).get(wall)
+
+
+def resolved_wall(session_data, wall):
+    """The decoded current wall; the stored form is left for the If-Match guard"""
+    current = stored_wall(session_data, wall)
+    resolved = load_walls(db, [{'wall_designs': {wall: dict(current) if current else None}}])[0]
+    return decode_wall_designs(resolved['wall_designs'])[wall]
+
+
+def check_wall_quota(session_data, wall, design, old_design=None):
+    """The session's size with ``design`` as ``wall``, checked against the
+    quota with the rest of the user's sessions"""
+    size_bytes = replaced_wall_size(session_data, wall, design, old_design)
+    check_quota(session_data['user_id'], size_bytes, exclude_id=session_data['_id'])
+    return size_bytes
+
+
+def save_wall(session_data, wall, design, size_bytes=None):
+    """Replace one wall with ``$set`` on ``wall_designs.<wall>``.
+
+    With If-Match the write only applies if the wall still has the ETag the
+    client sent; otherwise 412 with the current ETag.
+    """
+    current = stored_wall(session_data, wall)
+    query = {'_id': session_data['_id'], 'user_id': session_data['user_id']}
+    if request.if_match:
+        if not request.if_match.contains(wall_etag(current)):
+            return wall_response({'error': 'Wall has been modified'}, wall_etag(current), 412)
+        # Same check in the write itself, against a concurrent save
+        query[f'wall_designs.{wall}'] = current
+    
+    update_data, blobs = wall_update(session_data, wall, design, size_bytes)
+    save_blobs(db, blobs)
+    result = db.sessions.update_one(query, {'$set': update_data})
+    if result.matched_count == 0:
+        return jsonify({'error': 'Wall has been modified'}), 412
+    
+    etag = wall_etag(update_data[f'wall_designs.{wall}'])
+    return wall_response({'message': 'Wall updated successfully', 'etag': etag}, etag)
+
+
+def check_wall_name(wall):
+    if wall not in WALL_NAMES:
+        raise DesignValidationError(f"wall must be one of {', '.join(WALL_NAMES)}")
+
+
+@bp.route('/<session_id>/walls/<wall>', methods=['GET'])
+@require_auth
+def get_session_wall(session_id, wall):
+    """Get one wall of a session, with an ETag of its content"""
+    try:
+        user_id = request.user_data['user_id']
+        
+        # Validate ObjectId
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+        check_wall_name(wall)
+        
+        session_data = find_wall(session_id, user_id, wall)
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        # Revalidation only needs the reference, not the wall itself
+        etag = wall_etag(stored_wall(session_data, wall))
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        load_walls(db, [session_data])
+        design = decode_wall_designs(session_data.get('wall_designs') or {}).get(wall)
+        return wall_response({'wall': wall, 'design': design or empty_wall_designs()[wall]}, etag)
+        
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/<session_id>/walls/<wall>', methods=['PUT'])
+@require_auth
+def put_session_wall(session_id, wall):
+    """Replace one wall of a session; body is the wall ({elements, wallpaper})"""
+    try:
+        user_id = request.user_data['user_id']
+        
+        # Validate ObjectId
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+        check_wall_name(wall)
+        
+        check_payload_size(request_size(), current_app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = request.get_json(silent=True)
+        
+        validate_wall_payload(data)
+        unknown_assets = check_design_assets({wall: data})
+        if unknown_assets:
+            return jsonify({'error': 'Design references unknown catalog assets', 'assets': unknown_assets}), 400
+        
+        session_data = find_wall(session_id, user_id, wall, *WALL_SAVE_FIELDS)
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        # Sessions saved before per-wall sizes measure the wall being replaced
+        recorded = wall in (session_data.get('wall_sizes') or {})
+        old_design = None if recorded else resolved_wall(session_data, wall)
+        size_bytes = check_wall_quota(session_data, wall, data, old_design)
+        
+        return save_wall(session_data, wall, data, size_bytes)
+        
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/<session_id>/walls/<wall>', methods=['PATCH'])
+@require_auth
+def patch_session_wall(session_id, wall):
+    """Edit one wall of a session: {wallpaper?, upsert?: [elements], delete?: [ids]}"""
+    try:
+        user_id = request.user_data['user_id']
+        
+        # Validate ObjectId
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+        check_wall_name(wall)
+        
+        check_payload_size(request_size(), current_app.config['MAX_DESIGN_PAYLOAD_BYTES'])
+        data = request.get_json(silent=True)
+        
+        validate_wall_patch_payload(data)
+        unknown_assets = check_design_assets({wall: {'wallpaper': data.get('wallpaper'), 'elements': data.get('upsert')}})
+        if unknown_assets:
+            return jsonify({'error': 'Design references unknown catalog assets', 'assets': unknown_assets}), 400
+        
+        session_data = find_wall(session_id, user_id, wall, *WALL_SAVE_FIELDS)
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        current = resolved_wall(session_data, wall)
+        design = apply_wall_patch(current, data)
+        validate_wall_payload(design)
+        size_bytes = check_wall_quota(session_data, wall, design, current)
+        
+        return save_wall(session_data, wall, design, size_bytes)
+        
+    except DesignValidationError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/<session_id>/render', methods=['GET'])
+@require_auth
+def render_session(session_id):
+    """Render a wall (or all walls as a contact sheet) to PNG or PDF"""
+    try:
+        user_id = request.user_data['user_id']
+        
+        # Validate ObjectId
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+        
+        wall = request.args.get('wall', 'front')
+        fmt = request.args.get('format', 'png')
+        scale = request.args.get('scale', 1, type=float)
+        max_scale = current_app.config['RENDER_MAX_SCALE']
+        
+        if wall != 'all' and wall not in WALL_NAMES:
+            return jsonify({'error': f"wall must be one of {', '.join(WALL_NAMES)} or all"}), 400
+        if fmt not in FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(FORMATS)}"}), 400
+        if scale is None or not 0 < scale <= max_scale:
+            return jsonify({'error': f'scale must be greater than 0 and at most {max_scale}'}), 400
+        
+        get_write_behind().flush(session_key(user_id, session_id))
+        session_data = db.sessions.find_one(
+            {'_id': ObjectId(session_id), 'user_id': user_id},
+            {'wall_designs': 1, 'session_name': 1}
+        )
+        
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        load_walls(db, [session_data])
+        wall_designs = decode_wall_designs(session_data.get('wall_designs')) or {}
+        names = WALL_NAMES if wall == 'all' else (wall,)
+        walls = [(name, wall_designs.get(name) or {}) for name in names]
+        
+        path, key = get_renderer().render(walls, scale, fmt, get_catalog().public_dir, sheet=wall == 'all')
+        
+        response = send_file(
+            path,
+            mimetype=FORMATS[fmt],
+            download_name=f"{session_data.get('session_name') or 'altar'}-{wall}.{fmt}",
+            etag=key,
+            conditional=True,
+            max_age=0
+        )
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+        
+    except RenderTimeout:
+        return jsonify({'error': 'Render timed out'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/<session_id>/scene.glb', methods=['GET'])
+@require_auth
+def session_scene(session_id):
+    """Compiled 3D scene (wall quads on one texture atlas) as binary glTF"""
+    try:
+        user_id = request.user_data['user_id']
+        
+        # Validate ObjectId
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Invalid session ID'}), 400
+        
+        get_write_behind().flush(session_key(user_id, session_id))
+        session_data = db.sessions.find_one(
+            {'_id': ObjectId(session_id), 'user_id': user_id},
+            {'wall_designs': 1, 'room_dimensions': 1}
+        )
+        
+        if not session_data:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        load_walls(db, [session_data])
+        wall_designs = decode_wall_designs(session_data.get('wall_designs')) or {}
+        room_dimensions = session_data.get('room_dimensions')
+        
+        key = design_hash('scene', SCENE_VERSION, room_dimensions, wall_designs)
+        renderer = get_renderer()
+        job = (room_dimensions, wall_designs, get_catalog().public_dir, renderer.cache_dir)
+        path = renderer.cached(key, 'glb', scene_job, job)
+        
+        response = send_file(path, mimetype='model/gltf-binary', etag=key, conditional=True, max_age=0)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+        
+    except RenderTimeout:
+        return jsonify({'error': 'Scene compilation timed out'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,309 @@
+"""
+Decoration catalog
+
+Indexes the images the editor offers (``frontend/public/images`` and
+``wallpapers``) so the API can list them and check that saved designs only
+reference assets that exist. Each entry carries its category, pixel size,
+dominant colour and content hash; the whole index is serialized once and
+served with an ETag.
+"""
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Folder under the public dir -> kind of asset
+CATALOG_FOLDERS = {
+    'images': 'decoration',
+    'wallpapers': 'wallpaper',
+}
+
+# File name prefix -> (category slug, label shown in the sidebar)
+CATEGORIES = {
+    'flower': ('flowers', 'Flowers'),
+    'garland': ('garlands', 'Garlands'),
+    'candle': ('candles', 'Candles'),
+    'intensestick': ('incense', 'Incense'),
+    'walldecor': ('wall-decorations', 'Wall Decorations'),
+    'table': ('tables', 'Tables'),
+    'carpet': ('carpets', 'Carpets'),
+    'design': ('wallpapers', 'Wallpapers'),
+}
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+ATLAS_THUMBNAIL_SIZE = 256  # Longest side of a catalog image in the sprite atlas
+
+NAME_RE = re.compile(r'^([A-Za-z]+?)[-_]?(\d*)$')
+
+# Coarse colour families used as tags
+COLOUR_FAMILIES = (
+    ('red', 0), ('orange', 30), ('yellow', 55), ('green', 120),
+    ('cyan', 180), ('blue', 225), ('purple', 275), ('pink', 330), ('red', 360),
+)
+
+
+def png_size(path):
+    """Read width/height from a PNG header without decoding the image"""
+    with open(path, 'rb') as fh:
+        header = fh.read(24)
+    if header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+
+def image_info(path):
+    """(width, height, dominant colour) using Pillow when it is installed"""
+    try:
+        from PIL import Image
+    except ImportError:
+        size = png_size(path) if path.lower().endswith('.png') else None
+        return (size[0], size[1], None) if size else (None, None, None)
+
+    with Image.open(path) as image:
+        width, height = image.size
+        image.draft('RGB', (64, 64))
+        thumb = image.convert('RGBA').resize((32, 32))
+
+    # Average of opaque pixels, so transparent backgrounds don't win
+    data = thumb.tobytes()
+    pixels = [data[i:i + 4] for i in range(0, len(data), 4) if data[i + 3] > 128]
+    if not pixels:
+        return width, height, None
+    r, g, b = (sum(p[i] for p in pixels) // len(pixels) for i in range(3))
+    return width, height, f'#{r:02x}{g:02x}{b:02x}'
+
+
+def colour_family(hex_colour):
+    """Name the hue of ``#rrggbb``; greys come out as white/grey/black"""
+    r, g, b = (int(hex_colour[i:i + 2], 16) / 255 for i in (1, 3, 5))
+    high, low = max(r, g, b), min(r, g, b)
+    if high - low < 0.12:
+        return 'white' if high > 0.85 else 'black' if high < 0.2 else 'grey'
+    if high == r:
+        hue = (60 * (g - b) / (high - low)) % 360
+    elif high == g:
+        hue = 60 * (b - r) / (high - low) + 120
+    else:
+        hue = 60 * (r - g) / (high - low) + 240
+    return min(COLOUR_FAMILIES, key=lambda family: abs(family[1] - hue))[0]
+
+
+def file_hash(path):
+    with open(path, 'rb') as fh:
+        return hashlib.sha256(fh.read()).hexdigest()[:16]
+
+
+def build_entry(public_dir, folder, filename):
+    path = os.path.join(public_dir, folder, filename)
+    stem = os.path.splitext(filename)[0]
+    match = NAME_RE.match(stem)
+    prefix = match.group(1).lower() if match else stem.lower()
+    slug, label = CATEGORIES.get(prefix, (prefix, prefix.title()))
+
+    width, height, colour = image_info(path)
+    tags = [slug, CATALOG_FOLDERS[folder]]
+    if colour:
+        tags.append(colour_family(colour))
+
+    return {
+        'id': stem,
+        'src': f'/{folder}/{filename}',
+        'kind': CATALOG_FOLDERS[folder],
+        'category': slug,
+        'category_label': label,
+        'width': width,
+        'height': height,
+        'dominant_color': colour,
+        'hash': file_hash(path),
+        'bytes': os.path.getsize(path),
+        'tags': tags,
+    }
+
+
+def _natural_key(entry):
+    """garland2 before garland10"""
+    match = NAME_RE.match(entry['id'])
+    number = int(match.group(2)) if match and match.group(2) else 0
+    return entry['category'], number, entry['id']
+
+
+class Catalog:
+    """In-memory catalog index, built once on first use"""
+
+    def __init__(self, public_dir):
+        self.public_dir = public_dir
+        self._lock = threading.Lock()
+        self._entries = None
+        self._by_src = {}
+        self._etag = None
+        self._bodies = {}
+
+    def _build(self):
+        entries = []
+        for folder in CATALOG_FOLDERS:
+            root = os.path.join(self.public_dir, folder)
+            if not os.path.isdir(root):
+                continue
+            for filename in os.listdir(root):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    try:
+                        entries.append(build_entry(self.public_dir, folder, filename))
+                    except Exception as e:
+                        logger.error(f"Skipping catalog image {folder}/{filename}: {e}")
+        entries.sort(key=_natural_key)
+
+        digest = hashlib.sha1()
+        for entry in entries:
+            digest.update(f"{entry['src']}:{entry['hash']}".encode())
+
+        self._by_src = {entry['src']: entry for entry in entries}
+        self._etag = digest.hexdigest()
+        self._bodies = {}
+        self._entries = entries
+        logger.info(f"Catalog indexed {len(entries)} assets from {self.public_dir}")
+
+    def ensure_loaded(self):
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    self._build()
+
+    def reload(self):
+        with self._lock:
+            self._build()
+
+    @property
+    def etag(self):
+        self.ensure_loaded()
+        return self._etag
+
+    def entries(self, category=None, tag=None):
+        self.ensure_loaded()
+        return [
+            entry for entry in self._entries
+            if (not category or entry['category'] == category)
+            and (not tag or tag in entry['tags'])
+        ]
+
+    def categories(self):
+        self.ensure_loaded()
+        counts = {}
+        for entry in self._entries:
+            key = (entry['category'], entry['category_label'])
+            counts[key] = counts.get(key, 0) + 1
+        return [{'id': slug, 'label': label, 'count': count} for (slug, label), count in counts.items()]
+
+    def response_body(self, category=None, tag=None):
+        """Serialized JSON for a filter, cached until the catalog reloads"""
+        self.ensure_loaded()
+        key = (category, tag)
+        body = self._bodies.get(key)
+        if body is None:
+            body = json.dumps({
+                'assets': self.entries(category, tag),
+                'categories': self.categories(),
+                'version': self._etag,
+            }, separators=(',', ':')).encode()
+            # Filters come from the query string, so keep the cache bounded
+            if len(self._bodies) < 256:
+                self._bodies[key] = body
+        return body
+
+    def is_catalog_src(self, src):
+        """True if ``src`` points into one of the catalog folders"""
+        return isinstance(src, str) and any(src.startswith(f'/{folder}/') for folder in CATALOG_FOLDERS)
+
+    def get(self, src):
+        self.ensure_loaded()
+        return self._by_src.get(src)
+
+    def unknown_assets(self, wall_designs):
+        """Catalog paths referenced by a design that are not in the catalog.
+
+        Only ``/images/...`` and ``/wallpapers/...`` references are checked;
+        data URLs and other user content pass through.
+        """
+        if not isinstance(wall_designs, dict):
+            return []
+        self.ensure_loaded()
+        unknown = []
+        for wall in wall_designs.values():
+            if not isinstance(wall, dict):
+                continue
+            sources = [wall.get('wallpaper')]
+            sources += [el.get('content') for el in wall.get('elements') or [] if isinstance(el, dict)]
+            for src in sources:
+                if self.is_catalog_src(src) and src not in self._by_src and src not in unknown:
+                    unknown.append(src)
+        return unknown
+
+
+def catalog_atlas_key(entries, size=ATLAS_THUMBNAIL_SIZE):
+    """Atlas key for a set of catalog entries, from their content hashes"""
+    from atlas import atlas_key
+    return atlas_key([f"{entry['src']}:{entry['hash']}" for entry in entries], 'catalog', size)
+
+
+def catalog_atlas_job(job):
+    """Process-pool entry point: pack thumbnails of ``entries`` into a
+    cached atlas keyed by their src, and return its manifest"""
+    from atlas import AtlasCache
+    from PIL import Image
+
+    entries, public_dir, atlas_dir, size = job
+
+    def load_images():
+        images = {}
+        for entry in entries:
+            try:
+                with Image.open(os.path.join(public_dir, entry['src'].lstrip('/'))) as image:
+                    image.draft('RGB', (size, size))
+                    image = image.convert('RGBA')
+                image.thumbnail((size, size), Image.LANCZOS)
+                images[entry['src']] = image
+            except Exception as e:
+                logger.error(f"Skipping {entry['src']} in catalog atlas: {e}")
+        return images
+
+    return AtlasCache(atlas_dir).get_or_build(catalog_atlas_key(entries, size), load_images).manifest
+
+
+def default_public_dir(app):
+    """The build output in production, the Vite public dir in development"""
+    if app.config.get('CATALOG_DIR'):
+        return app.config['CATALOG_DIR']
+    if os.path.isdir(os.path.join(app.static_folder, 'images')):
+        return app.static_folder
+    return os.path.join(app.root_path, '..', 'frontend', 'public')
+
+
+def init_catalog(app):
+    """Attach the catalog and index it in the background unless testing"""
+    app.extensions['catalog'] = catalog = Catalog(default_public_dir(app))
+    if app.config.get('CATALOG_WARM_ON_STARTUP', True) and not app.testing:
+        threading.Thread(target=catalog.ensure_loaded, name='catalog-warmup', daemon=True).start()
+    return catalog
+
+
+def get_catalog():
+    from flask import current_app
+    return current_app.extensions['catalog']
+
+
+def check_design_assets(wall_designs, app=None):
+    """Unknown catalog assets in a design, or [] when validation is disabled.
+
+    ``app`` defaults to Flask's current app; the ASGI server passes its own.
+    """
+    if app is None:
+        from flask import current_app as app
+    if not app.config.get('CATALOG_VALIDATE_ASSETS', True):
+        return []
+    return app.extensions['catalog'].unknown_assets(wall_designs)
@@ -0,0 +1,387 @@
+"""
+Live collaboration on a session
+
+Every open editor tab of a session joins the session's room over a
+WebSocket (``asgi.py``) and sends element operations instead of whole
+designs:
+
+- ``upsert`` an element (by id) on a wall, ``delete`` one, or set a wall's
+  ``wallpaper``
+- each op carries the sender's ``counter`` (per client, increasing) and a
+  Lamport clock ``lamport``
+
+The room keeps a version vector (highest counter applied per client), so a
+resent op is applied once, and a last-writer-wins register per element
+ordered by (lamport, client), so concurrent edits of one element converge on
+every tab. Ops for different elements never conflict.
+
+Accepted ops are batched for ``batch_interval`` seconds and coalesced per
+element before they are broadcast and appended to the ``session_ops`` log, so
+a drag sends one op per batch rather than one per mouse move. The log is
+folded into the session document (``compact``) every ``compact_every`` ops
+and when the last tab leaves. The log then only keeps what arrived since,
+and a room reopening after a crash replays it.
+
+Rooms are plain asyncio objects: one flush task each and no threads, so a
+process can hold hundreds of them.
+"""
+import asyncio
+import copy
+import json
+import uuid
+from collections import deque
+from datetime import datetime
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+OPS_COLLECTION = 'session_ops'
+
+BATCH_INTERVAL = 0.05  # Seconds of ops gathered into one broadcast
+COMPACT_EVERY = 500  # Logged ops before they are folded into the session
+COMPACT_ATTEMPTS = 3  # Folds retried when a save lands between read and write
+CLOSE_GRACE = 5  # Seconds an empty room waits for a reconnect
+RECENT_OPS = 2000  # Broadcast ops kept for reconnecting tabs
+SEND_QUEUE = 256  # Messages buffered per tab before it is dropped
+
+WALLPAPER = '#wallpaper'  # Register key of a wall's wallpaper
+
+
+def op_key(op):
+    return op['wall'], WALLPAPER if op['op'] == 'wallpaper' else op['id']
+
+
+def op_patch(op):
+    """The op as a wall PATCH body (``documents.apply_wall_patch``)"""
+    if op['op'] == 'upsert':
+        return {'upsert': [op['element']]}
+    if op['op'] == 'delete':
+        return {'delete': [op['id']]}
+    return {'wallpaper': op.get('wallpaper')}
+
+
+class Room:
+    """Ordering state of one session's room; no I/O"""
+
+    def __init__(self, session_id, user_id, seq=0, lamport=0):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.seq = seq
+        self.compacted_seq = seq
+        self.trimmed_seq = seq  # Ops up to here are only in the session document
+        self.lamport = lamport
+        self.vector = {}
+        self.registers = {}
+        self.pending = {}
+        self.recent = deque(maxlen=RECENT_OPS)
+        self.unsaved = []
+        self.connections = set()
+        self.wake = asyncio.Event()
+        self.lock = asyncio.Lock()  # Serialises flushes and compaction
+        self.task = None
+        self.closing = None
+        self.closed = False
+
+    def apply(self, op):
+        """Apply a client op; the op with its ``seq`` if it won, else None"""
+        client, counter = op['client'], op['counter']
+        if counter <= self.vector.get(client, 0):
+            return None  # Already applied (resent after a reconnect)
+        self.vector[client] = counter
+        self.lamport = max(self.lamport, op['lamport'])
+
+        key = op_key(op)
+        stamp = (op['lamport'], client)
+        if key in self.registers and self.registers[key] >= stamp:
+            return None  # A later write to this element already won
+        self.registers[key] = stamp
+        self.seq += 1
+        op = dict(op, seq=self.seq)
+        # A newer op for the same element replaces one not yet broadcast
+        self.pending.pop(key, None)
+        self.pending[key] = op
+        self.wake.set()
+        return op
+
+    def replay(self, op):
+        """Restore a logged op when the room opens"""
+        self.vector[op['client']] = max(self.vector.get(op['client'], 0), op['counter'])
+        self.registers[op_key(op)] = (op['lamport'], op['client'])
+        self.seq = max(self.seq, op['seq'])
+        self.lamport = max(self.lamport, op['lamport'])
+        self.recent.append(op)
+
+    def take_pending(self):
+        ops = sorted(self.pending.values(), key=lambda op: op['seq'])
+        self.pending = {}
+        for op in ops:
+            if len(self.recent) == self.recent.maxlen:
+                self.trimmed_seq = self.recent[0]['seq']
+            self.recent.append(op)
+        return ops
+
+    def since(self, seq):
+        """Broadcast ops after ``seq``, or None if they are no longer kept.
+
+        Coalescing leaves gaps in the sequence, so this only tells a tab to
+        reload when ops it has not seen were dropped from ``recent``.
+        """
+        if seq < self.trimmed_seq:
+            return None
+        return [op for op in self.recent if op['seq'] > seq]
+
+    def hello(self, client):
+        return {'type': 'hello', 'client': client, 'seq': self.seq, 'lamport': self.lamport, 'vector': self.vector}
+
+
+class Connection:
+    """One tab: its client id and outgoing message queue"""
+
+    def __init__(self, client=None):
+        self.client = client or uuid.uuid4().hex[:12]
+        self.queue = asyncio.Queue(maxsize=SEND_QUEUE)
+        self.dropped = False
+
+    def send(self, message):
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too slow to keep up: stop feeding it, it resyncs on reconnect
+            self.dropped = True
+            self.queue = asyncio.Queue()
+            self.queue.put_nowait(json.dumps({'type': 'resync'}))
+            self.queue.put_nowait(None)
+
+    def close(self):
+        self.send(None)
+
+
+class CollabHub:
+    """All rooms of this process, keyed by session id"""
+
+    def __init__(self, store, batch_interval=BATCH_INTERVAL, compact_every=COMPACT_EVERY, close_grace=CLOSE_GRACE):
+        self.store = store
+        self.batch_interval = batch_interval
+        self.compact_every = compact_every
+        self.close_grace = close_grace
+        self.rooms = {}
+        self._opening = {}
+        self._closing = {}
+
+    async def join(self, session_id, user_id, client=None):
+        """(room, connection) for a tab, or (None, None) if the session is not the user's"""
+        if not await self.store.owns(session_id, user_id):
+            return None, None
+        room = self.rooms.get(session_id)
+        if room is None:
+            # One loader per session even if several tabs join at once
+            opening = self._opening.get(session_id)
+            if opening is None:
+                opening = self._opening[session_id] = asyncio.ensure_future(self._open(session_id, user_id))
+                opening.add_done_callback(lambda _: self._opening.pop(session_id, None))
+            room = await asyncio.shield(opening)
+        if room.closing:
+            room.closing.cancel()
+            room.closing = None
+        connection = Connection(client)
+        room.connections.add(connection)
+        connection.send(json.dumps(room.hello(connection.client)))
+        return room, connection
+
+    async def _open(self, session_id, user_id):
+        # A room closing for the same session must have logged its ops first
+        if session_id in self._closing:
+            await asyncio.shield(self._closing[session_id])
+        state = await self.store.load(session_id, user_id)
+        room = Room(session_id, user_id, state.get('ops_seq', 0), state.get('ops_lamport', 0))
+        # Ops logged but not compacted before the last shutdown
+        for op in await self.store.logged_ops(session_id, room.seq):
+            room.replay(op)
+        room.task = asyncio.ensure_future(self._run(room))
+        self.rooms[session_id] = room
+        return room
+
+    def leave(self, room, connection):
+        room.connections.discard(connection)
+        if not room.connections and room.closing is None and not room.closed:
+            room.closing = asyncio.ensure_future(self._close_later(room))
+
+    def submit(self, room, connection, ops):
+        """Apply ops from a tab; returns how many were accepted"""
+        accepted = 0
+        for op in ops:
+            op = dict(op, client=connection.client)
+            if op['op'] == 'upsert':
+                op['id'] = op['element']['id']  # The register is the element's
+            if room.apply(op) is not None:
+                accepted += 1
+        return accepted
+
+    def resend(self, room, connection, since):
+        ops = room.since(since)
+        if ops is None:
+            connection.send(json.dumps({'type': 'resync'}))
+        elif ops:
+            connection.send(json.dumps({'type': 'ops', 'ops': ops}))
+
+    async def _run(self, room):
+        while True:
+            await room.wake.wait()
+            await asyncio.sleep(self.batch_interval)
+            room.wake.clear()
+            await self.flush(room)
+
+    async def flush(self, room):
+        async with room.lock:
+            ops = room.take_pending()
+            if ops:
+                message = json.dumps({'type': 'ops', 'ops': ops})
+                for connection in list(room.connections):
+                    connection.send(message)
+                room.unsaved.extend(ops)
+            if room.unsaved:
+                try:
+                    await self.store.append(room.session_id, room.unsaved)
+                    room.unsaved = []
+                except Exception as e:
+                    logger.error(f"Failed to log ops for session {room.session_id}, will retry: {e}")
+                    return
+            if room.seq - room.compacted_seq >= self.compact_every:
+                await self._compact(room)
+
+    async def _compact(self, room):
+        try:
+            await self.store.compact(room.session_id, room.user_id, room.seq, room.lamport)
+            room.compacted_seq = room.seq
+        except Exception as e:
+            logger.error(f"Failed to compact ops for session {room.session_id}: {e}")
+
+    async def _close_later(self, room):
+        await asyncio.sleep(self.close_grace)
+        room.closing = None
+        await asyncio.shield(self.close(room))
+
+    def close(self, room):
+        """Flush, compact and forget a room; returns the closing future"""
+        if room.closed:
+            return self._closing.get(room.session_id) or asyncio.sleep(0)
+        room.closed = True
+        if self.rooms.get(room.session_id) is room:
+            del self.rooms[room.session_id]
+        closing = self._closing[room.session_id] = asyncio.ensure_future(self._close(room))
+        closing.add_done_callback(
+            lambda _: self._closing.pop(room.session_id, None) if self._closing.get(room.session_id) is closing else None
+        )
+        return closing
+
+    async def _close(self, room):
+        if room.task:
+            room.task.cancel()
+        await self.flush(room)
+        async with room.lock:
+            if room.seq > room.compacted_seq and not room.unsaved:
+                await self._compact(room)
+        for connection in list(room.connections):
+            connection.close()
+
+    async def shutdown(self):
+        """Flush and compact every room, e.g. when the server stops"""
+        closing = [self.close(room) for room in list(self.rooms.values())]
+        await asyncio.gather(*closing, *self._closing.values(), return_exceptions=True)
+
+
+class MongoOpStore:
+    """Motor persistence for the hub: ownership, the op log and compaction.
+
+    ``writes`` is the app's ``AsyncWriteBehind``: a pending autosave of the
+    session is written before ops are folded on top of it.
+    """
+
+    def __init__(self, db, writes=None):
+        self.db = db
+        self.writes = writes
+
+    async def owns(self, session_id, user_id):
+        from bson import ObjectId
+        return await self.db.sessions.count_documents({'_id': ObjectId(session_id), 'user_id': user_id}, limit=1) > 0
+
+    async def load(self, session_id, user_id):
+        from bson import ObjectId
+        return await self.db.sessions.find_one(
+            {'_id': ObjectId(session_id), 'user_id': user_id}, {'ops_seq': 1, 'ops_lamport': 1}
+        ) or {}
+
+    async def logged_ops(self, session_id, after_seq):
+        cursor = self.db[OPS_COLLECTION].find(
+            {'session_id': session_id, 'seq': {'$gt': after_seq}}, {'_id': 0, 'session_id': 0, 'created_at': 0}
+        ).sort('seq', 1)
+        return [op async for op in cursor]
+
+    async def append(self, session_id, ops):
+        now = datetime.utcnow()
+        documents = [dict(op, session_id=session_id, created_at=now) for op in ops]
+        try:
+            await self.db[OPS_COLLECTION].insert_many(documents, ordered=False)
+        except Exception as e:
+            # A retry after a partial write hits the (session_id, seq) index
+            from pymongo.errors import BulkWriteError
+            if not isinstance(e, BulkWriteError) or any(
+                error.get('code') != 11000 for error in e.details.get('writeErrors', [])
+            ):
+                raise
+
+    async def compact(self, session_id, user_id, upto_seq, lamport):
+        """Fold logged ops up to ``upto_seq`` into the session's walls"""
+        from bson import ObjectId
+        from documents import apply_wall_patch, replaced_wall_size, wall_update
+        from element_codec import decode_wall_designs
+        from wall_store import load_walls_async, save_blobs_async
+        from write_behind import session_key
+
+        if self.writes is not None:
+            await self.writes.flush(session_key(user_id, session_id))
+        query = {'_id': ObjectId(session_id), 'user_id': user_id}
+        for _ in range(COMPACT_ATTEMPTS):
+            session_data = await self.db.sessions.find_one(
+                query, {'wall_designs': 1, 'room_type': 1, 'wall_structure': 1, 'size_bytes': 1, 'wall_sizes': 1,
+                        'ops_seq': 1, 'updated_at': 1}
+            )
+            if not session_data:
+                return
+            ops = [op for op in await self.logged_ops(session_id, session_data.get('ops_seq', 0))
+                   if op['seq'] <= upto_seq]
+
+            update = {'ops_seq': upto_seq, 'ops_lamport': lamport}
+            # Stored form of the walls the ops touch; they must still match when written
+            stored = session_data.get('wall_designs') or {}
+            guard = {'updated_at': session_data.get('updated_at')}
+            guard.update({f'wall_designs.{op["wall"]}': copy.deepcopy(stored.get(op['wall'])) for op in ops})
+            if ops:
+                await load_walls_async(self.db, [session_data])
+                wall_designs = decode_wall_designs(session_data.get('wall_designs')) or {}
+                touched = {}
+                for op in ops:
+                    wall = touched.get(op['wall'], wall_designs.get(op['wall']))
+                    touched[op['wall']] = apply_wall_patch(wall, op_patch(op))
+                for wall, design in touched.items():
+                    size_bytes = replaced_wall_size(session_data, wall, design, wall_designs.get(wall))
+                    wall_set, blobs = wall_update(session_data, wall, design, size_bytes)
+                    await save_blobs_async(self.db, blobs)
+                    update.update(wall_set)
+                    if f'wall_structure.{wall}' in wall_set:
+                        session_data['wall_structure'][wall] = wall_set[f'wall_structure.{wall}']
+                    session_data['size_bytes'] = size_bytes
+                    session_data['wall_sizes'] = dict(session_data.get('wall_sizes') or {},
+                                                      **{wall: wall_set[f'wall_sizes.{wall}']})
+
+            # A save that landed since the read would be overwritten: fold again on top of it
+            result = await self.db.sessions.update_one(dict(query, **guard), {'$set': update})
+            if result.matched_count:
+                break
+        else:
+            raise RuntimeError(f"saves kept landing during {COMPACT_ATTEMPTS} attempts; the ops stay logged")
+        await self.db[OPS_COLLECTION].delete_many({'session_id': session_id, 'seq': {'$lte': upto_seq}})
+        logger.info(f"Compacted {len(ops)} ops into session {session_id} (seq {upto_seq})")
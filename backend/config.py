@@ -1,7 +1,6 @@
 import os
+from datetime import timedelta
 from dotenv import load_dotenv
-import logging
-from logging import StreamHandler
 # Load environment variables
 load_dotenv()
 
@@ -14,9 +13,13 @@ class Config:
     
     # MongoDB Configuration
     MONGO_URI = os.getenv('MONGO_URI')
+    MONGO_DBNAME = 'altarmaker'
+    # Import path of the client class; tests swap in mongomock
+    MONGO_CLIENT_FACTORY = 'pymongo.MongoClient'
     
     # Session Configuration
     SESSION_EXPIRATION = 24 * 60 * 60  # 24 hours
+    PERMANENT_SESSION_LIFETIME = timedelta(seconds=SESSION_EXPIRATION)
     
     # CORS Configuration
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*').split(',')
@@ -34,8 +37,85 @@ class Config:
     
     # Application Configuration
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    MAX_DESIGN_PAYLOAD_BYTES = int(os.getenv('MAX_DESIGN_PAYLOAD_BYTES', 8 * 1024 * 1024))  # Per save
+    USER_STORAGE_QUOTA_BYTES = int(os.getenv('USER_STORAGE_QUOTA_BYTES', 100 * 1024 * 1024))  # Across sessions
     APP_URL = os.getenv('APP_URL', 'http://localhost:3000')  # Frontend URL
     
+    # Static Files
+    STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', 3600))  # Non-fingerprinted files
+    # When set (e.g. /_static), nginx streams files via X-Accel-Redirect
+    STATIC_X_ACCEL_PREFIX = os.getenv('STATIC_X_ACCEL_PREFIX')
+    
+    # Catalog Configuration
+    CATALOG_DIR = os.getenv('CATALOG_DIR')  # Defaults to the build, then frontend/public
+    CATALOG_VALIDATE_ASSETS = os.getenv('CATALOG_VALIDATE_ASSETS', 'true').lower() == 'true'
+    
+    # Render/Export Configuration
+    RENDER_CACHE_DIR = os.getenv('RENDER_CACHE_DIR')  # Defaults to instance/render_cache
+    RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', 2))
+    RENDER_TIMEOUT = int(os.getenv('RENDER_TIMEOUT', 60))  # Seconds
+    RENDER_MAX_SCALE = 4  # 3600x2400 per wall
+    
+    # Template Library Configuration
+    TEMPLATE_REFRESH_SECONDS = int(os.getenv('TEMPLATE_REFRESH_SECONDS', 600))
+    TEMPLATE_MIN_USERS = int(os.getenv('TEMPLATE_MIN_USERS', 3))  # Distinct users before a design is listed
+    TEMPLATE_LIMIT = 50
+    
+    # Write-Behind Configuration (autosave coalescing, 0 writes every save)
+    WRITE_BEHIND_SECONDS = float(os.getenv('WRITE_BEHIND_SECONDS', 0))  # Quiet time before a save is written
+    WRITE_BEHIND_MAX_DELAY = float(os.getenv('WRITE_BEHIND_MAX_DELAY', 5.0))  # Longest a save stays pending
+    # Pending saves are per worker: a window is only used when each user is routed to one worker
+    WRITE_BEHIND_PINNED = os.getenv('WRITE_BEHIND_PINNED', 'false').lower() == 'true'
+    
+    # Live Editing Configuration (asgi.py)
+    LIVE_BATCH_SECONDS = float(os.getenv('LIVE_BATCH_SECONDS', 0.05))  # Ops gathered per broadcast
+    LIVE_COMPACT_EVERY = int(os.getenv('LIVE_COMPACT_EVERY', 500))  # Logged ops folded into the session
+    
+    # User Deletion Configuration (user_deletion.py)
+    DELETION_WORKER_ENABLED = os.getenv('DELETION_WORKER_ENABLED', 'true').lower() == 'true'  # Off: jobs only queue
+    DELETION_BATCH_SIZE = int(os.getenv('DELETION_BATCH_SIZE', 500))  # Documents deleted per batch
+    DELETION_BATCH_PAUSE = float(os.getenv('DELETION_BATCH_PAUSE', 0.05))  # Seconds between batches
+    DELETION_POLL_SECONDS = int(os.getenv('DELETION_POLL_SECONDS', 30))  # Checks for jobs queued by other workers
+    DELETION_SWEEP_SECONDS = int(os.getenv('DELETION_SWEEP_SECONDS', 3600))  # Orphaned data sweep, 0 disables
+    DELETION_STALE_SECONDS = int(os.getenv('DELETION_STALE_SECONDS', 300))  # Running jobs without a heartbeat are retried
+    
+    # Maintenance Configuration (maintenance.py)
+    MAINTENANCE_INTERVAL_SECONDS = int(os.getenv('MAINTENANCE_INTERVAL_SECONDS', 0))  # 0 disables scheduled runs
+    MAINTENANCE_LEASE_SECONDS = int(os.getenv('MAINTENANCE_LEASE_SECONDS', 3600))  # Longest a run holds the lease
+    MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', 500))
+    MAINTENANCE_DUTY_CYCLE = float(os.getenv('MAINTENANCE_DUTY_CYCLE', 0.2))  # Share of wall time a sweep may use
+    MAINTENANCE_BLOB_GRACE_SECONDS = int(os.getenv('MAINTENANCE_BLOB_GRACE_SECONDS', 3600))
+    MAINTENANCE_UNVERIFIED_DAYS = int(os.getenv('MAINTENANCE_UNVERIFIED_DAYS', 30))  # Unverified accounts kept
+    # Off: the unverified_accounts sweep only counts the accounts it would delete
+    MAINTENANCE_DELETE_UNVERIFIED = os.getenv('MAINTENANCE_DELETE_UNVERIFIED', 'false').lower() == 'true'
+    VERIFICATION_TOKEN_MAX_AGE = int(os.getenv('VERIFICATION_TOKEN_MAX_AGE', 86400))  # Seconds
+    RENDER_CACHE_MAX_AGE_DAYS = int(os.getenv('RENDER_CACHE_MAX_AGE_DAYS', 30))  # Unused renders kept
+    
+    # Metrics Configuration (metrics.py, GET /metrics)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # Bearer token the scraper must send, if set
+    
+    # Slow Query Log Configuration (slow_queries.py)
+    SLOW_QUERY_ENABLED = os.getenv('SLOW_QUERY_ENABLED', 'true').lower() == 'true'
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))  # Commands at least this slow are logged
+    SLOW_QUERY_EXPLAIN_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', 0.1))  # Share of them explained
+    SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG')  # Defaults to instance/slow_queries.jsonl
+    
+    # Logging Configuration (structured_logging.py)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # json or text
+    LOG_FILE = os.getenv('LOG_FILE')  # Also write here, besides stderr
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # Records waiting to be written; more are dropped
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1.0))  # Share of DEBUG records kept
+    LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')  # e.g. "renderer=0.1,write_behind=0.5"
+    
+    # Tracing Configuration (tracing.py)
+    TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.1))  # Share of requests traced without a traceparent
+    TRACE_ENDPOINT = os.getenv('TRACE_ENDPOINT')  # OTLP/HTTP URL, e.g. http://localhost:4318/v1/traces
+    TRACE_FILE = os.getenv('TRACE_FILE')  # Used without an endpoint; defaults to instance/traces.jsonl
+    TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'altarmaker')
+    
     @staticmethod
     def init_app(app):
         """Initialize application with configuration"""
@@ -44,23 +124,29 @@ class Config:
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
     
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
+    MAINTENANCE_INTERVAL_SECONDS = int(os.getenv('MAINTENANCE_INTERVAL_SECONDS', 86400))  # Daily
     
     @classmethod
     def init_app(cls, app):
         Config.init_app(app)
-        
-        file_handler = StreamHandler()
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
 
 class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
+    SECRET_KEY = os.getenv('SECRET_KEY', 'testing-secret-key')
     MONGO_URI = 'mongodb://localhost:27017/altarmaker_test'
+    MONGO_DBNAME = 'altarmaker_test'
+    # In-memory MongoDB so tests run without a server
+    MONGO_CLIENT_FACTORY = 'mongomock.MongoClient'
+    # No background threads: saves are written in the request, jobs run when a test asks
+    WRITE_BEHIND_SECONDS = 0
+    MAINTENANCE_INTERVAL_SECONDS = 0
+    DELETION_WORKER_ENABLED = False
 
 # Configuration dictionary
 config = {
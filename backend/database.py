@@ -7,8 +7,6 @@ import logging
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
@@ -52,6 +50,23 @@ class DatabaseManager:
             self.db.sessions.create_index("user_id")
             self.db.sessions.create_index("created_at")
             self.db.sessions.create_index([("user_id", 1), ("created_at", -1)])
+            self.db.sessions.create_index(
+                [("structure_hash", 1), ("updated_at", -1)],
+                partialFilterExpression={"structure_hash": {"$type": "string"}}
+            )
+
+            # Live-editing op log (collab.py)
+            self.db.session_ops.create_index([("session_id", 1), ("seq", 1)], unique=True)
+
+            # Blob references, so deleting sessions can release unreferenced blobs
+            for wall in ("front", "back", "left", "right"):
+                self.db.sessions.create_index(f"wall_designs.{wall}.ref", sparse=True)
+
+            # User deletion jobs (user_deletion.py)
+            self.db.deletion_jobs.create_index([("status", 1), ("created_at", 1)])
+
+            # Maintenance run reports (maintenance.py)
+            self.db.maintenance_runs.create_index([("started_at", -1)])
             
 
             
@@ -113,6 +128,23 @@ def init_database():
             db.sessions.create_index("user_id")
             db.sessions.create_index("created_at")
             db.sessions.create_index([("user_id", 1), ("created_at", -1)])
+            db.sessions.create_index(
+                [("structure_hash", 1), ("updated_at", -1)],
+                partialFilterExpression={"structure_hash": {"$type": "string"}}
+            )
+
+            # Live-editing op log (collab.py)
+            db.session_ops.create_index([("session_id", 1), ("seq", 1)], unique=True)
+
+            # Blob references, so deleting sessions can release unreferenced blobs
+            for wall in ("front", "back", "left", "right"):
+                db.sessions.create_index(f"wall_designs.{wall}.ref", sparse=True)
+
+            # User deletion jobs (user_deletion.py)
+            db.deletion_jobs.create_index([("status", 1), ("created_at", 1)])
+
+            # Maintenance run reports (maintenance.py)
+            db.maintenance_runs.create_index([("started_at", -1)])
             
             # Wall designs collection indexes (new)
             db.wall_designs.create_index("user_id")
@@ -0,0 +1,292 @@
+"""
+Schema validation and size budgets for design payloads
+
+The JSON schemas for walls, elements, wallpaper and room dimensions are
+compiled once at import with fastjsonschema, so validating a save costs a
+single generated-function call. Limits:
+
+- ``MAX_ELEMENTS_PER_WALL`` elements per wall
+- ``MAX_DESIGN_PAYLOAD_BYTES`` per request (config, checked before parsing)
+- ``USER_STORAGE_QUOTA_BYTES`` across a user's saved sessions (config)
+"""
+import fastjsonschema
+
+from documents import WALL_NAMES
+
+MAX_ELEMENTS_PER_WALL = 500
+MAX_GEOMETRY_ELEMENTS = 10000  # Ad-hoc element lists sent to /api/designs/geometry
+MAX_SOURCE_LENGTH = 2 * 1024 * 1024  # data URLs of cropped frame images
+MAX_NAME_LENGTH = 200
+MAX_COORDINATE = 100000
+MAX_ROOM_SIZE = 1000
+MAX_LIVE_OPS = 200  # Element ops in one live-editing message
+MAX_BULK_IDS = 500  # Sessions in one /api/sessions/bulk request
+
+
+class DesignValidationError(Exception):
+    """Raised when a design payload is rejected"""
+
+    def __init__(self, message, path=None, status=400):
+        super().__init__(message)
+        self.message = message
+        self.path = path
+        self.status = status
+
+    def to_dict(self):
+        error = 'Design payload too large' if self.status == 413 else 'Invalid design payload'
+        body = {'error': error, 'details': self.message}
+        if self.path:
+            body['path'] = self.path
+        return body
+
+
+NUMBER = {'type': 'number', 'minimum': -MAX_COORDINATE, 'maximum': MAX_COORDINATE}
+SIZE = {'type': 'number', 'minimum': 0, 'maximum': MAX_COORDINATE}
+SOURCE = {'type': ['string', 'null'], 'maxLength': MAX_SOURCE_LENGTH}
+SHORT_STRING = {'type': ['string', 'null'], 'maxLength': MAX_NAME_LENGTH}
+
+ELEMENT_SCHEMA = {
+    'type': 'object',
+    'required': ['id', 'type', 'x', 'y', 'width', 'height'],
+    'properties': {
+        'id': {'type': ['string', 'number'], 'maxLength': 64},
+        'type': {'type': 'string', 'maxLength': 32},
+        'content': SOURCE,
+        'x': NUMBER,
+        'y': NUMBER,
+        'width': SIZE,
+        'height': SIZE,
+        'rotation': {'type': 'number'},
+        'frameType': SHORT_STRING,
+        'frameTheme': SHORT_STRING,
+        'borderColor': SHORT_STRING,
+    },
+    'maxProperties': 32,
+}
+
+WALL_SCHEMA = {
+    'type': ['object', 'null'],
+    'properties': {
+        'elements': {'type': 'array', 'maxItems': MAX_ELEMENTS_PER_WALL, 'items': ELEMENT_SCHEMA},
+        'wallpaper': SOURCE,
+    },
+    'additionalProperties': False,
+}
+
+WALL_DESIGNS_SCHEMA = {
+    'type': ['object', 'null'],
+    'propertyNames': {'enum': list(WALL_NAMES)},
+    'additionalProperties': WALL_SCHEMA,
+}
+
+ROOM_DIMENSIONS_SCHEMA = {
+    'type': ['object', 'null'],
+    'properties': {
+        'length': {'type': 'number', 'minimum': 0, 'maximum': MAX_ROOM_SIZE},
+        'width': {'type': 'number', 'minimum': 0, 'maximum': MAX_ROOM_SIZE},
+        'height': {'type': 'number', 'minimum': 0, 'maximum': MAX_ROOM_SIZE},
+    },
+    'additionalProperties': False,
+}
+
+# POST/PUT /api/sessions bodies
+SESSION_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'session_name': SHORT_STRING,
+        'room_type': SHORT_STRING,
+        'room_dimensions': ROOM_DIMENSIONS_SCHEMA,
+        'wall_designs': WALL_DESIGNS_SCHEMA,
+        'selected_wall': SHORT_STRING,
+    },
+}
+
+# POST /api/designs/wall-designs bodies
+WALL_DESIGN_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'wallDesigns': WALL_DESIGNS_SCHEMA,
+        'roomType': SHORT_STRING,
+        'roomDimensions': ROOM_DIMENSIONS_SCHEMA,
+        'selectedWall': SHORT_STRING,
+    },
+}
+
+# POST /api/designs/geometry bodies
+GEOMETRY_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'elements': {'type': 'array', 'maxItems': MAX_GEOMETRY_ELEMENTS, 'items': ELEMENT_SCHEMA},
+        'session_id': {'type': 'string', 'maxLength': 24},
+        'wall': {'enum': list(WALL_NAMES)},
+        'room_dimensions': ROOM_DIMENSIONS_SCHEMA,
+        'queries': {
+            'type': 'array',
+            'items': {'enum': ['overlaps', 'out_of_bounds', 'nearest', 'guides']},
+            'uniqueItems': True,
+        },
+        'k': {'type': 'integer', 'minimum': 1, 'maximum': 16},
+        'tolerance': {'type': 'number', 'minimum': 0, 'maximum': 100},
+    },
+}
+
+# PUT /api/sessions/<id>/walls/<wall> bodies
+WALL_PUT_SCHEMA = dict(WALL_SCHEMA, type='object')
+
+# PATCH /api/sessions/<id>/walls/<wall> bodies
+WALL_PATCH_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'wallpaper': SOURCE,
+        'upsert': {'type': 'array', 'maxItems': MAX_ELEMENTS_PER_WALL, 'items': ELEMENT_SCHEMA},
+        'delete': {'type': 'array', 'maxItems': MAX_ELEMENTS_PER_WALL, 'items': {'type': ['string', 'number']}},
+    },
+    'additionalProperties': False,
+}
+
+# POST /api/sessions/<id>/clone bodies
+CLONE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'session_name': SHORT_STRING,
+    },
+    'additionalProperties': False,
+}
+
+# POST /api/sessions/bulk bodies: ids, or names by id for rename
+BULK_SCHEMA = {
+    'type': 'object',
+    'required': ['action'],
+    'properties': {
+        'action': {'enum': ['delete', 'rename', 'export', 'fetch']},
+        'ids': {'type': 'array', 'maxItems': MAX_BULK_IDS, 'items': {'type': 'string', 'maxLength': 64}},
+        'names': {
+            'type': 'object',
+            'maxProperties': MAX_BULK_IDS,
+            'additionalProperties': {'type': 'string', 'minLength': 1, 'maxLength': MAX_NAME_LENGTH},
+        },
+    },
+    'additionalProperties': False,
+    'if': {'properties': {'action': {'const': 'rename'}}},
+    'then': {'required': ['names']},
+    'else': {'required': ['ids']},
+}
+
+# Messages a tab sends on /api/sessions/<id>/live (see collab.py)
+LIVE_OP_SCHEMA = {
+    'type': 'object',
+    'required': ['op', 'wall', 'counter', 'lamport'],
+    'properties': {
+        'op': {'enum': ['upsert', 'delete', 'wallpaper']},
+        'wall': {'enum': list(WALL_NAMES)},
+        'id': {'type': ['string', 'number'], 'maxLength': 64},
+        'element': ELEMENT_SCHEMA,
+        'wallpaper': SOURCE,
+        'counter': {'type': 'integer', 'minimum': 1},
+        'lamport': {'type': 'integer', 'minimum': 0},
+    },
+    'additionalProperties': False,
+    'allOf': [
+        {'if': {'properties': {'op': {'const': 'upsert'}}}, 'then': {'required': ['element']}},
+        {'if': {'properties': {'op': {'const': 'delete'}}}, 'then': {'required': ['id']}},
+        {'if': {'properties': {'op': {'const': 'wallpaper'}}}, 'then': {'required': ['wallpaper']}},
+    ],
+}
+
+LIVE_MESSAGE_SCHEMA = {
+    'type': 'object',
+    'required': ['type'],
+    'properties': {
+        'type': {'enum': ['ops', 'since']},
+        'ops': {'type': 'array', 'maxItems': MAX_LIVE_OPS, 'items': LIVE_OP_SCHEMA},
+        'seq': {'type': 'integer', 'minimum': 0},
+    },
+    'additionalProperties': False,
+}
+
+_validate_session = fastjsonschema.compile(SESSION_SCHEMA)
+_validate_wall_design = fastjsonschema.compile(WALL_DESIGN_SCHEMA)
+_validate_geometry = fastjsonschema.compile(GEOMETRY_SCHEMA)
+_validate_clone = fastjsonschema.compile(CLONE_SCHEMA)
+_validate_wall_put = fastjsonschema.compile(WALL_PUT_SCHEMA)
+_validate_wall_patch = fastjsonschema.compile(WALL_PATCH_SCHEMA)
+_validate_live_message = fastjsonschema.compile(LIVE_MESSAGE_SCHEMA)
+_validate_bulk = fastjsonschema.compile(BULK_SCHEMA)
+
+
+def _run(validator, data):
+    if not isinstance(data, dict):
+        raise DesignValidationError('Request body must be a JSON object')
+    try:
+        validator(data)
+    except fastjsonschema.JsonSchemaValueException as e:
+        raise DesignValidationError(e.message, path=e.name)
+
+
+def validate_session_payload(data):
+    """Validate a session save/update body, raising DesignValidationError"""
+    _run(_validate_session, data)
+
+
+def validate_wall_design_payload(data):
+    """Validate a wall-designs save body, raising DesignValidationError"""
+    _run(_validate_wall_design, data)
+
+
+def validate_geometry_payload(data):
+    """Validate a geometry query body, raising DesignValidationError"""
+    _run(_validate_geometry, data)
+
+
+def validate_wall_payload(data):
+    """Validate a single-wall PUT body, raising DesignValidationError"""
+    _run(_validate_wall_put, data)
+
+
+def validate_wall_patch_payload(data):
+    """Validate a single-wall PATCH body, raising DesignValidationError"""
+    _run(_validate_wall_patch, data)
+
+
+def validate_clone_payload(data):
+    """Validate a session clone body, raising DesignValidationError"""
+    _run(_validate_clone, data)
+
+
+def validate_bulk_payload(data):
+    """Validate a bulk session request body, raising DesignValidationError"""
+    _run(_validate_bulk, data)
+
+
+def validate_live_message(data):
+    """Validate a live-editing message, raising DesignValidationError"""
+    _run(_validate_live_message, data)
+
+
+def check_payload_size(size_bytes, limit):
+    """Reject request bodies over the per-request budget"""
+    if limit and size_bytes is not None and size_bytes > limit:
+        raise DesignValidationError(
+            f'Design payload is {size_bytes} bytes; the limit is {limit} bytes', status=413
+        )
+
+
+def storage_usage_pipeline(user_id, exclude_id=None):
+    """Aggregation summing ``size_bytes`` over a user's sessions"""
+    match = {'user_id': user_id}
+    if exclude_id is not None:
+        match['_id'] = {'$ne': exclude_id}
+    return [
+        {'$match': match},
+        {'$group': {'_id': None, 'total': {'$sum': '$size_bytes'}}},
+    ]
+
+
+def check_storage_quota(used_bytes, size_bytes, quota):
+    """Reject a save that would take the user over their quota"""
+    if quota and used_bytes + size_bytes > quota:
+        raise DesignValidationError(
+            f'Saving this design would use {used_bytes + size_bytes} bytes; '
+            f'your storage quota is {quota} bytes',
+            status=413
+        )
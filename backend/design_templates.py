@@ -0,0 +1,255 @@
+"""
+Structural design hashing and the popular template library
+
+Two altars that differ only by element ids, stacking order or a few pixels
+of placement are the same design for a visitor browsing templates. The
+structure hash canonicalises a design before hashing:
+
+- element ids are dropped and each wall's elements are sorted
+- position and size snap to a ``GEOMETRY_QUANTUM`` pixel grid, rotation to
+  ``ROTATION_QUANTUM`` degrees
+- images are identified by asset: catalog paths as-is, data URLs by the
+  hash of their bytes
+- the room type counts, the room dimensions do not
+
+Every saved session carries its ``structure_hash`` (indexed), combined from
+the per-wall hashes in ``wall_structure``. Popular
+templates are the structures saved by the most distinct users, computed by
+an aggregation and cached per process for ``TEMPLATE_REFRESH_SECONDS``.
+A template shows the structure only, taken from its most recent session:
+element types, frame styles and snapped geometry, never the images
+(stickers, photos, wallpapers) anyone put on their walls.
+"""
+import hashlib
+import json
+import threading
+import time
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+GEOMETRY_QUANTUM = 10  # Canvas pixels
+ROTATION_QUANTUM = 15  # Degrees
+
+STRUCTURE_FIELDS = ('type', 'frameType', 'borderColor', 'frameTheme')
+
+
+def asset_key(src):
+    """Stable identity of an image reference"""
+    if isinstance(src, str) and src.startswith('data:'):
+        return 'sha1:' + hashlib.sha1(src.encode()).hexdigest()
+    return src
+
+
+def _snap(value, quantum):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(round(value / quantum)) * quantum
+
+
+def canonical_element(element):
+    canonical = [element.get(field) for field in STRUCTURE_FIELDS]
+    if isinstance(element.get('borderColor'), str):
+        canonical[STRUCTURE_FIELDS.index('borderColor')] = element['borderColor'].lower()
+    canonical.append(asset_key(element.get('content')))
+    canonical += [_snap(element.get(key), GEOMETRY_QUANTUM) for key in ('x', 'y', 'width', 'height')]
+    rotation = _snap(element.get('rotation') or 0, ROTATION_QUANTUM) or 0
+    canonical.append(rotation % 360)
+    return canonical
+
+
+def canonical_wall(wall):
+    """Canonical form of a decoded wall, or None if it has no content"""
+    if not isinstance(wall, dict):
+        return None
+    elements = sorted(
+        (canonical_element(element) for element in wall.get('elements') or [] if isinstance(element, dict)),
+        key=lambda item: json.dumps(item, default=str),
+    )
+    if not elements and not wall.get('wallpaper'):
+        return None
+    return {'wallpaper': asset_key(wall.get('wallpaper')), 'elements': elements}
+
+
+def skeleton_element(element):
+    """Type, frame style and snapped geometry of an element, without its content"""
+    skeleton = {field: element[field] for field in STRUCTURE_FIELDS if element.get(field) is not None}
+    for key in ('x', 'y', 'width', 'height'):
+        skeleton[key] = _snap(element.get(key), GEOMETRY_QUANTUM)
+    skeleton['rotation'] = (_snap(element.get('rotation') or 0, ROTATION_QUANTUM) or 0) % 360
+    return skeleton
+
+
+def skeleton_wall_designs(wall_designs):
+    """The walls of a decoded design as skeletons: no element content, no wallpaper"""
+    if not isinstance(wall_designs, dict):
+        return {}
+    return {
+        name: {'elements': [skeleton_element(element) for element in (wall or {}).get('elements') or []
+                            if isinstance(element, dict)]}
+        for name, wall in wall_designs.items()
+    }
+
+
+def _hash(value):
+    payload = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def wall_structure_hash(wall):
+    """Hash of ``canonical_wall``; None for an empty wall"""
+    canonical = canonical_wall(wall)
+    return _hash(canonical) if canonical is not None else None
+
+
+def wall_structures(wall_designs):
+    """{wall: structure hash} for the walls of a decoded design"""
+    if not isinstance(wall_designs, dict):
+        return {}
+    return {name: wall_structure_hash(wall) for name, wall in wall_designs.items()}
+
+
+def combine_structures(room_type, structures):
+    """Design structure hash from its walls' hashes; None for an empty design.
+
+    Kept separate so a single-wall save can rehash the design from the other
+    walls' stored hashes without reading them.
+    """
+    walls = {name: value for name, value in (structures or {}).items() if value}
+    if not walls:
+        return None
+    return _hash({'room_type': room_type or '', 'walls': walls})
+
+
+def structure_hash(room_type, wall_designs):
+    """Structure hash of a decoded design; None for an empty design"""
+    return combine_structures(room_type, wall_structures(wall_designs))
+
+
+def popular_structures_pipeline(min_users, limit):
+    """Structures saved by at least ``min_users`` users, most popular first.
+
+    Each group keeps its most recently updated session as the example.
+    Only the grouped fields reach the sort, in the order of the
+    ``structure_hash, updated_at`` index, so no wall designs are sorted.
+    """
+    return [
+        {'$match': {'structure_hash': {'$type': 'string'}}},
+        {'$project': {'structure_hash': 1, 'user_id': 1, 'room_type': 1, 'updated_at': 1}},
+        {'$sort': {'structure_hash': 1, 'updated_at': -1}},
+        {'$group': {
+            '_id': '$structure_hash',
+            'sessions': {'$sum': 1},
+            'users': {'$addToSet': '$user_id'},
+            'room_type': {'$first': '$room_type'},
+            'example_id': {'$first': '$_id'},
+            'last_saved': {'$first': '$updated_at'},
+        }},
+        {'$project': {
+            'sessions': 1, 'room_type': 1, 'example_id': 1, 'last_saved': 1,
+            'users': {'$size': '$users'},
+        }},
+        {'$match': {'users': {'$gte': min_users}}},
+        {'$sort': {'users': -1, 'sessions': -1, 'last_saved': -1}},
+        {'$limit': limit},
+    ]
+
+
+def compute_templates(db, min_users, limit):
+    """Run the aggregation and attach the skeleton of each template's example design"""
+    from element_codec import decode_wall_designs
+    from wall_store import load_walls
+
+    groups = list(db.sessions.aggregate(popular_structures_pipeline(min_users, limit), allowDiskUse=True))
+    examples = {
+        session['_id']: session
+        for session in load_walls(db, list(db.sessions.find(
+            {'_id': {'$in': [group['example_id'] for group in groups]}},
+            {'room_type': 1, 'room_dimensions': 1, 'wall_designs': 1},
+        )))
+    }
+
+    templates = []
+    for group in groups:
+        example = examples.get(group['example_id'])
+        if example is None:
+            continue  # Deleted since the aggregation ran
+        templates.append({
+            'structure_hash': group['_id'],
+            'room_type': group.get('room_type') or '',
+            'users': group['users'],
+            'sessions': group['sessions'],
+            'last_saved': group.get('last_saved'),
+            'room_dimensions': example.get('room_dimensions'),
+            'wall_designs': skeleton_wall_designs(decode_wall_designs(example.get('wall_designs'))),
+        })
+    return templates
+
+
+class TemplateLibrary:
+    """Popular templates, recomputed at most every ``refresh_seconds``.
+
+    A stale list is served while a background thread refreshes it; only the
+    very first request waits for the aggregation.
+    """
+
+    def __init__(self, app, refresh_seconds=600, min_users=3, limit=50):
+        self.app = app
+        self.refresh_seconds = refresh_seconds
+        self.min_users = min_users
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # Held by the first, blocking refresh
+        self._templates = None
+        self._refreshed_at = 0
+        self._refreshing = False
+
+    def refresh(self):
+        from extensions import get_db
+
+        started = time.monotonic()
+        with self.app.app_context():
+            templates = compute_templates(get_db(), self.min_users, self.limit)
+        with self._lock:
+            self._templates = templates
+            self._refreshed_at = time.time()
+            self._refreshing = False
+        logger.info(f"Template library refreshed: {len(templates)} templates "
+                    f"in {(time.monotonic() - started) * 1000:.0f}ms")
+        return templates
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Template library refresh failed: {e}")
+            with self._lock:
+                self._refreshing = False
+
+    def templates(self):
+        """(templates, refreshed_at as a unix time)"""
+        if self._templates is None:
+            with self._build_lock:
+                if self._templates is None:
+                    self.refresh()
+        elif time.time() - self._refreshed_at > self.refresh_seconds:
+            with self._lock:
+                start, self._refreshing = not self._refreshing, True
+            if start:
+                threading.Thread(target=self._refresh_in_background, name='template-refresh', daemon=True).start()
+        return self._templates, self._refreshed_at
+
+
+def init_templates(app):
+    app.extensions['templates'] = TemplateLibrary(
+        app,
+        refresh_seconds=app.config.get('TEMPLATE_REFRESH_SECONDS', 600),
+        min_users=app.config.get('TEMPLATE_MIN_USERS', 3),
+        limit=app.config.get('TEMPLATE_LIMIT', 50),
+    )
+
+
+def get_templates():
+    from flask import current_app
+    return current_app.extensions['templates']
@@ -0,0 +1,266 @@
+"""
+Document builders shared by the sync (Flask) and async (ASGI) APIs.
+
+Both servers must expose the same JSON contracts, so every route that reads or
+writes wall designs and sessions goes through these helpers instead of
+building Mongo documents inline. Element arrays are packed with
+``element_codec`` on the way in and unpacked on the way out; session walls
+are stored as shared blobs by ``wall_store``.
+"""
+import json
+from datetime import datetime
+
+from bson import ObjectId
+
+from design_templates import combine_structures, wall_structure_hash, wall_structures
+from element_codec import decode_elements, encode_wall_designs, decode_wall_designs
+from wall_store import split_wall_designs, wall_hash
+
+WALL_NAMES = ('front', 'back', 'left', 'right')
+
+DEFAULT_ROOM_DIMENSIONS = {'length': 8, 'width': 8, 'height': 4}
+
+EXPORT_FORMAT = 'altarmaker-sessions'
+EXPORT_VERSION = 1
+EXPORT_FIELDS = ('session_name', 'room_type', 'room_dimensions', 'selected_wall', 'created_at', 'updated_at')
+
+
+def empty_wall_designs():
+    """Return an empty design for every wall"""
+    return {wall: {'elements': [], 'wallpaper': None} for wall in WALL_NAMES}
+
+
+def wall_design_document(user_id, data):
+    """Build a wall_designs document from a save request"""
+    wall_designs = data.get('wallDesigns', {})
+    optimized_designs = {}
+
+    for wall_name, wall_data in wall_designs.items():
+        if wall_data and (wall_data.get('elements') or wall_data.get('wallpaper')):
+            # Only save walls that have actual content
+            optimized_designs[wall_name] = {
+                'elements': wall_data.get('elements', []),
+                'wallpaper': wall_data.get('wallpaper')
+            }
+
+    return {
+        'user_id': user_id,
+        'wall_designs': encode_wall_designs(optimized_designs),
+        'room_type': data.get('roomType', ''),
+        'room_dimensions': data.get('roomDimensions', {}),
+        'selected_wall': data.get('selectedWall', ''),
+        'created_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow()
+    }
+
+
+def wall_design_response(wall_design):
+    """Build the GET /api/designs/wall-designs response body"""
+    if wall_design:
+        return {
+            'wallDesigns': decode_wall_designs(wall_design.get('wall_designs', {})),
+            'roomType': wall_design.get('room_type', ''),
+            'roomDimensions': wall_design.get('room_dimensions', {}),
+            'selectedWall': wall_design.get('selected_wall', '')
+        }
+    return {
+        'wallDesigns': empty_wall_designs(),
+        'roomType': '',
+        'roomDimensions': dict(DEFAULT_ROOM_DIMENSIONS),
+        'selectedWall': ''
+    }
+
+
+def session_document(user_id, data, size_bytes=None):
+    """Build a sessions document from a save request.
+
+    Returns (document, wall blobs to store alongside it).
+    """
+    wall_designs, blobs = split_wall_designs(data.get('wall_designs'))
+    structures = wall_structures(data.get('wall_designs'))
+    document = {
+        'user_id': user_id,
+        'session_name': data.get('session_name'),
+        'room_type': data.get('room_type'),
+        'room_dimensions': data.get('room_dimensions'),
+        'wall_designs': wall_designs,
+        'wall_structure': structures,
+        'structure_hash': combine_structures(data.get('room_type'), structures),
+        'selected_wall': data.get('selected_wall'),
+        'size_bytes': size_bytes,
+        'wall_sizes': wall_sizes(data.get('wall_designs')),
+        'created_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow()
+    }
+    return document, blobs
+
+
+def session_update(data, size_bytes=None):
+    """Build the $set payload for an update request, and its wall blobs"""
+    wall_designs, blobs = split_wall_designs(data.get('wall_designs'))
+    structures = wall_structures(data.get('wall_designs'))
+    update = {
+        'session_name': data.get('session_name'),
+        'room_type': data.get('room_type'),
+        'room_dimensions': data.get('room_dimensions'),
+        'wall_designs': wall_designs,
+        'wall_structure': structures,
+        'structure_hash': combine_structures(data.get('room_type'), structures),
+        'selected_wall': data.get('selected_wall'),
+        'size_bytes': size_bytes,
+        'wall_sizes': wall_sizes(data.get('wall_designs')),
+        'updated_at': datetime.utcnow()
+    }
+    return update, blobs
+
+
+def clone_document(parent, user_id, session_name=None):
+    """Build a copy of a stored session that shares its wall blobs.
+
+    ``parent`` must already reference its walls (see ``split_wall_designs``);
+    nothing but the references is copied.
+    """
+    now = datetime.utcnow()
+    return {
+        'user_id': user_id,
+        'session_name': session_name or f"{parent.get('session_name') or 'Untitled'} (copy)",
+        'room_type': parent.get('room_type'),
+        'room_dimensions': parent.get('room_dimensions'),
+        'wall_designs': parent.get('wall_designs'),
+        'wall_structure': parent.get('wall_structure'),
+        'structure_hash': parent.get('structure_hash'),
+        'selected_wall': parent.get('selected_wall'),
+        'size_bytes': parent.get('size_bytes'),
+        'wall_sizes': parent.get('wall_sizes') or {},
+        'parent_id': str(parent['_id']),
+        'created_at': now,
+        'updated_at': now
+    }
+
+
+def wall_etag(stored_wall):
+    """ETag of one wall as stored on a session: its content hash.
+
+    For a blob reference that is the reference itself, so revalidating a
+    wall never reads the blob.
+    """
+    if isinstance(stored_wall, dict) and 'ref' in stored_wall:
+        return stored_wall['ref']
+    if isinstance(stored_wall, dict) and 'elements' in stored_wall:
+        stored_wall = dict(stored_wall, elements=decode_elements(stored_wall['elements']))
+    return wall_hash(stored_wall)
+
+
+def apply_wall_patch(wall, patch):
+    """A decoded wall with a PATCH body applied.
+
+    ``wallpaper`` replaces the wallpaper, ``delete`` drops elements by id and
+    ``upsert`` replaces elements with the same id or appends new ones.
+    """
+    wall = dict(wall or {'elements': [], 'wallpaper': None})
+    elements = list(wall.get('elements') or [])
+    if 'wallpaper' in patch:
+        wall['wallpaper'] = patch['wallpaper']
+    if patch.get('delete'):
+        deleted = set(patch['delete'])
+        elements = [element for element in elements if element.get('id') not in deleted]
+    for element in patch.get('upsert') or []:
+        index = next((i for i, current in enumerate(elements) if current.get('id') == element.get('id')), None)
+        if index is None:
+            elements.append(element)
+        else:
+            elements[index] = element
+    wall['elements'] = elements
+    return wall
+
+
+def wall_bytes(wall):
+    """Size of a decoded wall as compact JSON, its share of a session's ``size_bytes``"""
+    return len(json.dumps(wall, separators=(',', ':'), default=str).encode())
+
+
+def wall_sizes(wall_designs):
+    """Per-wall sizes recorded on a session, so one wall can be replaced
+    without reading the others"""
+    if not isinstance(wall_designs, dict):
+        return {}
+    return {name: wall_bytes(wall) for name, wall in wall_designs.items()}
+
+
+def replaced_wall_size(session_data, wall_name, wall, old_wall=None):
+    """``size_bytes`` of a session once ``wall_name`` is replaced by ``wall``.
+
+    The old wall's size comes from ``wall_sizes``; sessions saved before
+    per-wall sizes pass the decoded ``old_wall`` to measure instead.
+    """
+    old_size = (session_data.get('wall_sizes') or {}).get(wall_name)
+    if old_size is None:
+        old_size = wall_bytes(old_wall) if old_wall else 0
+    return max((session_data.get('size_bytes') or 0) - old_size, 0) + wall_bytes(wall)
+
+
+def wall_update(session_data, wall_name, wall, size_bytes=None):
+    """Build the $set payload replacing one wall, and its blobs.
+
+    ``session_data`` needs ``room_type`` and ``wall_structure`` so the
+    design's structure hash can be recomputed without the other walls;
+    sessions saved before per-wall hashes drop out of the templates until
+    their next full save. ``size_bytes`` is the session's new size (see
+    ``replaced_wall_size``).
+    """
+    stored, blobs = split_wall_designs({wall_name: wall})
+    update = {
+        f'wall_designs.{wall_name}': stored[wall_name],
+        f'wall_sizes.{wall_name}': wall_bytes(wall),
+        'updated_at': datetime.utcnow()
+    }
+    if size_bytes is not None:
+        update['size_bytes'] = size_bytes
+    if isinstance(session_data.get('wall_structure'), dict):
+        structures = dict(session_data['wall_structure'], **{wall_name: wall_structure_hash(wall)})
+        update[f'wall_structure.{wall_name}'] = structures[wall_name]
+        update['structure_hash'] = combine_structures(session_data.get('room_type'), structures)
+    else:
+        update['structure_hash'] = None
+    return update, blobs
+
+
+def bulk_ids(data):
+    """Session ids of a bulk request, in order and without repeats"""
+    return list(dict.fromkeys(data['names'] if data['action'] == 'rename' else data['ids']))
+
+
+def bulk_results(ids, found, body=None):
+    """Per-id results in request order.
+
+    ``found`` maps the ids that matched the user's sessions to their
+    documents; ``body(document)`` adds fields to a found id's result.
+    """
+    results = []
+    for session_id in ids:
+        if not ObjectId.is_valid(session_id):
+            results.append({'id': session_id, 'status': 400, 'error': 'Invalid session ID'})
+        elif session_id not in found:
+            results.append({'id': session_id, 'status': 404, 'error': 'Session not found'})
+        else:
+            results.append(dict(body(found[session_id]) if body else {}, id=session_id, status=200))
+    return results
+
+
+def export_session(session_data):
+    """Portable copy of a stored session (walls resolved): no ids, owner or bookkeeping"""
+    exported = {field: session_data.get(field) for field in EXPORT_FIELDS}
+    exported['wall_designs'] = decode_wall_designs(session_data.get('wall_designs'))
+    return exported
+
+
+def serialize_session(session_data):
+    """Make a stored session JSON serializable"""
+    session_data['_id'] = str(session_data['_id'])
+    decode_wall_designs(session_data.get('wall_designs'))
+    # Internal bookkeeping, not part of the API contract
+    session_data.pop('size_bytes', None)
+    session_data.pop('wall_sizes', None)
+    session_data.pop('structure_hash', None)
+    session_data.pop('wall_structure', None)
+    return session_data
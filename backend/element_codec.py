@@ -0,0 +1,161 @@
+"""
+Compact storage codec for wall element arrays
+
+Stored as plain BSON, every element of every wall repeats its key names
+(``id``, ``type``, ``x``, ``y``, ``width``...). The codec stores a wall's
+elements column by column instead:
+
+- numeric keys present on every element become one typed array each
+  (int32 when every value is an int32, float32, or float64 when float32
+  would lose precision, when every value is a float), stored as BSON binary
+- string keys become int32 indexes into a per-wall string dictionary, so a
+  sticker path or data URL used ten times is stored once
+- anything irregular (missing keys, booleans, nested values, ints mixed
+  with floats, ints beyond int32) stays in a sparse per-element ``extra``
+  list
+
+Encoding is lossless: ``decode_elements(encode_elements(x)) == x``. Packed
+walls are recognised by ``elements`` being a dict with a ``codec`` key, so
+documents written before the codec existed decode unchanged.
+"""
+import sys
+from array import array
+
+from bson import Binary
+
+CODEC = 'columnar-v1'
+
+# Below this the column headers cost more than the repeated keys save
+MIN_PACKED_ELEMENTS = 8
+
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+# Columns are stored little-endian whatever the host byte order
+_SWAP = sys.byteorder == 'big'
+
+
+def _to_bytes(packed):
+    if _SWAP:
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(bytes(data))
+    if _SWAP:
+        values.byteswap()
+    return values
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _numeric_column(values):
+    """Smallest exact typecode for a list of numbers, and its bytes.
+
+    None when no typed array gives every value back with its type: a column
+    mixing ints and floats would decode the ints as floats.
+    """
+    if all(isinstance(v, int) for v in values):
+        if all(INT32_MIN <= v <= INT32_MAX for v in values):
+            return 'i', _to_bytes(array('i', values))
+        return None
+    if not all(isinstance(v, float) for v in values):
+        return None
+    packed = array('f', values)
+    if packed.tolist() == values:
+        return 'f', _to_bytes(packed)
+    return 'd', _to_bytes(array('d', values))
+
+
+def encode_elements(elements):
+    """Pack a list of element dicts into the columnar layout"""
+    if not isinstance(elements, list) or len(elements) < MIN_PACKED_ELEMENTS:
+        return elements
+    if not all(isinstance(el, dict) for el in elements):
+        return elements
+
+    shared = set(elements[0])
+    for element in elements[1:]:
+        shared &= element.keys()
+
+    strings, string_index = [], {}
+    columns, columnar_keys = {}, set()
+    for key in sorted(shared):
+        values = [element[key] for element in elements]
+        if all(_is_number(v) for v in values):
+            column = _numeric_column(values)
+            if column is None:
+                continue
+            typecode, data = column
+        elif all(v is None or isinstance(v, str) for v in values):
+            indexes = []
+            for value in values:
+                if value is None:
+                    indexes.append(-1)
+                    continue
+                if value not in string_index:
+                    string_index[value] = len(strings)
+                    strings.append(value)
+                indexes.append(string_index[value])
+            typecode, data = 's', _to_bytes(array('i', indexes))
+        else:
+            continue
+        columns[key] = {'t': typecode, 'data': Binary(data)}
+        columnar_keys.add(key)
+
+    extra = [{k: v for k, v in element.items() if k not in columnar_keys} or None for element in elements]
+    packed = {
+        'codec': CODEC,
+        'count': len(elements),
+        'columns': columns,
+        'strings': strings,
+    }
+    if any(extra):
+        packed['extra'] = extra
+    return packed
+
+
+def decode_elements(packed):
+    """Inverse of encode_elements; lists pass through untouched"""
+    if not isinstance(packed, dict) or packed.get('codec') != CODEC:
+        return packed
+
+    count = packed['count']
+    strings = packed.get('strings', [])
+    extra = packed.get('extra') or [None] * count
+    elements = [dict(item) if item else {} for item in extra]
+
+    for key, column in packed['columns'].items():
+        values = _from_bytes('i' if column['t'] == 's' else column['t'], column['data'])
+        if column['t'] == 's':
+            for element, index in zip(elements, values):
+                element[key] = strings[index] if index >= 0 else None
+        else:
+            for element, value in zip(elements, values.tolist()):
+                element[key] = value
+    return elements
+
+
+def encode_wall_designs(wall_designs):
+    """Pack the elements of every wall in a wall_designs mapping"""
+    if not isinstance(wall_designs, dict):
+        return wall_designs
+    encoded = {}
+    for wall_name, wall in wall_designs.items():
+        if isinstance(wall, dict) and 'elements' in wall:
+            wall = dict(wall, elements=encode_elements(wall['elements']))
+        encoded[wall_name] = wall
+    return encoded
+
+
+def decode_wall_designs(wall_designs):
+    """Unpack every wall in place and return the mapping"""
+    if not isinstance(wall_designs, dict):
+        return wall_designs
+    for wall in wall_designs.values():
+        if isinstance(wall, dict) and 'elements' in wall:
+            wall['elements'] = decode_elements(wall['elements'])
+    return wall_designs
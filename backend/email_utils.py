@@ -3,10 +3,10 @@ from flask_mail import Message
 from itsdangerous import URLSafeTimedSerializer
 from datetime import datetime, timedelta
 from extensions import mail
+from metrics import smtp_timer
+from tracing import CLIENT, span, traced
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def generate_verification_token(email):
@@ -14,8 +14,10 @@ def generate_verification_token(email):
     serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
     return serializer.dumps(email, salt='email-verification-salt')
 
-def verify_token(token, expiration=86400):
+def verify_token(token, expiration=None):
     """Verify the token and return the email if valid"""
+    if expiration is None:
+        expiration = current_app.config.get('VERIFICATION_TOKEN_MAX_AGE', 86400)
     serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
     try:
         email = serializer.loads(
@@ -25,9 +27,28 @@ def verify_token(token, expiration=86400):
         )
         return email
     except Exception as e:
-        current_app.logger.error(f"Token verification failed: {str(e)}")
+        logger.warning(f"Token verification failed: {str(e)}")
         return None
 
+def token_expired(token, expiration=None):
+    """True if a stored token can no longer pass ``verify_token``"""
+    if expiration is None:
+        expiration = current_app.config.get('VERIFICATION_TOKEN_MAX_AGE', 86400)
+    serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
+    try:
+        serializer.loads(token, salt='email-verification-salt', max_age=expiration)
+        return False
+    except Exception:
+        return True
+
+def smtp_span():
+    """Span for handing a message to the SMTP server"""
+    return span('smtp.send', CLIENT, {
+        'server.address': current_app.config.get('MAIL_SERVER'),
+        'server.port': current_app.config.get('MAIL_PORT'),
+    })
+
+@traced('email.send_verification')
 def send_verification_email(recipient_email, token):
     """Send verification email with the provided token"""
     try:
@@ -36,7 +57,7 @@ def send_verification_email(recipient_email, token):
         missing_configs = [config for config in required_configs if not current_app.config.get(config)]
         
         if missing_configs:
-            current_app.logger.error(f"Missing email configuration: {', '.join(missing_configs)}")
+            logger.error(f"Missing email configuration: {', '.join(missing_configs)}")
             return False
             
         verification_url = f"{current_app.config['APP_URL']}/verify-email?token={token}"
@@ -58,21 +79,20 @@ def send_verification_email(recipient_email, token):
         )
         
         # Log email attempt (without sensitive data)
-        current_app.logger.info(f"Attempting to send verification email to {recipient_email}")
+        logger.info(f"Attempting to send verification email to {recipient_email}")
         
         # Send the email using the pre-configured mail instance
-        mail.send(msg)
+        with smtp_timer('verification'), smtp_span():
+            mail.send(msg)
         
-        current_app.logger.info(f"Verification email sent to {recipient_email}")
+        logger.info(f"Verification email sent to {recipient_email}")
         return True
         
     except Exception as e:
-        error_msg = f"Failed to send verification email to {recipient_email}: {str(e)}"
-        current_app.logger.error(error_msg)
-        # Print to console as well in case logging isn't configured
-        logger.info(f"ERROR: {error_msg}")
+        logger.error(f"Failed to send verification email to {recipient_email}: {str(e)}")
         return False
 
+@traced('email.send_welcome')
 def send_welcome_email(recipient_email, username):
     """Send welcome email after successful verification"""
     app_url = current_app.config.get('APP_URL', '#')
@@ -123,8 +143,9 @@ def send_welcome_email(recipient_email, username):
     )
     
     try:
-        mail.send(msg)
+        with smtp_timer('welcome'), smtp_span():
+            mail.send(msg)
         return True
     except Exception as e:
-        current_app.logger.error(f"Failed to send welcome email: {str(e)}")
+        logger.error(f"Failed to send welcome email: {str(e)}")
         return False
\ No newline at end of file
@@ -1,4 +1,8 @@
+import threading
+from flask import current_app
 from flask_mail import Mail
+from werkzeug.local import LocalProxy
+from werkzeug.utils import import_string
 
 # Initialize Flask-Mail extension
 mail = Mail()
@@ -6,3 +10,63 @@ mail = Mail()
 def init_mail(app):
     """Initialize the mail instance with the Flask app"""
     mail.init_app(app)
+
+
+class MongoConnection:
+    """MongoDB client that is only created on first use.
+
+    Creating the app (workers, tests, admin scripts) never opens a socket or
+    imports the driver; the first request that touches ``db`` does.
+    """
+
+    def __init__(self, config):
+        self.uri = config.get('MONGO_URI')
+        self.dbname = config.get('MONGO_DBNAME', 'altarmaker')
+        self.client_factory = config.get('MONGO_CLIENT_FACTORY', 'pymongo.MongoClient')
+        self.listeners = []  # pymongo event listeners, added before the first query
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    factory = import_string(self.client_factory)
+                    kwargs = {'event_listeners': self.listeners} if self.listeners else {}
+                    self._client = factory(self.uri, **kwargs)
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.dbname]
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+def init_mongo(app):
+    """Attach a lazily connected MongoDB client to the app"""
+    app.extensions['mongo'] = MongoConnection(app.config)
+
+def get_mongo():
+    """Get the MongoDB connection for the current app"""
+    return current_app.extensions['mongo']
+
+def get_db():
+    """Get the database for the current app"""
+    return get_mongo().db
+
+def ping_database():
+    """Return True if MongoDB answers a ping"""
+    try:
+        get_mongo().client.admin.command('ping')
+        return True
+    except Exception as e:
+        current_app.logger.error(f"MongoDB connection error: {e}")
+        return False
+
+# Request-scoped handle used by the blueprints, e.g. ``db.users.find_one(...)``
+db = LocalProxy(get_db)
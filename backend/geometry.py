@@ -0,0 +1,354 @@
+"""
+Wall element geometry
+
+Bounding boxes for stored elements (``x``, ``y``, ``width``, ``height`` and
+an optional ``rotation`` in degrees) and a uniform grid index over them, used
+by the renderer to find the elements touching each tile.
+"""
+import math
+from collections import defaultdict
+
+from documents import DEFAULT_ROOM_DIMENSIONS
+
+# Editor canvas size; every wall design is drawn in these coordinates
+WALL_WIDTH = 900
+WALL_HEIGHT = 600
+
+QUERIES = ('overlaps', 'out_of_bounds', 'nearest', 'guides')
+
+# Candidate pairs examined per overlap query; stacked elements make them quadratic
+MAX_PAIRS = 10000
+
+
+def element_bounds(element, scale=1, pad=0):
+    """(left, top, right, bottom) of an element in output pixels.
+
+    Rotated elements get the box of the rotated rectangle. ``pad`` grows the
+    box to cover antialiasing at the edges.
+    """
+    x = float(element.get('x', 0)) * scale
+    y = float(element.get('y', 0)) * scale
+    width = float(element.get('width', 0)) * scale
+    height = float(element.get('height', 0)) * scale
+    rotation = element.get('rotation')
+    if rotation:
+        theta = math.radians(float(rotation))
+        cos, sin = abs(math.cos(theta)), abs(math.sin(theta))
+        cx, cy = x + width / 2, y + height / 2
+        width, height = width * cos + height * sin, width * sin + height * cos
+        x, y = cx - width / 2, cy - height / 2
+    return (
+        math.floor(x) - pad,
+        math.floor(y) - pad,
+        math.ceil(x + width) + pad,
+        math.ceil(y + height) + pad,
+    )
+
+
+def cells_for_bounds(bounds, cell_size):
+    """Grid cells (column, row) a half-open bounding box overlaps"""
+    left, top, right, bottom = bounds
+    if right <= left or bottom <= top:
+        return []
+    return [
+        (column, row)
+        for row in range(math.floor(top / cell_size), math.floor((bottom - 1) / cell_size) + 1)
+        for column in range(math.floor(left / cell_size), math.floor((right - 1) / cell_size) + 1)
+    ]
+
+
+class GridIndex:
+    """Uniform grid of cells, each listing the items that overlap it.
+
+    Items are kept in insertion order within a cell, so for elements the
+    order is the wall's z-order.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        self.bounds = []
+
+    @classmethod
+    def from_elements(cls, elements, cell_size, scale=1, pad=0, clip=None):
+        """Index element boxes, optionally clipped to a (width, height) area"""
+        index = cls(cell_size)
+        for element in elements:
+            left, top, right, bottom = element_bounds(element, scale, pad)
+            if clip:
+                left, top = max(left, 0), max(top, 0)
+                right, bottom = min(right, clip[0]), min(bottom, clip[1])
+            index.insert((left, top, right, bottom))
+        return index
+
+    def insert(self, bounds):
+        """Add a bounding box; returns its item number"""
+        item = len(self.bounds)
+        self.bounds.append(bounds)
+        for cell in cells_for_bounds(bounds, self.cell_size):
+            self.cells[cell].append(item)
+        return item
+
+    def query_cell(self, cell):
+        return self.cells.get(cell, [])
+
+    def query(self, bounds):
+        """Items whose boxes overlap ``bounds``, in insertion order"""
+        found = set()
+        for cell in cells_for_bounds(bounds, self.cell_size):
+            found.update(self.cells.get(cell, ()))
+        left, top, right, bottom = bounds
+        return [
+            item for item in sorted(found)
+            if self.bounds[item][0] < right and self.bounds[item][2] > left
+            and self.bounds[item][1] < bottom and self.bounds[item][3] > top
+        ]
+
+
+# Batched queries
+#
+# The functions below work on whole walls at once with NumPy, for the
+# /api/designs/geometry endpoint. Boxes are an (n, 4) float array of
+# left, top, right, bottom in canvas pixels.
+
+def element_arrays(elements):
+    """Bounding boxes of a list of elements as an (n, 4) array"""
+    import numpy as np
+
+    def column(key):
+        return np.array([float(element.get(key) or 0) for element in elements], dtype=np.float64)
+
+    x, y, width, height = column('x'), column('y'), column('width'), column('height')
+    theta = np.radians(column('rotation'))
+    cos, sin = np.abs(np.cos(theta)), np.abs(np.sin(theta))
+    # Grow around the centre; written so unrotated boxes stay exactly x..x+width
+    rotated_w = np.where(theta == 0, width, width * cos + height * sin)
+    rotated_h = np.where(theta == 0, height, width * sin + height * cos)
+    left = x + (width - rotated_w) / 2
+    top = y + (height - rotated_h) / 2
+    return np.stack([left, top, left + rotated_w, top + rotated_h], axis=1).reshape(-1, 4)
+
+
+def _grid_cell_size(boxes, max_cells_per_axis=256):
+    """Cell about the median element size, but never more than
+    ``max_cells_per_axis`` cells across the occupied extent"""
+    import numpy as np
+
+    sizes = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+    extent = max(np.ptp(boxes[:, [0, 2]]), np.ptp(boxes[:, [1, 3]]))
+    return max(float(np.median(sizes)), extent / max_cells_per_axis, 1.0)
+
+
+def candidate_pairs(boxes, cell_size=None, max_pairs=None):
+    """Pairs (i, j), i < j, of boxes that may overlap, each at most once,
+    and whether ``max_pairs`` cut the list short: (pairs, truncated).
+
+    Every box is expanded into the grid cells it covers, entries are sorted
+    by cell, and each entry is paired with the entries after it in its cell,
+    all without a Python loop over elements. A pair is only kept in the cell
+    holding the top-left corner of the two boxes' intersection, so boxes
+    sharing several cells are not reported several times. Generation stops
+    after ``max_pairs`` cell pairs, before any of the rest is allocated.
+    """
+    import numpy as np
+
+    n = len(boxes)
+    if n < 2:
+        return np.empty((0, 2), dtype=np.int64), False
+    cell_size = cell_size or _grid_cell_size(boxes)
+    cells = np.floor(boxes / cell_size).astype(np.int64)
+    x0, y0 = cells[:, 0], cells[:, 1]
+    span_x = np.maximum(cells[:, 2] - x0 + 1, 1)
+    span_y = np.maximum(cells[:, 3] - y0 + 1, 1)
+
+    # One entry per (box, cell)
+    counts = span_x * span_y
+    ids = np.repeat(np.arange(n), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cx = x0[ids] + offsets % span_x[ids]
+    cy = y0[ids] + offsets // span_x[ids]
+    keys = (cx - cx.min()) * (cy.max() - cy.min() + 1) + (cy - cy.min())
+
+    order = np.argsort(keys, kind='stable')
+    keys, ids, cx, cy = keys[order], ids[order], cx[order], cy[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    group_end = np.repeat(np.r_[starts[1:], len(keys)], np.diff(np.r_[starts, len(keys)]))
+
+    # Pair each entry with the later entries of its cell
+    position = np.arange(len(keys))
+    later = group_end - position - 1
+    truncated = max_pairs is not None and int(later.sum()) > max_pairs
+    if truncated:
+        # Whole entries first, then only part of the one that crosses the limit
+        budget = np.cumsum(later)
+        stop = int(np.searchsorted(budget, max_pairs, side='right'))
+        later = later[:stop + 1].copy()
+        later[stop] = max_pairs - (budget[stop - 1] if stop else 0)
+        position = position[:stop + 1]
+    first = np.repeat(position, later)
+    second = first + 1 + (np.arange(later.sum()) - np.repeat(np.cumsum(later) - later, later))
+    a, b = ids[first], ids[second]
+
+    corner_x = np.floor(np.maximum(boxes[a, 0], boxes[b, 0]) / cell_size)
+    corner_y = np.floor(np.maximum(boxes[a, 1], boxes[b, 1]) / cell_size)
+    keep = (corner_x == cx[first]) & (corner_y == cy[first])
+    a, b = a[keep], b[keep]
+    return np.stack([np.minimum(a, b), np.maximum(a, b)], axis=1), truncated
+
+
+def overlaps(boxes, max_pairs=MAX_PAIRS):
+    """Overlapping pairs with positive area: (pairs, areas, truncated).
+
+    When more than ``max_pairs`` candidates share grid cells only the first
+    ones are checked and ``truncated`` is True.
+    """
+    import numpy as np
+
+    pairs, truncated = candidate_pairs(boxes, max_pairs=max_pairs)
+    a, b = boxes[pairs[:, 0]], boxes[pairs[:, 1]]
+    width = np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0])
+    height = np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1])
+    hit = (width > 0) & (height > 0)
+    pairs, areas = pairs[hit], (width * height)[hit]
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    return pairs[order], areas[order], truncated
+
+
+def out_of_bounds(boxes, width, height):
+    """Indexes of boxes leaving the (0, 0, width, height) wall, and by how
+    much on each side as an (m, 4) left/top/right/bottom overflow array"""
+    import numpy as np
+
+    overflow = np.stack([
+        -boxes[:, 0], -boxes[:, 1], boxes[:, 2] - width, boxes[:, 3] - height
+    ], axis=1).clip(min=0)
+    outside = np.flatnonzero(overflow.any(axis=1))
+    return outside, overflow[outside]
+
+
+def nearest_neighbours(boxes, k=1, chunk=1024):
+    """k nearest other elements by centre distance: (indexes, distances),
+    both (n, k). Distances are computed a block of rows at a time so memory
+    stays at ``chunk * n`` whatever the wall size."""
+    import numpy as np
+
+    n = len(boxes)
+    k = min(k, n - 1)
+    if k < 1:
+        return np.empty((n, 0), dtype=np.int64), np.empty((n, 0))
+    centres = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+    squares = (centres ** 2).sum(axis=1)
+    indexes = np.empty((n, k), dtype=np.int64)
+    distances = np.empty((n, k))
+    for start in range(0, n, chunk):
+        block = centres[start:start + chunk]
+        # |a - b|^2 = |a|^2 + |b|^2 - 2ab, as one matrix product per block
+        d2 = squares[start:start + chunk, None] + squares[None, :] - 2 * block @ centres.T
+        np.maximum(d2, 0, out=d2)
+        d2[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+        nearest = np.argpartition(d2, k - 1, axis=1)[:, :k]
+        nearest_d2 = np.take_along_axis(d2, nearest, axis=1)
+        order = np.argsort(nearest_d2, axis=1)
+        indexes[start:start + chunk] = np.take_along_axis(nearest, order, axis=1)
+        distances[start:start + chunk] = np.sqrt(np.take_along_axis(nearest_d2, order, axis=1))
+    return indexes, distances
+
+
+GUIDE_EDGES = {
+    'x': ('left', 'center', 'right'),
+    'y': ('top', 'middle', 'bottom'),
+}
+
+
+def alignment_guides(boxes, tolerance=2.0):
+    """Edges and centres of different elements lining up within
+    ``tolerance`` pixels, per axis: lists of (position, [(index, edge)])"""
+    import numpy as np
+
+    n = len(boxes)
+    guides = {}
+    for axis, (low, high) in (('x', (0, 2)), ('y', (1, 3))):
+        values = np.concatenate([boxes[:, low], (boxes[:, low] + boxes[:, high]) / 2, boxes[:, high]])
+        ids = np.tile(np.arange(n), 3)
+        kinds = np.repeat(np.arange(3), n)
+        order = np.argsort(values, kind='stable')
+        values, ids, kinds = values[order], ids[order], kinds[order]
+
+        # Candidate runs: neighbours within tolerance of each other
+        breaks = np.flatnonzero(np.diff(values) > tolerance) + 1
+        starts, ends = np.r_[0, breaks], np.r_[breaks, len(values)]
+        found = []
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            # Split long chains so every guide spans at most the tolerance
+            anchor = start
+            for i in range(start + 1, end + 1):
+                if i < end and values[i] - values[anchor] <= tolerance:
+                    continue
+                group = slice(anchor, i)
+                if len(np.unique(ids[group])) > 1:
+                    members = [(int(e), GUIDE_EDGES[axis][kind]) for e, kind in zip(ids[group], kinds[group])]
+                    found.append((float(values[group].mean()), members))
+                anchor = i
+        guides[axis] = found
+    return guides
+
+
+def wall_size_metres(wall, room_dimensions):
+    """Physical (width, height) of a wall, as the 3D view lays the room out"""
+    room = dict(DEFAULT_ROOM_DIMENSIONS, **{k: v for k, v in (room_dimensions or {}).items() if v})
+    across = room['width'] if wall in ('front', 'back') else room['length']
+    return across, room['height']
+
+
+def geometry_report(elements, queries=QUERIES, wall='front', room_dimensions=None, k=1, tolerance=2.0,
+                    max_pairs=MAX_PAIRS):
+    """Run the requested batched queries over one wall's elements.
+
+    Elements are referred to by their ``id``. Sizes are canvas pixels, with
+    out-of-bounds overflow also given in metres for the wall's real size.
+    ``truncated`` is set when the overlaps hit ``max_pairs``.
+    """
+    ids = [element.get('id') for element in elements]
+    boxes = element_arrays(elements)
+    report = {'count': len(elements)}
+
+    if 'overlaps' in queries:
+        pairs, areas, truncated = overlaps(boxes, max_pairs)
+        report['truncated'] = truncated
+        report['overlaps'] = [
+            {'a': ids[a], 'b': ids[b], 'area': round(float(area), 2)}
+            for (a, b), area in zip(pairs.tolist(), areas.tolist())
+        ]
+
+    if 'out_of_bounds' in queries:
+        width_m, height_m = wall_size_metres(wall, room_dimensions)
+        metres = (width_m / WALL_WIDTH, height_m / WALL_HEIGHT) * 2
+        outside, overflow = out_of_bounds(boxes, WALL_WIDTH, WALL_HEIGHT)
+        report['wall'] = {'name': wall, 'width_m': width_m, 'height_m': height_m}
+        report['out_of_bounds'] = [
+            {
+                'id': ids[index],
+                'overflow': dict(zip(('left', 'top', 'right', 'bottom'), (round(v, 2) for v in sides))),
+                'overflow_m': dict(zip(('left', 'top', 'right', 'bottom'),
+                                       (round(v * m, 3) for v, m in zip(sides, metres)))),
+            }
+            for index, sides in zip(outside.tolist(), overflow.tolist())
+        ]
+
+    if 'nearest' in queries:
+        indexes, distances = nearest_neighbours(boxes, k)
+        report['nearest'] = [
+            {'id': ids[index], 'neighbours': [
+                {'id': ids[other], 'distance': round(distance, 2)} for other, distance in zip(row, row_d)
+            ]}
+            for index, (row, row_d) in enumerate(zip(indexes.tolist(), distances.tolist()))
+        ]
+
+    if 'guides' in queries:
+        report['guides'] = [
+            {'axis': axis, 'position': round(position, 2),
+             'members': [{'id': ids[index], 'edge': edge} for index, edge in members]}
+            for axis, found in alignment_guides(boxes, tolerance).items()
+            for position, members in found
+        ]
+    return report
@@ -0,0 +1,379 @@
+"""
+Scheduled maintenance: garbage collection of data nothing uses any more
+
+Sweeps, in the order they run:
+
+- ``wall_blobs``: mark-and-sweep. One pass over ``sessions`` marks every
+  referenced blob, then blobs that are not marked and were last used before
+  the pass started (minus ``MAINTENANCE_BLOB_GRACE_SECONDS``) are deleted.
+  Saves bump ``used_at`` before pointing at a blob, so a blob a save is
+  about to reference is never swept.
+- ``session_ops``: live-editing op logs of sessions that no longer exist,
+  marked in the same pass (sessions newer than the grace period are kept).
+- ``unverified_accounts``: non-admin accounts that never verified their
+  email within ``MAINTENANCE_UNVERIFIED_DAYS``. They are only counted,
+  as in a dry run, unless ``MAINTENANCE_DELETE_UNVERIFIED`` is set.
+- ``verification_tokens``: tokens older than ``VERIFICATION_TOKEN_MAX_AGE``,
+  which ``verify_token`` rejects anyway; the user can ask for a new one.
+- ``render_cache``: rendered files not served for ``RENDER_CACHE_MAX_AGE_DAYS``.
+
+Every sweep reads in batches of ``MAINTENANCE_BATCH_SIZE`` (paged by
+``_id``) and sleeps between batches so it uses at most
+``MAINTENANCE_DUTY_CYCLE`` of the wall time. A run with ``dry_run`` counts
+what it would delete without deleting anything. Each run stores a report in
+``maintenance_runs``; only one process runs at a time (a lease in
+``maintenance``).
+
+Runs start every ``MAINTENANCE_INTERVAL_SECONDS`` (only set by the
+production config) from a daemon thread, from POST /api/admin/maintenance,
+or from the command line::
+
+    python maintenance.py --dry-run
+    python maintenance.py --sweep wall_blobs --sweep session_ops
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from email_utils import token_expired
+from wall_store import BLOB_COLLECTION, blob_refs
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+RUNS_COLLECTION = 'maintenance_runs'
+LEASE_COLLECTION = 'maintenance'
+
+SWEEPS = ('wall_blobs', 'session_ops', 'unverified_accounts', 'verification_tokens', 'render_cache')
+
+
+class Throttle:
+    """Sleeps after each batch so the work takes at most ``duty`` of wall time"""
+
+    def __init__(self, duty=0.2, sleep=time.sleep, clock=time.monotonic):
+        self.duty = duty
+        self.sleep = sleep
+        self.clock = clock
+        self.batches = 0
+        self.slept = 0.0
+        self._started = None
+
+    def __enter__(self):
+        self._started = self.clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.batches += 1
+        if 0 < self.duty < 1:
+            pause = (self.clock() - self._started) * (1 - self.duty) / self.duty
+            self.slept += pause
+            self.sleep(pause)
+        return False
+
+
+def batches(collection, query, projection, size, throttle):
+    """Documents matching ``query`` in ``_id`` order, a throttled batch at a time"""
+    last = None
+    while True:
+        page = dict(query, _id={'$gt': last}) if last is not None else query
+        with throttle:
+            batch = list(collection.find(page, projection).sort('_id', 1).limit(size))
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]['_id']
+
+
+def mark_sessions(db, size, throttle):
+    """(referenced blob hashes, session ids) from one pass over ``sessions``"""
+    refs, session_ids = set(), set()
+    for batch in batches(db.sessions, {}, {'wall_designs': 1}, size, throttle):
+        refs |= blob_refs(batch)
+        session_ids.update(str(session['_id']) for session in batch)
+    return refs, session_ids
+
+
+def sweep_blobs(db, refs, cutoff, size, throttle, dry_run):
+    report = {'scanned': 0, 'marked': len(refs), 'unreferenced': 0, 'deleted': 0}
+    for batch in batches(db[BLOB_COLLECTION], {}, {'used_at': 1}, size, throttle):
+        report['scanned'] += len(batch)
+        garbage = [
+            blob['_id'] for blob in batch
+            if blob['_id'] not in refs and (blob.get('used_at') or datetime.min) < cutoff
+        ]
+        report['unreferenced'] += len(garbage)
+        if garbage and not dry_run:
+            with throttle:
+                report['deleted'] += db[BLOB_COLLECTION].delete_many(
+                    {'_id': {'$in': garbage}, 'used_at': {'$lt': cutoff}}
+                ).deleted_count
+    return report
+
+
+def _created_before(session_id, cutoff):
+    return ObjectId.is_valid(session_id) and ObjectId(session_id).generation_time.replace(tzinfo=None) < cutoff
+
+
+def sweep_session_ops(db, session_ids, cutoff, size, throttle, dry_run):
+    """Op logs of sessions created before the mark pass and not seen in it"""
+    report = {'scanned': 0, 'orphaned_sessions': 0, 'deleted': 0}
+    orphans = set()
+    for batch in batches(db.session_ops, {}, {'session_id': 1}, size, throttle):
+        report['scanned'] += len(batch)
+        orphans.update(
+            op['session_id'] for op in batch
+            if op.get('session_id') not in session_ids and _created_before(op.get('session_id'), cutoff)
+        )
+    report['orphaned_sessions'] = len(orphans)
+    orphans = sorted(orphans)
+    for start in range(0, len(orphans) if not dry_run else 0, size):
+        with throttle:
+            report['deleted'] += db.session_ops.delete_many(
+                {'session_id': {'$in': orphans[start:start + size]}}
+            ).deleted_count
+    return report
+
+
+def sweep_unverified_accounts(db, cutoff, size, throttle, dry_run):
+    query = {'email_verified': False, 'role': {'$ne': 'admin'}, 'created_at': {'$lt': cutoff}}
+    report = {'stale': 0, 'deleted': 0, 'dry_run': dry_run}
+    for batch in batches(db.users, query, {'_id': 1}, size, throttle):
+        report['stale'] += len(batch)
+        if not dry_run:
+            with throttle:
+                report['deleted'] += db.users.delete_many(
+                    dict(query, _id={'$in': [user['_id'] for user in batch]})
+                ).deleted_count
+    return report
+
+
+def sweep_verification_tokens(db, max_age, size, throttle, dry_run):
+    query = {'verification_token': {'$nin': [None, '']}}
+    report = {'scanned': 0, 'expired': 0, 'cleared': 0}
+    for batch in batches(db.users, query, {'verification_token': 1}, size, throttle):
+        report['scanned'] += len(batch)
+        expired = [user for user in batch if token_expired(user['verification_token'], max_age)]
+        report['expired'] += len(expired)
+        if expired and not dry_run:
+            with throttle:
+                # Matching the token keeps one resent since the read
+                result = db.users.bulk_write([
+                    UpdateOne({'_id': user['_id'], 'verification_token': user['verification_token']},
+                              {'$set': {'verification_token': None}})
+                    for user in expired
+                ], ordered=False)
+            report['cleared'] += result.modified_count
+    return report
+
+
+def sweep_render_cache(cache_dir, cutoff, size, throttle, dry_run):
+    """Files under the render cache (renders, tiles, atlases) not touched since ``cutoff``"""
+    report = {'scanned': 0, 'expired': 0, 'deleted': 0, 'bytes': 0}
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return report
+    cutoff = cutoff.timestamp()
+    paths = (os.path.join(root, name) for root, _, names in os.walk(cache_dir) for name in names)
+    while True:
+        with throttle:
+            done = True
+            for path in paths:
+                done = False
+                report['scanned'] += 1
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime >= cutoff:
+                        continue
+                    report['expired'] += 1
+                    report['bytes'] += stat.st_size
+                    if not dry_run:
+                        os.remove(path)
+                        report['deleted'] += 1
+                except OSError:
+                    pass  # Replaced or removed meanwhile
+                if report['scanned'] % size == 0:
+                    break
+        if done:
+            return report
+
+
+def run(db, config, cache_dir=None, sweeps=SWEEPS, dry_run=False):
+    """Run the chosen sweeps and return their report"""
+    size = config.get('MAINTENANCE_BATCH_SIZE', 500)
+    throttle = Throttle(config.get('MAINTENANCE_DUTY_CYCLE', 0.2))
+    started = datetime.utcnow()
+    started_clock = time.monotonic()
+    report = {'started_at': started, 'dry_run': dry_run, 'sweeps': {}}
+
+    def timed(name, sweep, *args):
+        clock, slept = time.monotonic(), throttle.slept
+        result = sweep(*args)
+        result['duration_ms'] = round((time.monotonic() - clock) * 1000)
+        result['throttled_ms'] = round((throttle.slept - slept) * 1000)
+        report['sweeps'][name] = result
+        logger.info(f"Maintenance {name}{' (dry run)' if dry_run else ''}: {result}")
+
+    if 'wall_blobs' in sweeps or 'session_ops' in sweeps:
+        marked_at, clock = datetime.utcnow(), time.monotonic()
+        refs, session_ids = mark_sessions(db, size, throttle)
+        report['mark'] = {
+            'sessions': len(session_ids),
+            'referenced_blobs': len(refs),
+            'duration_ms': round((time.monotonic() - clock) * 1000),
+        }
+        # Ids are made client-side before the insert, so ops get the same grace
+        grace = timedelta(seconds=config.get('MAINTENANCE_BLOB_GRACE_SECONDS', 3600))
+        if 'wall_blobs' in sweeps:
+            timed('wall_blobs', sweep_blobs, db, refs, marked_at - grace, size, throttle, dry_run)
+        if 'session_ops' in sweeps:
+            timed('session_ops', sweep_session_ops, db, session_ids, marked_at - grace, size, throttle, dry_run)
+    if 'unverified_accounts' in sweeps:
+        # Accounts store local time (datetime.now) in created_at
+        cutoff = datetime.now() - timedelta(days=config.get('MAINTENANCE_UNVERIFIED_DAYS', 30))
+        # Deleting users is opt-in; otherwise the sweep only reports them
+        delete = config.get('MAINTENANCE_DELETE_UNVERIFIED', False)
+        timed('unverified_accounts', sweep_unverified_accounts, db, cutoff, size, throttle, dry_run or not delete)
+    if 'verification_tokens' in sweeps:
+        max_age = config.get('VERIFICATION_TOKEN_MAX_AGE', 86400)
+        timed('verification_tokens', sweep_verification_tokens, db, max_age, size, throttle, dry_run)
+    if 'render_cache' in sweeps:
+        cutoff = datetime.now() - timedelta(days=config.get('RENDER_CACHE_MAX_AGE_DAYS', 30))
+        timed('render_cache', sweep_render_cache, cache_dir, cutoff, size, throttle, dry_run)
+
+    report['finished_at'] = datetime.utcnow()
+    report['duration_ms'] = round((time.monotonic() - started_clock) * 1000)
+    report['batches'] = throttle.batches
+    report['throttled_ms'] = round(throttle.slept * 1000)
+    return report
+
+
+def acquire_lease(db, owner, seconds):
+    """Hold the maintenance lease for ``seconds``; False if another process has it"""
+    now = datetime.utcnow()
+    try:
+        db[LEASE_COLLECTION].find_one_and_update(
+            {'_id': 'lease', '$or': [{'until': {'$lt': now}}, {'owner': owner}]},
+            {'$set': {'owner': owner, 'until': now + timedelta(seconds=seconds)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def release_lease(db, owner):
+    db[LEASE_COLLECTION].delete_one({'_id': 'lease', 'owner': owner})
+
+
+def last_report(db):
+    return db[RUNS_COLLECTION].find_one({}, {'_id': 0}, sort=[('started_at', -1)])
+
+
+class Maintenance:
+    """Runs maintenance every ``interval`` seconds on a daemon thread"""
+
+    def __init__(self, app, interval=0, lease_seconds=3600):
+        self.app = app
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.owner = f'{os.getpid()}-{id(self)}'
+        self._lock = threading.Lock()
+        self._thread = None
+        self.running = False
+
+    def start(self):
+        """Start the scheduler; called per request, so forking servers do not copy it"""
+        if self._thread is None and self.interval:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+                    self._thread.start()
+
+    def run(self, sweeps=SWEEPS, dry_run=False):
+        """Run now; returns the report, or None if a run is already in progress"""
+        from extensions import get_db
+
+        with self.app.app_context():
+            db = get_db()
+            with self._lock:
+                if self.running or not acquire_lease(db, self.owner, self.lease_seconds):
+                    return None
+                self.running = True
+            try:
+                cache_dir = self.app.extensions['renderer'].cache_dir
+                report = run(db, self.app.config, cache_dir, sweeps, dry_run)
+                db[RUNS_COLLECTION].insert_one(dict(report))
+                return report
+            finally:
+                self.running = False
+                release_lease(db, self.owner)
+
+    def run_in_background(self, sweeps=SWEEPS, dry_run=False):
+        """Start a run on its own thread; False if one is already in progress"""
+        if self.running:
+            return False
+        threading.Thread(target=self._run_safely, args=(sweeps, dry_run), name='maintenance-run', daemon=True).start()
+        return True
+
+    def due(self):
+        from extensions import get_db
+
+        with self.app.app_context():
+            last = last_report(get_db())
+        return last is None or datetime.utcnow() - last['started_at'] >= timedelta(seconds=self.interval)
+
+    def _run_safely(self, sweeps=SWEEPS, dry_run=False):
+        try:
+            self.run(sweeps, dry_run)
+        except Exception as e:
+            logger.error(f"Maintenance run failed: {e}")
+
+    def _run(self):
+        while True:
+            try:
+                if self.due():
+                    self._run_safely()
+            except Exception as e:
+                logger.error(f"Maintenance schedule check failed: {e}")
+            time.sleep(min(self.interval, 600))
+
+
+def init_maintenance(app):
+    maintenance = app.extensions['maintenance'] = Maintenance(
+        app,
+        interval=app.config.get('MAINTENANCE_INTERVAL_SECONDS', 0),
+        lease_seconds=app.config.get('MAINTENANCE_LEASE_SECONDS', 3600),
+    )
+    app.before_request(maintenance.start)
+
+
+def get_maintenance():
+    from flask import current_app
+    return current_app.extensions['maintenance']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='report what would be deleted, delete nothing')
+    parser.add_argument('--sweep', action='append', choices=SWEEPS, help='run only this sweep (repeatable)')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    logging.basicConfig(level=logging.INFO)
+    report = create_app().extensions['maintenance'].run(tuple(args.sweep or SWEEPS), args.dry_run)
+    if report is None:
+        logger.error("Another maintenance run holds the lease")
+        raise SystemExit(1)
+    logger.info(f"Maintenance finished in {report['duration_ms']}ms "
+                f"({report['batches']} batches, {report['throttled_ms']}ms throttled)")
+
+
+if __name__ == '__main__':
+    main()
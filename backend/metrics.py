@@ -0,0 +1,312 @@
+"""
+Request, MongoDB and SMTP metrics in the Prometheus text format
+
+Every request records its latency, request and response sizes, and how many
+Mongo commands it ran, labelled by endpoint (``sessions.save_session``,
+``sessions.get_sessions``, ...). A pymongo ``CommandListener`` records the
+duration of every command with the endpoint that issued it, and the email
+helpers time each SMTP send. ``GET /metrics`` serves the totals.
+
+Observations go to a per-thread shard: the request thread is the only
+writer of its shard, so recording takes no lock. Shards are summed when
+``/metrics`` is scraped, and the shards of finished threads are folded into
+one. Totals are per process; with several workers Prometheus scrapes each
+one and ``sum()`` adds them up.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+BACKGROUND = 'background'  # Endpoint label of work outside a request
+
+
+class Registry:
+    """Metric families plus the per-thread shards holding their values"""
+
+    def __init__(self):
+        self._families = []
+        self._collectors = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []  # (thread, shard) of live threads
+        self._retired = {}  # Summed shards of finished threads
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def histogram(self, name, help_text, labels, buckets):
+        return self._add(Histogram(self, name, help_text, labels, buckets))
+
+    def counter(self, name, help_text, labels):
+        return self._add(Counter(self, name, help_text, labels))
+
+    def _add(self, family):
+        self._families.append(family)
+        return family
+
+    def collector(self, name, collect):
+        """Add (or replace) a function returning [(name, type, help, value)] at scrape time"""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def values(self):
+        """Totals over every shard: {(family name, label values): cell}"""
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    _add_cells(self._retired, shard)
+            self._shards = live
+            totals = {key: list(cell) for key, cell in self._retired.items()}
+            collectors = list(self._collectors.values())
+        for _, shard in live:
+            _add_cells(totals, shard.copy())  # The copy is atomic; its owner may be writing
+        return totals, collectors
+
+    def exposition(self):
+        """All metrics in the Prometheus text format"""
+        totals, collectors = self.values()
+        lines = []
+        for family in self._families:
+            lines.extend(family.lines(totals))
+        for collect in collectors:
+            for name, kind, help_text, value in collect():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {_number(value)}']
+        return '\n'.join(lines) + '\n'
+
+
+def _add_cells(totals, shard):
+    for key, cell in shard.items():
+        total = totals.get(key)
+        if total is None:
+            totals[key] = list(cell)
+        else:
+            for i, value in enumerate(cell):
+                total[i] += value
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cells are [count per bucket..., count above the last bucket, sum]"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labels, buckets):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        cell = shard.get(key)
+        if cell is None:
+            cell = shard[key] = [0] * (len(self.buckets) + 2)
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def lines(self, totals):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for (name, labels), cell in sorted(totals.items()):
+            if name != self.name:
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), cell):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, labels)} {_number(cell[-1])}')
+            lines.append(f'{self.name}_count{_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, registry, name, help_text, labels):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+
+    def inc(self, *labels, amount=1):
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        cell = shard.get(key)
+        if cell is None:
+            cell = shard[key] = [0]
+        cell[0] += amount
+
+    def lines(self, totals):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for (name, labels), cell in sorted(totals.items()):
+            if name == self.name:
+                lines.append(f'{self.name}{_labels(self.labels, labels)} {_number(cell[0])}')
+        return lines
+
+
+REGISTRY = Registry()
+
+HTTP_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Request latency.', ('method', 'endpoint', 'status'), LATENCY_BUCKETS)
+HTTP_REQUEST_BYTES = REGISTRY.histogram(
+    'http_request_size_bytes', 'Request body size.', ('endpoint',), SIZE_BUCKETS)
+HTTP_RESPONSE_BYTES = REGISTRY.histogram(
+    'http_response_size_bytes', 'Response body size.', ('endpoint',), SIZE_BUCKETS)
+HTTP_MONGO_COMMANDS = REGISTRY.histogram(
+    'http_request_mongodb_commands', 'MongoDB commands run by one request.', ('endpoint',), COUNT_BUCKETS)
+MONGO_SECONDS = REGISTRY.histogram(
+    'mongodb_command_duration_seconds', 'MongoDB command latency.', ('command', 'endpoint', 'outcome'),
+    MONGO_BUCKETS)
+SMTP_SECONDS = REGISTRY.histogram(
+    'smtp_send_duration_seconds', 'Time to hand an email to the SMTP server.', ('email', 'outcome'),
+    LATENCY_BUCKETS)
+
+
+class RequestState:
+    __slots__ = ('endpoint', 'started', 'commands', 'status', 'response_bytes')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.commands = 0
+        self.status = None
+        self.response_bytes = None
+
+
+_request = contextvars.ContextVar('metrics_request', default=None)
+
+
+def current_endpoint():
+    """Endpoint of the request being handled, or ``BACKGROUND``"""
+    state = _request.get()
+    return state.endpoint if state is not None else BACKGROUND
+
+
+def start_request(endpoint):
+    return _request.set(RequestState(endpoint or 'unmatched'))
+
+
+def finish_request(method, request_bytes, token=None, status=None):
+    """Record the current request; ``status`` defaults to the one set by ``response_sent``"""
+    state = _request.get()
+    if state is None:
+        return
+    if token is not None:
+        _request.reset(token)
+    else:
+        _request.set(None)
+    status = status or state.status or 500
+    HTTP_SECONDS.observe(time.perf_counter() - state.started, method, state.endpoint, str(status))
+    HTTP_REQUEST_BYTES.observe(request_bytes or 0, state.endpoint)
+    if state.response_bytes is not None:
+        HTTP_RESPONSE_BYTES.observe(state.response_bytes, state.endpoint)
+    HTTP_MONGO_COMMANDS.observe(state.commands, state.endpoint)
+
+
+def response_sent(status, response_bytes):
+    state = _request.get()
+    if state is not None:
+        state.status = status
+        state.response_bytes = response_bytes
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command; runs in the thread that issued it"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._observe(event, 'ok')
+
+    def failed(self, event):
+        self._observe(event, 'error')
+
+    def _observe(self, event, outcome):
+        state = _request.get()
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, event.command_name,
+                              state.endpoint if state else BACKGROUND, outcome)
+        if state is not None:
+            state.commands += 1
+
+
+@contextmanager
+def smtp_timer(email):
+    """Time an SMTP send of one kind of ``email``; exceptions propagate"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        SMTP_SECONDS.observe(time.perf_counter() - started, email, outcome)
+
+
+def write_behind_collector(buffer):
+    def collect():
+        stats = buffer.stats()
+        yield 'write_behind_pending', 'gauge', 'Saves waiting to be written.', stats['pending']
+        for key in ('saves', 'writes', 'failed', 'dropped', 'discarded', 'stale'):
+            yield f'write_behind_{key}_total', 'counter', f'Write-behind {key} since start.', stats[key]
+    return collect
+
+
+def init_metrics(app):
+    """Record request metrics for a Flask app and time its Mongo commands"""
+    from flask import request
+
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    app.extensions['mongo'].listeners.append(MongoCommandMetrics())
+    if 'write_behind' in app.extensions:
+        REGISTRY.collector('write_behind', write_behind_collector(app.extensions['write_behind']))
+
+    @app.before_request
+    def start_metrics():
+        start_request(request.endpoint)
+
+    @app.after_request
+    def record_response(response):
+        response_sent(response.status_code, None if response.is_streamed else response.content_length)
+        return response
+
+    @app.teardown_request
+    def finish_metrics(exc=None):
+        finish_request(request.method, request.content_length)
@@ -0,0 +1,425 @@
+"""
+Server-side altar rendering
+
+Composites a wall (wallpaper, stickers and frames) from its stored geometry
+with Pillow, matching the browser export in ``Sidebar.jsx``: a 900x600 wall,
+wallpaper stretched to fill, frames drawn with a 4px border as squares,
+circles or rounded rectangles and their photo clipped to the shape.
+
+Renders run on a process pool so they never hold a request thread's GIL, and
+finished files are cached on disk under a key derived from the design, so an
+unchanged wall is only ever rendered once per scale and format. Below that,
+walls are composited in ``TILE_SIZE`` tiles cached by content: after moving
+one element only the tiles its old and new boxes overlap are redrawn.
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from atlas import AtlasCache, atlas_key, build_atlas
+from geometry import GridIndex, WALL_WIDTH, WALL_HEIGHT
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+BORDER_WIDTH = 4
+ROUNDED_RADIUS = 16
+DEFAULT_BORDER_COLOR = '#888'
+
+# Elements larger than this (in output pixels) are skipped, not allocated
+MAX_LAYER_PIXELS = 8192 * 8192
+
+TILE_SIZE = 256
+TILE_PAD = 2  # antialiasing can bleed just past an element's box
+
+# Bump when drawing changes so cached renders and tiles are not reused
+RENDER_VERSION = 2
+
+FORMATS = {
+    'png': 'image/png',
+    'pdf': 'application/pdf',
+}
+
+
+def design_hash(*parts):
+    """Stable hash of JSON-serializable parts (walls, scale, format...)"""
+    payload = json.dumps([RENDER_VERSION, *parts], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@lru_cache(maxsize=128)
+def load_source(src, public_dir):
+    """Decode an element or wallpaper source into an RGBA image.
+
+    Catalog paths are read from ``public_dir`` and data URLs are decoded;
+    anything else (remote URLs) is skipped rather than fetched.
+    """
+    from PIL import Image
+
+    if not src or not isinstance(src, str):
+        return None
+    try:
+        if src.startswith('data:image/'):
+            data = base64.b64decode(src.split(',', 1)[1])
+            return Image.open(io.BytesIO(data)).convert('RGBA')
+        if src.startswith('/'):
+            root = os.path.realpath(public_dir)
+            path = os.path.realpath(os.path.join(root, src.lstrip('/')))
+            if path.startswith(root + os.sep) and os.path.isfile(path):
+                with Image.open(path) as image:
+                    return image.convert('RGBA')
+    except Exception as e:
+        logger.warning(f"Could not load render source {src[:80]}: {e}")
+    return None
+
+
+def element_box(element, scale):
+    """Scaled integer (left, top, width, height) of an element"""
+    left = round(float(element.get('x', 0)) * scale)
+    top = round(float(element.get('y', 0)) * scale)
+    width = max(1, round(float(element.get('width', 0)) * scale))
+    height = max(1, round(float(element.get('height', 0)) * scale))
+    return left, top, width, height
+
+
+def _shape_mask(frame_type, size, scale):
+    from PIL import Image, ImageDraw
+
+    mask = Image.new('L', size, 0)
+    draw = ImageDraw.Draw(mask)
+    width, height = size
+    if frame_type == 'circle':
+        diameter = min(width, height)
+        left, top = (width - diameter) // 2, (height - diameter) // 2
+        draw.ellipse((left, top, left + diameter - 1, top + diameter - 1), fill=255)
+    elif frame_type == 'rounded':
+        draw.rounded_rectangle((0, 0, width - 1, height - 1), radius=round(ROUNDED_RADIUS * scale), fill=255)
+    else:
+        draw.rectangle((0, 0, width - 1, height - 1), fill=255)
+    return mask
+
+
+def render_layer(element, scale, public_dir):
+    """Rasterise one element (frame, sticker or image) to an RGBA image"""
+    from PIL import Image, ImageDraw
+
+    if not isinstance(element, dict):
+        return None
+    _, _, width, height = element_box(element, scale)
+    if width * height > MAX_LAYER_PIXELS:
+        return None
+    kind = element.get('type')
+
+    if kind == 'frame':
+        layer = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        frame_type = element.get('frameType')
+        mask = _shape_mask(frame_type, (width, height), scale)
+
+        source = load_source(element.get('content'), public_dir)
+        if source is not None:
+            photo = source.resize((width, height), Image.LANCZOS)
+            layer.paste(photo, (0, 0), Image.composite(photo.getchannel('A'), mask, mask))
+
+        # Border on top, like ctx.stroke after drawImage in the browser export
+        border = ImageDraw.Draw(layer)
+        line = max(1, round(BORDER_WIDTH * scale))
+        color = element.get('borderColor') or DEFAULT_BORDER_COLOR
+        try:
+            if frame_type == 'circle':
+                diameter = min(width, height)
+                x0, y0 = (width - diameter) // 2, (height - diameter) // 2
+                border.ellipse((x0, y0, x0 + diameter - 1, y0 + diameter - 1), outline=color, width=line)
+            elif frame_type == 'rounded':
+                border.rounded_rectangle((0, 0, width - 1, height - 1), radius=round(ROUNDED_RADIUS * scale),
+                                         outline=color, width=line)
+            else:
+                border.rectangle((0, 0, width - 1, height - 1), outline=color, width=line)
+        except ValueError:
+            pass  # unparseable colour: leave the frame borderless
+    else:
+        source = load_source(element.get('content'), public_dir)
+        if source is None:
+            return None
+        layer = source.resize((width, height), Image.LANCZOS)
+
+    rotation = element.get('rotation')
+    if rotation:
+        layer = layer.rotate(-float(rotation), resample=Image.BICUBIC, expand=True)
+    return layer
+
+
+def layer_position(element, scale, layer_size):
+    """Top-left corner of an element's rendered layer on the canvas.
+
+    Rotated layers are larger than the element box and stay centred on it.
+    """
+    left, top, width, height = element_box(element, scale)
+    if element.get('rotation'):
+        center = (left + width / 2, top + height / 2)
+        return round(center[0] - layer_size[0] / 2), round(center[1] - layer_size[1] / 2)
+    return left, top
+
+
+def render_element(element, scale, public_dir):
+    """Render one element to (RGBA image, (left, top)) or None"""
+    layer = render_layer(element, scale, public_dir)
+    if layer is None:
+        return None
+    return layer, layer_position(element, scale, layer.size)
+
+
+def element_hash(element):
+    return hashlib.sha1(json.dumps(element, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def layer_key(element):
+    """Hash of what an element looks like, ignoring where it is"""
+    return element_hash({k: v for k, v in element.items() if k not in ('id', 'x', 'y')})
+
+
+@lru_cache(maxsize=8)
+def scaled_wallpaper(src, public_dir, size):
+    from PIL import Image
+
+    background = load_source(src, public_dir)
+    if background is None:
+        return None
+    return background.resize(size, Image.LANCZOS)
+
+
+class TileStore:
+    """Content-addressed PNG tiles under ``<cache dir>/tiles``"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], f'{key}.png')
+
+    def get(self, key):
+        from PIL import Image
+
+        if not self.root:
+            return None
+        try:
+            with Image.open(self.path(key)) as tile:
+                return tile.convert('RGBA')
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, tile):
+        if not self.root:
+            return
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        tile.save(tmp_path, format='PNG', compress_level=1)
+        os.replace(tmp_path, path)
+
+
+def render_wall(wall, scale, public_dir, tiles=None, stats=None, atlases=None):
+    """Composite one wall design into an RGBA image, tile by tile.
+
+    Each ``TILE_SIZE`` tile is keyed by the wallpaper, scale, its box and the
+    hashes of the elements overlapping it (in z-order), so after an edit only
+    tiles touched by the old or new position of a changed element miss the
+    cache.
+
+    Element layers come from the wall's atlas at this scale when one is
+    cached, so moving elements around costs no rasterising at all. A render
+    that rasterises every visible element packs them into that atlas.
+    """
+    from PIL import Image
+
+    size = (round(WALL_WIDTH * scale), round(WALL_HEIGHT * scale))
+    wall = wall or {}
+    tiles = tiles or TileStore(None)
+    atlases = atlases or AtlasCache(None)
+    elements = [element for element in wall.get('elements') or [] if isinstance(element, dict)]
+    index = GridIndex.from_elements(elements, TILE_SIZE, scale, pad=TILE_PAD, clip=size)
+    hashes = [element_hash(element) for element in elements]
+    base = design_hash(wall.get('wallpaper'), scale, size)
+    background = scaled_wallpaper(wall.get('wallpaper'), public_dir, size)
+
+    visible = sorted({item for items in index.cells.values() for item in items})
+    layer_keys = {item: layer_key(elements[item]) for item in visible}
+    atlas_id = atlas_key(layer_keys.values(), 'layers', scale)
+    atlas = atlases.get(atlas_id)
+    layers = {}
+
+    def get_layer(item):
+        if item not in layers:
+            layer = None
+            if atlas is not None:
+                rect = atlas.rect(layer_keys[item])
+                # Layers shrunk to fit a sheet are redrawn at full size
+                if rect and (rect['width'], rect['height']) == (rect['source_width'], rect['source_height']):
+                    layer = atlas.image(layer_keys[item])
+            if layer is None:
+                layer = render_layer(elements[item], scale, public_dir)
+            layers[item] = layer
+        return layers[item]
+
+    canvas = Image.new('RGBA', size)
+    for top in range(0, size[1], TILE_SIZE):
+        for left in range(0, size[0], TILE_SIZE):
+            box = (left, top, min(left + TILE_SIZE, size[0]), min(top + TILE_SIZE, size[1]))
+            items = index.query_cell((left // TILE_SIZE, top // TILE_SIZE))
+            key = design_hash('tile', base, box, [hashes[item] for item in items])
+
+            tile = tiles.get(key)
+            if tile is None:
+                if background is not None:
+                    tile = background.crop(box)
+                else:
+                    tile = Image.new('RGBA', (box[2] - left, box[3] - top), (255, 255, 255, 255))
+                for item in items:
+                    layer = get_layer(item)
+                    if layer is not None:
+                        x, y = layer_position(elements[item], scale, layer.size)
+                        composite(tile, layer, (x - left, y - top))
+                tiles.put(key, tile)
+                if stats is not None:
+                    stats['rendered'] = stats.get('rendered', 0) + 1
+            if stats is not None:
+                stats['tiles'] = stats.get('tiles', 0) + 1
+            canvas.paste(tile, box[:2])
+
+    if atlas is None and visible and len(layers) == len(visible):
+        packed = {layer_keys[item]: layer for item, layer in layers.items() if layer is not None}
+        if packed:
+            atlases.put(build_atlas(packed, atlas_id), compress_level=1)
+    return canvas
+
+
+def composite(canvas, layer, position):
+    """Alpha-blend a layer onto the canvas, clipping at the edges"""
+    left, top = position
+    # alpha_composite wants the source box fully inside the destination
+    src_left, src_top = max(0, -left), max(0, -top)
+    right = min(layer.width, canvas.width - left)
+    bottom = min(layer.height, canvas.height - top)
+    if right <= src_left or bottom <= src_top:
+        return
+    canvas.alpha_composite(layer, dest=(left + src_left, top + src_top), source=(src_left, src_top, right, bottom))
+
+
+def contact_sheet(walls, scale, public_dir, tiles=None, stats=None, atlases=None):
+    """2x2 sheet of the four walls with their names"""
+    from PIL import Image, ImageDraw
+
+    gutter, label = round(20 * scale), round(24 * scale)
+    cell_w, cell_h = round(WALL_WIDTH * scale), round(WALL_HEIGHT * scale)
+    sheet = Image.new('RGBA', (cell_w * 2 + gutter * 3, (cell_h + label) * 2 + gutter * 3), 'white')
+    draw = ImageDraw.Draw(sheet)
+    for index, (name, wall) in enumerate(walls):
+        column, row = index % 2, index // 2
+        x = gutter + column * (cell_w + gutter)
+        y = gutter + row * (cell_h + label + gutter)
+        draw.text((x, y), f'{name.capitalize()} Wall', fill='black')
+        sheet.paste(render_wall(wall, scale, public_dir, tiles, stats, atlases), (x, y + label))
+    return sheet
+
+
+def encode_image(pages, fmt, scale):
+    """Encode RGBA page images as PNG (first page) or a multi-page PDF"""
+    out = io.BytesIO()
+    if fmt == 'pdf':
+        rgb = [page.convert('RGB') for page in pages]
+        rgb[0].save(out, format='PDF', save_all=True, append_images=rgb[1:], resolution=96 * scale)
+    else:
+        pages[0].save(out, format='PNG', optimize=scale <= 1)
+    return out.getvalue()
+
+
+def render_job(job):
+    """Process-pool entry point; returns the encoded file bytes and tile stats"""
+    walls, scale, fmt, public_dir, sheet, cache_dir = job
+    tiles = TileStore(os.path.join(cache_dir, 'tiles'))
+    atlases = AtlasCache(os.path.join(cache_dir, 'atlas'))
+    stats = {}
+    if sheet:
+        pages = [contact_sheet(walls, scale, public_dir, tiles, stats, atlases)]
+        if fmt == 'pdf':
+            pages += [render_wall(wall, scale, public_dir, tiles, stats, atlases) for _, wall in walls]
+    else:
+        pages = [render_wall(walls[0][1], scale, public_dir, tiles, stats, atlases)]
+    return encode_image(pages, fmt, scale), stats
+
+
+class Renderer:
+    """Process pool plus on-disk render cache"""
+
+    def __init__(self, cache_dir, workers=2, timeout=60):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def cache_path(self, key, fmt):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.{fmt}')
+
+    def cached(self, key, ext, fn, job):
+        """Path of ``<key>.<ext>`` in the cache, running ``fn(job)`` on the
+        pool to produce it on a miss. ``fn`` returns (bytes, stats)."""
+        path = self.cache_path(key, ext)
+        if os.path.isfile(path):
+            try:
+                os.utime(path)  # Marks it used for the maintenance sweep
+            except OSError:
+                pass
+            return path
+
+        data, stats = self.pool.submit(fn, job).result(self.timeout)
+        if stats:
+            logger.info(f"Rendered {key[:12]}.{ext}: {stats.get('rendered', 0)}/{stats.get('tiles', 0)} tiles redrawn")
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    def render(self, walls, scale, fmt, public_dir, sheet=False):
+        """Path of the rendered file and its key.
+
+        ``walls`` is a list of (name, wall design) pairs.
+        """
+        key = design_hash(walls, scale, fmt, sheet)
+        job = (walls, scale, fmt, public_dir, sheet, self.cache_dir)
+        return self.cached(key, fmt, render_job, job), key
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def init_renderer(app):
+    cache_dir = app.config.get('RENDER_CACHE_DIR') or os.path.join(app.instance_path, 'render_cache')
+    app.extensions['renderer'] = Renderer(
+        cache_dir,
+        workers=app.config.get('RENDER_WORKERS', 2),
+        timeout=app.config.get('RENDER_TIMEOUT', 60),
+    )
+
+
+def get_renderer():
+    from flask import current_app
+    return current_app.extensions['renderer']
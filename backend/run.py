@@ -56,15 +56,11 @@ def init_database():
 def run_app():
     """Run the Flask application"""
     try:
-        from app import app
+        from app import create_app
         
         # Get configuration
         config_name = os.getenv('FLASK_ENV', 'development')
-        config_class = getattr(__import__('config'), f'{config_name.capitalize()}Config')
-        app.config.from_object(config_class)
-        
-        # Initialize app with config
-        config_class.init_app(app)
+        app = create_app(config_name)
         
         # Get host and port
         host = os.getenv('FLASK_HOST', '0.0.0.0')
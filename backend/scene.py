@@ -0,0 +1,236 @@
+"""
+3D room scene compilation
+
+Turns a saved session into one binary glTF (GLB) for the Room3D preview:
+a textured quad per designed wall plus one quad per element, all drawn from
+a texture atlas (``atlas.py``, usually a single sheet) through per-quad UV
+rects. The room is laid out as in ``Room3D.jsx`` (floor at y=-1, 0.2 thick walls, the north wall carrying
+the ``front`` design) and the quads sit just inside the walls' inner faces,
+so the client can keep drawing the furniture and plain walls itself.
+"""
+import hashlib
+import json
+import os
+import struct
+
+from atlas import AtlasCache, atlas_key
+from documents import DEFAULT_ROOM_DIMENSIONS, WALL_NAMES
+from geometry import WALL_WIDTH, WALL_HEIGHT
+from renderer import layer_key, layer_position, load_source, render_layer
+
+SCENE_VERSION = 2
+
+WALL_THICKNESS = 0.2
+FLOOR_Y = -1
+SURFACE_OFFSET = 0.01  # In front of the wall's inner face
+LAYER_OFFSET = 0.001  # Between stacked elements, to avoid z-fighting
+
+WHITE = 'white'  # Atlas key of the plain background texel
+
+GLB_MAGIC = 0x46546C67
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+# glTF constants
+FLOAT, UNSIGNED_INT = 5126, 5125
+ARRAY_BUFFER, ELEMENT_ARRAY_BUFFER = 34962, 34963
+LINEAR, CLAMP_TO_EDGE = 9729, 33071
+
+
+def wall_frames(room_dimensions):
+    """Per wall: (top-left corner, right step, down step, inward normal).
+
+    Steps are world units per canvas pixel, so a canvas point (x, y) is at
+    ``corner + x * right + y * down``.
+    """
+    room = dict(DEFAULT_ROOM_DIMENSIONS, **{k: v for k, v in (room_dimensions or {}).items() if v})
+    length, width, height = room['length'], room['width'], room['height']
+    inset = WALL_THICKNESS / 2 + SURFACE_OFFSET
+    top = FLOOR_Y + height
+    down = (0, -height / WALL_HEIGHT, 0)
+    return {
+        'front': ((-width / 2, top, -length / 2 + inset), (width / WALL_WIDTH, 0, 0), down, (0, 0, 1)),
+        'back': ((width / 2, top, length / 2 - inset), (-width / WALL_WIDTH, 0, 0), down, (0, 0, -1)),
+        'left': ((-width / 2 + inset, top, length / 2), (0, 0, -length / WALL_WIDTH), down, (1, 0, 0)),
+        'right': ((width / 2 - inset, top, -length / 2), (0, 0, length / WALL_WIDTH), down, (-1, 0, 0)),
+    }
+
+
+def _point(frame, x, y, depth):
+    corner, right, down, normal = frame
+    return tuple(corner[i] + x * right[i] + y * down[i] + depth * normal[i] for i in range(3))
+
+
+def collect_quads(wall_designs):
+    """Quads as (wall, element or None, atlas key, depth) and, per atlas
+    key, what to draw there: an element, a wallpaper source or WHITE"""
+    quads, sources = [], {}
+    for wall in WALL_NAMES:
+        design = (wall_designs or {}).get(wall) or {}
+        elements = [element for element in design.get('elements') or [] if isinstance(element, dict)]
+        if not design.get('wallpaper') and not elements:
+            continue  # Room3D keeps the plain wall colour
+
+        background = WHITE
+        if design.get('wallpaper'):
+            background = 'wallpaper:' + hashlib.sha1(design['wallpaper'].encode()).hexdigest()
+            sources[background] = design['wallpaper']
+        quads.append((wall, None, background, 0))
+
+        for depth, element in enumerate(elements, start=1):
+            # Same element drawn elsewhere shares its atlas slot
+            key = layer_key(element)
+            sources.setdefault(key, element)
+            quads.append((wall, element, key, depth))
+
+    sources[WHITE] = WHITE
+    return quads, sources
+
+
+def load_images(sources, public_dir):
+    """Rasterise every atlas source at canvas resolution"""
+    from PIL import Image
+
+    images = {}
+    for key, source in sources.items():
+        if source == WHITE:
+            image = Image.new('RGBA', (4, 4), (255, 255, 255, 255))
+        elif isinstance(source, dict):
+            image = render_layer(source, 1, public_dir)
+        else:
+            image = load_source(source, public_dir)
+            if image is not None:
+                image = image.resize((WALL_WIDTH, WALL_HEIGHT), Image.LANCZOS)
+        if image is not None:
+            images[key] = image
+    return images
+
+
+def _pad4(data, fill=b'\0'):
+    return data + fill * (-len(data) % 4)
+
+
+def compile_scene(room_dimensions, wall_designs, public_dir, atlases=None):
+    """Compile a session's walls into GLB bytes.
+
+    The atlas is cached by the set of things drawn (not where), so moving
+    elements or resizing the room re-uses the packed sheets.
+    """
+    atlases = atlases or AtlasCache(None)
+    frames = wall_frames(room_dimensions)
+    quads, sources = collect_quads(wall_designs)
+    if quads:
+        atlas = atlases.get_or_build(atlas_key(sources, 'scene'), lambda: load_images(sources, public_dir))
+        sheet_sizes = [(sheet['width'], sheet['height']) for sheet in atlas.manifest['sheets']]
+
+    # One primitive per atlas sheet
+    primitives = {}
+    for wall, element, key, depth in quads:
+        rect = atlas.rect(key)
+        if rect is None:
+            continue  # Source could not be loaded
+        if element is None:
+            x, y, w, h = 0, 0, WALL_WIDTH, WALL_HEIGHT
+        else:
+            w, h = rect['source_width'], rect['source_height']
+            x, y = layer_position(element, 1, (w, h))
+
+        positions, uvs, indices = primitives.setdefault(rect['sheet'], ([], [], []))
+        frame = frames[wall]
+        offset = depth * LAYER_OFFSET
+        base = len(positions)
+        positions += [
+            _point(frame, x, y, offset), _point(frame, x + w, y, offset),
+            _point(frame, x + w, y + h, offset), _point(frame, x, y + h, offset),
+        ]
+        ax, ay, aw, ah = rect['x'], rect['y'], rect['width'], rect['height']
+        if key == WHITE:
+            # Sample the middle of the white block only
+            ax, ay, aw, ah = ax + 1, ay + 1, aw - 2, ah - 2
+        sheet_w, sheet_h = sheet_sizes[rect['sheet']]
+        u0, v0, u1, v1 = ax / sheet_w, ay / sheet_h, (ax + aw) / sheet_w, (ay + ah) / sheet_h
+        uvs += [(u0, v0), (u1, v0), (u1, v1), (u0, v1)]
+        # Counter-clockwise seen from inside the room
+        indices += [base, base + 3, base + 2, base, base + 2, base + 1]
+
+    sheets = sorted(primitives)
+    buffer_views, accessors, binary = [], [], b''
+
+    def add_view(blob, target=None):
+        view = {'buffer': 0, 'byteOffset': len(binary), 'byteLength': len(blob)}
+        if target:
+            view['target'] = target
+        buffer_views.append(view)
+        return len(buffer_views) - 1, _pad4(blob)
+
+    mesh_primitives, images = [], []
+    for material, sheet in enumerate(sheets):
+        view, blob = add_view(atlas.sheet_png(sheet))
+        binary += blob
+        images.append({'bufferView': view, 'mimeType': 'image/png'})
+
+        positions, uvs, indices = primitives[sheet]
+        attributes = {}
+        for name, data, fmt, kind, target in (
+            ('POSITION', positions, 'f', 'VEC3', ARRAY_BUFFER),
+            ('TEXCOORD_0', uvs, 'f', 'VEC2', ARRAY_BUFFER),
+            ('indices', indices, 'I', 'SCALAR', ELEMENT_ARRAY_BUFFER),
+        ):
+            flat = [c for item in data for c in item] if kind != 'SCALAR' else data
+            view, blob = add_view(struct.pack(f'<{len(flat)}{fmt}', *flat), target)
+            binary += blob
+            accessor = {
+                'bufferView': view, 'componentType': FLOAT if fmt == 'f' else UNSIGNED_INT,
+                'count': len(data), 'type': kind,
+            }
+            if name == 'POSITION':
+                accessor['min'] = [min(p[i] for p in positions) for i in range(3)]
+                accessor['max'] = [max(p[i] for p in positions) for i in range(3)]
+            accessors.append(accessor)
+            attributes[name] = len(accessors) - 1
+        indices_accessor = attributes.pop('indices')
+        mesh_primitives.append({'attributes': attributes, 'indices': indices_accessor, 'material': material})
+
+    gltf = {
+        'asset': {'version': '2.0', 'generator': f'altarmaker-scene/{SCENE_VERSION}'},
+        'extensionsUsed': ['KHR_materials_unlit'],
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [{'mesh': 0, 'name': 'walls'}] if mesh_primitives else [{'name': 'walls'}],
+    }
+    if mesh_primitives:
+        gltf.update({
+            'buffers': [{'byteLength': len(binary)}],
+            'bufferViews': buffer_views,
+            'accessors': accessors,
+            'samplers': [{'magFilter': LINEAR, 'minFilter': LINEAR, 'wrapS': CLAMP_TO_EDGE, 'wrapT': CLAMP_TO_EDGE}],
+            'images': images,
+            'textures': [{'sampler': 0, 'source': index} for index in range(len(images))],
+            'materials': [
+                {
+                    'name': f'atlas-{sheet}',
+                    'pbrMetallicRoughness': {
+                        'baseColorTexture': {'index': index}, 'metallicFactor': 0, 'roughnessFactor': 1
+                    },
+                    'alphaMode': 'BLEND',
+                    'doubleSided': True,
+                    'extensions': {'KHR_materials_unlit': {}},
+                }
+                for index, sheet in enumerate(sheets)
+            ],
+            'meshes': [{'primitives': mesh_primitives}],
+        })
+
+    document = _pad4(json.dumps(gltf, separators=(',', ':')).encode(), b' ')
+    chunks = [struct.pack('<II', len(document), CHUNK_JSON), document]
+    if binary:
+        chunks += [struct.pack('<II', len(binary), CHUNK_BIN), binary]
+    body = b''.join(chunks)
+    return struct.pack('<III', GLB_MAGIC, 2, 12 + len(body)) + body
+
+
+def scene_job(job):
+    """Process-pool entry point"""
+    room_dimensions, wall_designs, public_dir, cache_dir = job
+    atlases = AtlasCache(os.path.join(cache_dir, 'atlas'))
+    return compile_scene(room_dimensions, wall_designs, public_dir, atlases), {}
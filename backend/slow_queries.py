@@ -0,0 +1,316 @@
+"""
+Slow query log
+
+A pymongo ``CommandListener`` notes every command that takes longer than
+``SLOW_QUERY_MS``:
+
+- the command, collection and endpoint that issued it
+  (``auth.verify_email``, ``background`` outside requests),
+- the shape of its filter, sort and pipeline, with values replaced by
+  ``'?'`` so the same query with different ids groups together,
+- its duration and the size of the reply.
+
+For ``SLOW_QUERY_EXPLAIN_RATE`` of them it also runs the command again under
+``explain`` (``executionStats``; writes are not executed) to record documents
+and index keys examined, documents returned and the plan's stages, e.g.
+``COLLSCAN``. Explains and file writes happen on a background thread, so the
+request only pays for copying the command when it was slow.
+
+Records are appended as JSON lines to ``SLOW_QUERY_LOG``. Report the worst
+shapes with::
+
+    python slow_queries.py [--log PATH] [--top 20] [--since 2024-01-01]
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import bson
+from pymongo import monitoring
+
+from metrics import current_endpoint
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = {'find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify'}
+
+# Command fields that are session or routing metadata, not part of the query
+META_FIELDS = {
+    'lsid', '$db', '$clusterTime', '$readPreference', 'txnNumber', 'startTransaction', 'autocommit',
+    'readConcern', 'writeConcern', 'apiVersion', 'apiStrict', 'apiDeprecationErrors',
+}
+
+# Fields whose value is part of the shape; other fields only by name
+SHAPE_FIELDS = ('filter', 'query', 'q', 'sort', 'pipeline', 'key', 'updates', 'deletes')
+
+
+def value_shape(value):
+    """``value`` with every literal replaced by '?', keeping keys and operators"""
+    if isinstance(value, dict):
+        return {key: value_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = value_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)  # ``$in`` lists of any length look the same
+        return shapes
+    return '?'
+
+
+def command_shape(command):
+    """The parts of a command that identify a query"""
+    shape = {}
+    for field in SHAPE_FIELDS:
+        if field not in command:
+            continue
+        value = command[field]
+        if field == 'key':
+            shape[field] = value  # distinct's field name is part of the query
+        elif field == 'sort':
+            shape[field] = dict(value)
+        elif field in ('updates', 'deletes'):
+            shape[field] = value_shape([{'q': statement.get('q', {})} for statement in value])
+        else:
+            shape[field] = value_shape(value)
+    return shape
+
+
+def shape_id(command_name, collection, shape):
+    payload = json.dumps([command_name, collection, shape], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+
+def _find(value, key):
+    """The first ``key`` in a nested explain document"""
+    if isinstance(value, dict):
+        if key in value:
+            return value[key]
+        value = list(value.values())
+    if isinstance(value, list):
+        for item in value:
+            found = _find(item, key)
+            if found is not None:
+                return found
+    return None
+
+
+def _stages(plan):
+    """Stage names of a plan, outermost first"""
+    stages = []
+    while isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        plan = plan.get('inputStage') or plan.get('queryPlan') or (plan.get('inputStages') or [None])[0]
+    return stages
+
+
+def explain_stats(explain):
+    """Docs and keys examined, docs returned and plan stages from an explain reply"""
+    stats = _find(explain, 'executionStats') or {}
+    return {
+        'docs_examined': stats.get('totalDocsExamined'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'n_returned': stats.get('nReturned'),
+        'plan': '<'.join(_stages(_find(explain, 'winningPlan'))) or None,
+    }
+
+
+def explain_command(command):
+    return {key: value for key, value in command.items() if key not in META_FIELDS}
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Logs commands slower than ``threshold_ms`` from a background thread"""
+
+    def __init__(self, path, threshold_ms=100, explain_rate=0.1, client=None, max_pending=1000):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.client = client  # Returns the sync MongoClient to explain with
+        self.dropped = 0
+        self._started = {}
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name not in ('explain', 'getMore'):
+            self._started[(event.connection_id, event.request_id)] = event.command
+
+    def succeeded(self, event):
+        command = self._started.pop((event.connection_id, event.request_id), None)
+        if command is None or event.duration_micros < self.threshold_ms * 1000:
+            return
+        self._record(event, command, reply_bytes=len(bson.encode(event.reply)))
+
+    def failed(self, event):
+        command = self._started.pop((event.connection_id, event.request_id), None)
+        if command is None or event.duration_micros < self.threshold_ms * 1000:
+            return
+        self._record(event, command, error=str(event.failure.get('errmsg', 'failed')))
+
+    def _record(self, event, command, **fields):
+        collection = command.get(event.command_name)
+        shape = command_shape(command)
+        record = dict(
+            fields,
+            ts=datetime.utcnow().isoformat(),
+            command=event.command_name,
+            collection=collection if isinstance(collection, str) else None,
+            shape=shape,
+            shape_id=shape_id(event.command_name, collection, shape),
+            endpoint=current_endpoint(),
+            duration_ms=round(event.duration_micros / 1000, 2),
+        )
+        explain = None
+        if (self.client and event.command_name in EXPLAINABLE
+                and random.random() < self.explain_rate):
+            explain = (event.database_name, explain_command(command))
+        try:
+            self._queue.put_nowait((record, explain))
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._thread is None:
+            with self._lock:
+                # Started on first use, so forking servers do not copy it
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='slow-queries', daemon=True)
+                    self._thread.start()
+
+    def _explain(self, database, command):
+        try:
+            reply = self.client()[database].command({'explain': command, 'verbosity': 'executionStats'})
+            return explain_stats(reply)
+        except Exception as e:
+            return {'explain_error': str(e)}
+
+    def _run(self):
+        while True:
+            record, explain = self._queue.get()
+            if explain is not None:
+                record.update(self._explain(*explain))
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(self.path, 'a') as fh:
+                    fh.write(json.dumps(record, default=str) + '\n')
+            except OSError as e:
+                logger.error(f"Could not write slow query log {self.path}: {e}")
+            logger.warning(f"Slow {record['command']} on {record['collection']} "
+                           f"({record['duration_ms']}ms) from {record['endpoint']}")
+
+
+def slow_query_log(config, default_dir, client=None):
+    """A listener for ``config``, or None when the log is disabled"""
+    if not config.get('SLOW_QUERY_ENABLED', True):
+        return None
+    return SlowQueryLog(
+        config.get('SLOW_QUERY_LOG') or os.path.join(default_dir, 'slow_queries.jsonl'),
+        threshold_ms=config.get('SLOW_QUERY_MS', 100),
+        explain_rate=config.get('SLOW_QUERY_EXPLAIN_RATE', 0.1),
+        client=client,
+    )
+
+
+def init_slow_queries(app):
+    mongo = app.extensions['mongo']
+    listener = slow_query_log(app.config, app.instance_path, client=lambda: mongo.client)
+    if listener is not None:
+        mongo.listeners.append(listener)
+        app.extensions['slow_queries'] = listener
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def read_log(path, since=None):
+    with open(path) as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if since is None or record.get('ts', '') >= since:
+                yield record
+
+
+def report(records):
+    """Query shapes, worst total time first"""
+    groups = defaultdict(list)
+    for record in records:
+        groups[record['shape_id']].append(record)
+    rows = []
+    for key, group in groups.items():
+        durations = [record['duration_ms'] for record in group]
+        explained = [record for record in group if record.get('docs_examined') is not None]
+        endpoints = defaultdict(int)
+        for record in group:
+            endpoints[record.get('endpoint')] += 1
+        rows.append({
+            'shape_id': key,
+            'command': group[0]['command'],
+            'collection': group[0]['collection'],
+            'shape': group[0]['shape'],
+            'count': len(group),
+            'total_ms': round(sum(durations), 1),
+            'p50_ms': _percentile(durations, 0.5),
+            'p95_ms': _percentile(durations, 0.95),
+            'max_ms': max(durations),
+            'endpoints': sorted(endpoints, key=endpoints.get, reverse=True),
+            'avg_reply_bytes': round(sum(record.get('reply_bytes') or 0 for record in group) / len(group)),
+            'explained': len(explained),
+            'avg_docs_examined': (round(sum(record['docs_examined'] for record in explained) / len(explained))
+                                  if explained else None),
+            'avg_returned': (round(sum(record.get('n_returned') or 0 for record in explained) / len(explained))
+                             if explained else None),
+            'plans': sorted({record['plan'] for record in explained if record.get('plan')}),
+        })
+    return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', help='slow query log (default: SLOW_QUERY_LOG or instance/slow_queries.jsonl)')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--since', help='only records at or after this ISO date')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    path = args.log or os.getenv('SLOW_QUERY_LOG') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'slow_queries.jsonl')
+    if not os.path.exists(path):
+        logger.error(f"No slow query log at {path}")
+        raise SystemExit(1)
+
+    started = time.monotonic()
+    rows = report(read_log(path, args.since))[:args.top]
+    if args.json:
+        print(json.dumps(rows, indent=2, default=str))
+        return
+    for row in rows:
+        examined = (f"{row['avg_docs_examined']} examined / {row['avg_returned']} returned "
+                    f"({', '.join(row['plans']) or '?'})" if row['explained'] else 'not explained')
+        logger.info(f"{row['total_ms']:>10.1f}ms {row['count']:>6}x  p50 {row['p50_ms']}ms  "
+                    f"p95 {row['p95_ms']}ms  max {row['max_ms']}ms  "
+                    f"{row['command']} {row['collection']}  {examined}")
+        logger.info(f"{'':>19}{json.dumps(row['shape'], default=str)}")
+        logger.info(f"{'':>19}from {', '.join(str(e) for e in row['endpoints'][:5])}, "
+                    f"{row['avg_reply_bytes']} reply bytes on average")
+    logger.info(f"{len(rows)} shapes in {(time.monotonic() - started) * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Static asset serving for the React build
+
+- Fingerprinted build output (``assets/index-3f9a1c2b.js``) is served with
+  ``Cache-Control: immutable`` for a year; everything else revalidates by ETag.
+- Precompressed ``.br`` / ``.gz`` siblings are picked by ``Accept-Encoding``.
+- Catalog images are swapped for the AVIF/WebP variant built by
+  ``asset_pipeline.py`` when ``Accept`` allows it (``?w=`` picks a width).
+- Range and conditional requests are handled by ``send_file``.
+- ``index.html`` is kept in memory for the SPA fallback and reloaded only when
+  the file changes on disk.
+- With ``STATIC_X_ACCEL_PREFIX`` set, responses carry ``X-Accel-Redirect`` so
+  nginx streams the bytes instead of Python.
+
+CLI:
+    python static_files.py precompress [DIST_DIR]   # write .br/.gz siblings
+    python static_files.py nginx [DIST_DIR]         # print an nginx server block
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import threading
+
+from flask import Response, abort, current_app, request, send_file
+from werkzeug.security import safe_join
+
+from asset_pipeline import FORMATS as IMAGE_FORMATS, VariantManifest
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip always works
+    brotli = None
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+# Vite emits ``name-<hash>.ext`` with an 8+ character base64url hash
+FINGERPRINT_RE = re.compile(r'[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+# Encoding token -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def is_fingerprinted(path):
+    """True for build artifacts whose name changes with their content"""
+    return path.startswith(('assets/', 'variants/')) and bool(FINGERPRINT_RE.search(path))
+
+
+def accepted_encodings():
+    """Content codings the client accepts (q=0 entries excluded)"""
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        token, _, params = item.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        if token:
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+def accepted_image_formats():
+    """Variant formats named explicitly in Accept, best first (``*/*`` is not enough)"""
+    accepted = {value for value, quality in request.accept_mimetypes if quality > 0}
+    return [fmt for fmt, (mimetype, _) in IMAGE_FORMATS.items() if mimetype in accepted]
+
+
+variant_manifest = VariantManifest()
+
+
+def cache_control_for(path):
+    if is_fingerprinted(path):
+        return IMMUTABLE_CACHE
+    max_age = current_app.config.get('STATIC_MAX_AGE', 3600)
+    return f'public, max-age={max_age}, must-revalidate'
+
+
+def _x_accel_response(path, encoding, mimetype):
+    """Hand the transfer to nginx via X-Accel-Redirect"""
+    prefix = current_app.config['STATIC_X_ACCEL_PREFIX'].rstrip('/')
+    response = Response(mimetype=mimetype)
+    response.headers['X-Accel-Redirect'] = f'{prefix}/{path}'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def send_static(path):
+    """Serve ``path`` from the static folder, or 404"""
+    root = current_app.static_folder
+    full_path = safe_join(root, path)
+    if full_path is None or not os.path.isfile(full_path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    served_path, served_rel, encoding = full_path, path, None
+
+    negotiated = mimetype.startswith('image/') and bool(variant_manifest.assets(root).get(path))
+    if negotiated:
+        variant = variant_manifest.select(
+            root, path, accepted_image_formats(), request.args.get('w', type=int)
+        )
+        variant_file = variant and safe_join(root, variant['path'])
+        if variant_file and os.path.isfile(variant_file):
+            served_path, served_rel = variant_file, variant['path']
+            mimetype = IMAGE_FORMATS[variant['format']][0]
+    else:
+        accepted = accepted_encodings()
+        for token, suffix in ENCODINGS:
+            if token in accepted and os.path.isfile(full_path + suffix):
+                served_path, served_rel, encoding = full_path + suffix, path + suffix, token
+                break
+
+    if current_app.config.get('STATIC_X_ACCEL_PREFIX'):
+        response = _x_accel_response(served_rel, encoding, mimetype)
+    else:
+        response = send_file(served_path, mimetype=mimetype, conditional=True, etag=True, max_age=None)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.headers['Cache-Control'] = cache_control_for(path)
+    if negotiated:
+        response.vary.add('Accept')
+    elif _has_compressed_variant(full_path):
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def _has_compressed_variant(full_path):
+    return any(os.path.isfile(full_path + suffix) for _, suffix in ENCODINGS)
+
+
+class IndexCache:
+    """In-memory copy of index.html, refreshed when its mtime changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._body = None
+        self._gzipped = None
+        self._etag = None
+
+    def _load(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        if key == self._key:
+            return
+        with self._lock:
+            if key == self._key:
+                return
+            with open(path, 'rb') as fh:
+                body = fh.read()
+            self._body = body
+            self._gzipped = gzip.compress(body, compresslevel=9)
+            self._etag = hashlib.sha1(body).hexdigest()
+            self._key = key
+
+    def response(self):
+        """Response with index.html, honouring If-None-Match and gzip"""
+        path = os.path.join(current_app.static_folder, 'index.html')
+        try:
+            self._load(path)
+        except OSError:
+            abort(404)
+
+        if self._etag in request.if_none_match:
+            response = Response(status=304)
+        elif 'gzip' in accepted_encodings():
+            response = Response(self._gzipped, mimetype='text/html')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(self._body, mimetype='text/html')
+
+        response.set_etag(self._etag)
+        # The shell must always revalidate so new deploys are picked up
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+index_cache = IndexCache()
+
+
+def precompress(root, min_size=1024):
+    """Write .gz (and .br when available) siblings for compressible files"""
+    written = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(('.gz', '.br')):
+                continue
+            path = os.path.join(dirpath, filename)
+            mimetype = mimetypes.guess_type(path)[0] or ''
+            if not mimetype.startswith(COMPRESSIBLE_TYPES) or os.path.getsize(path) < min_size:
+                continue
+
+            with open(path, 'rb') as fh:
+                data = fh.read()
+            mtime = os.path.getmtime(path)
+
+            outputs = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                outputs.append(('.br', lambda: brotli.compress(data, quality=11)))
+
+            for suffix, compress in outputs:
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                    continue
+                compressed = compress()
+                if len(compressed) >= len(data):
+                    continue
+                with open(target, 'wb') as fh:
+                    fh.write(compressed)
+                written += 1
+    return written
+
+
+NGINX_TEMPLATE = """\
+# Generated by `python static_files.py nginx`
+upstream altarmaker_api {{
+    server 127.0.0.1:5000;
+}}
+
+server {{
+    listen 80;
+    root {root};
+
+    gzip_static on;
+    # brotli_static needs ngx_brotli; remove if the module is not installed
+    brotli_static on;
+
+    location /api/ {{
+        proxy_pass http://altarmaker_api;
+        proxy_set_header Host $host;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;
+    }}
+
+    # Target of X-Accel-Redirect when STATIC_X_ACCEL_PREFIX={accel_prefix}
+    location {accel_prefix}/ {{
+        internal;
+        alias {root}/;
+    }}
+
+    location /assets/ {{
+        add_header Cache-Control "{immutable}";
+        try_files $uri =404;
+    }}
+
+    location = /index.html {{
+        add_header Cache-Control "no-cache";
+    }}
+
+    location / {{
+        add_header Cache-Control "public, max-age={max_age}, must-revalidate";
+        try_files $uri /index.html;
+    }}
+}}
+"""
+
+
+def nginx_config(root, accel_prefix='/_static', max_age=3600):
+    return NGINX_TEMPLATE.format(
+        root=os.path.abspath(root), accel_prefix=accel_prefix, immutable=IMMUTABLE_CACHE, max_age=max_age
+    )
+
+
+def main(argv):
+    logging.basicConfig(level=logging.INFO)
+    default_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend', 'dist')
+    if len(argv) < 2 or argv[1] not in ('precompress', 'nginx'):
+        logger.info(__doc__)
+        return 1
+
+    root = argv[2] if len(argv) > 2 else default_root
+    if argv[1] == 'precompress':
+        written = precompress(root)
+        logger.info(f"Wrote {written} precompressed files under {os.path.abspath(root)}")
+    else:
+        sys.stdout.write(nginx_config(root))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
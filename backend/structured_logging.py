@@ -0,0 +1,260 @@
+"""
+Structured logging for the Flask and ASGI apps
+
+``configure_logging`` puts one ``QueueHandler`` on the root logger, so a
+log call in a request thread only appends the record to an in-memory queue.
+A ``QueueListener`` thread formats records and writes them to stderr (and
+``LOG_FILE``), as JSON lines or, with ``LOG_FORMAT=text``, as plain lines
+for development. When the queue is full, records are dropped and counted
+rather than blocking the request.
+
+Every record carries the ``request_id`` of the request that logged it (the
+``X-Request-ID`` header if the client sent a sane one, else a new id, echoed
+in the response) and its endpoint, so the lines of one request can be
+grepped together. Records logged in a traced request also carry its
+``trace_id``. Extra fields passed with ``extra={...}`` become JSON
+fields.
+
+Noisy paths are sampled: DEBUG records are kept at ``LOG_DEBUG_SAMPLE_RATE``
+and records below WARNING from the loggers in ``LOG_SAMPLE_RATES``
+(``"renderer=0.1,write_behind=0.5"``) at their rate. Kept records carry the
+rate as ``sample_rate``. Warnings and errors are never sampled.
+
+Email addresses and verification/bearer tokens are redacted from messages
+and fields, and fields named like secrets are dropped, on the listener
+thread.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from metrics import current_endpoint
+from tracing import trace_id
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+
+EMAIL = re.compile(r'\b([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9.-]+\.[A-Za-z]{2,})\b')
+# itsdangerous tokens: payload.timestamp.signature
+SIGNED_TOKEN = re.compile(r'\b[A-Za-z0-9_-]{8,}\.[A-Za-z0-9_-]{4,8}\.[A-Za-z0-9_-]{20,}\b')
+BEARER = re.compile(r'(?i)\b(bearer|token=)\s*[A-Za-z0-9._~+/=-]+')
+SECRET_FIELDS = re.compile(r'(?i)password|secret|token|authorization|cookie')
+
+# Attributes of every LogRecord; anything else came from ``extra``
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_listener = None
+
+
+def redact(text):
+    """``text`` without email addresses and tokens"""
+    text = EMAIL.sub(r'\1***@\2', text)
+    text = SIGNED_TOKEN.sub('[token]', text)
+    return BEARER.sub(lambda match: f'{match.group(1)} [token]', text)
+
+
+def _redact_value(value):
+    if isinstance(value, str):
+        return redact(value)
+    if isinstance(value, dict):
+        return {key: '[redacted]' if SECRET_FIELDS.search(str(key)) else _redact_value(item)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact_value(item) for item in value]
+    return value
+
+
+def request_id():
+    return _request_id.get()
+
+
+def start_request(header_value=None):
+    """Set the request id for this context: the client's if it is sane, else a new one"""
+    value = header_value if header_value and _VALID_REQUEST_ID.match(header_value) else uuid.uuid4().hex
+    _request_id.set(value)
+    return value
+
+
+def end_request():
+    _request_id.set(None)
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the request id, endpoint and trace id; runs in the thread that logs"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        record.endpoint = current_endpoint()
+        record.trace_id = trace_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of DEBUG records and of sub-WARNING records of noisy loggers"""
+
+    def __init__(self, debug_rate=1.0, rates=None):
+        super().__init__()
+        self.debug_rate = debug_rate
+        self.rates = rates or {}
+
+    def rate(self, record):
+        if record.levelno >= logging.WARNING:
+            return 1.0
+        rate = 1.0
+        name = record.name
+        while name:
+            if name in self.rates:
+                rate = self.rates[name]
+                break
+            name = name.rpartition('.')[0]
+        if record.levelno <= logging.DEBUG:
+            rate = min(rate, self.debug_rate)
+        return rate
+
+    def filter(self, record):
+        rate = self.rate(record)
+        if rate >= 1.0:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Renders the message in the calling thread and never waits for the queue"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Arguments may change after the call returns; render them now
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, redacted"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key in _RECORD_FIELDS or value is None:
+                continue
+            entry[key] = '[redacted]' if SECRET_FIELDS.search(key) else _redact_value(value)
+        if record.exc_text:
+            entry['exc'] = redact(record.exc_text)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Readable lines for development, redacted the same way"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(name)s] %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        if getattr(record, 'request_id', None):
+            line += f' request_id={record.request_id}'
+        if getattr(record, 'trace_id', None):
+            line += f' trace_id={record.trace_id}'
+        return redact(line)
+
+
+def parse_rates(value):
+    """``"renderer=0.1,write_behind=0.5"`` as {logger: rate}"""
+    if isinstance(value, dict):
+        return value
+    rates = {}
+    for item in (value or '').split(','):
+        name, _, rate = item.partition('=')
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def configure_logging(config):
+    """Route the root logger through the queue; safe to call again (the last call wins)"""
+    global _listener
+
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if config.get('LOG_FILE'):
+        handlers.append(logging.FileHandler(config['LOG_FILE']))
+    formatter = TextFormatter() if config.get('LOG_FORMAT', 'json') == 'text' else JsonFormatter()
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(config.get('LOG_QUEUE_SIZE', 10000)))
+    queue_handler.addFilter(SamplingFilter(
+        debug_rate=config.get('LOG_DEBUG_SAMPLE_RATE', 1.0),
+        rates=parse_rates(config.get('LOG_SAMPLE_RATES')),
+    ))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    if _listener is not None:
+        _listener.stop()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return queue_handler
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()  # Writes what is still queued
+
+
+atexit.register(_stop_listener)
+
+
+def init_logging(app):
+    """Configure logging from the app's config and tag its requests with an id"""
+    from flask import request
+
+    configure_logging(app.config)
+
+    @app.before_request
+    def start_request_id():
+        start_request(request.headers.get(REQUEST_ID_HEADER))
+
+    @app.after_request
+    def add_request_id(response):
+        if request_id():
+            response.headers[REQUEST_ID_HEADER] = request_id()
+        return response
+
+    @app.teardown_request
+    def end_request_id(exc=None):
+        end_request()
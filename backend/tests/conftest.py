@@ -0,0 +1,75 @@
+"""
+Shared fixtures: a ``testing`` app on an in-memory (mongomock) database
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from extensions import get_db  # noqa: E402
+
+PASSWORD = 'password123'
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    yield app
+    with app.app_context():
+        db = get_db()
+        db.client.drop_database(db.name)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        yield get_db()
+
+
+def make_user(db, username, role='user', verified=True):
+    """Insert a user the way registration and verification leave it"""
+    user = {
+        'username': username,
+        'email': f'{username}@example.com',
+        'password': generate_password_hash(PASSWORD),
+        'role': role,
+        'email_verified': verified,
+        'verification_token': None,
+        'created_at': datetime.now(),
+        'last_login': None,
+    }
+    user['_id'] = db.users.insert_one(user).inserted_id
+    return user
+
+
+def login(client, username, role='user'):
+    return client.post('/api/auth/login', json={'username': username, 'password': PASSWORD, 'role': role})
+
+
+@pytest.fixture
+def user(db):
+    return make_user(db, 'designer')
+
+
+@pytest.fixture
+def auth_client(client, user):
+    assert login(client, user['username']).status_code == 200
+    return client
+
+
+@pytest.fixture
+def admin_client(app, db):
+    client = app.test_client()
+    admin = make_user(db, 'admin', role='admin')
+    assert login(client, admin['username'], role='admin').status_code == 200
+    return client
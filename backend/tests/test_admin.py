@@ -0,0 +1,51 @@
+def test_admin_only(auth_client):
+    assert auth_client.get('/api/admin/stats').status_code == 403
+
+
+def test_stats(admin_client, user):
+    response = admin_client.get('/api/admin/stats')
+    assert response.status_code == 200
+
+
+def test_delete_user_queues_job(app, admin_client, db, user):
+    user_id = str(user['_id'])
+    response = admin_client.delete(f'/api/admin/users/{user_id}')
+    assert response.status_code == 202
+    assert db.users.find_one({'_id': user['_id']}) is None
+    # No worker thread in testing: the job waits until it is run
+    assert admin_client.get(f'/api/admin/deletion-jobs/{user_id}').get_json()['job']['status'] == 'queued'
+    assert app.extensions['user_deletion'].run_pending() == 1
+    assert admin_client.get(f'/api/admin/deletion-jobs/{user_id}').get_json()['job']['status'] == 'done'
+
+
+def test_deletion_job_removes_data_and_releases_blobs(app, admin_client, auth_client, db, user):
+    from conftest import login, make_user
+    from test_sessions import payload
+    from wall_store import BLOB_COLLECTION
+
+    other = app.test_client()
+    make_user(db, 'other')
+    login(other, 'other')
+    # design1's wall is shared with another user's session, design2's is only this user's
+    assert auth_client.post('/api/sessions', json=payload('Shared')).status_code == 201
+    assert auth_client.post('/api/sessions', json=payload('Own', '/wallpapers/design2.png')).status_code == 201
+    assert auth_client.post('/api/designs/wall-designs', json={
+        'wallDesigns': {'front': {'elements': [], 'wallpaper': '/wallpapers/design3.png'}}
+    }).status_code == 200
+    assert other.post('/api/sessions', json=payload('Theirs')).status_code == 201
+    refs = {s['session_name']: s['wall_designs']['front']['ref'] for s in db.sessions.find()}
+
+    user_id = str(user['_id'])
+    assert admin_client.delete(f'/api/admin/users/{user_id}').status_code == 202
+    assert app.extensions['user_deletion'].run_pending() == 1
+
+    assert db.sessions.count_documents({'user_id': user_id}) == 0
+    assert db.wall_designs.count_documents({'user_id': user_id}) == 0
+    assert db[BLOB_COLLECTION].find_one({'_id': refs['Own']}) is None
+    assert db[BLOB_COLLECTION].find_one({'_id': refs['Shared']}) is not None
+    assert [s['session_name'] for s in db.sessions.find()] == ['Theirs']
+    job = admin_client.get(f'/api/admin/deletion-jobs/{user_id}').get_json()['job']
+    assert job['status'] == 'done'
+    assert job['progress']['sessions'] == 2
+    assert job['progress']['wall_blobs'] == 1
+    assert job['progress']['wall_designs'] == 1
@@ -0,0 +1,32 @@
+from app import create_app
+from config import TestingConfig
+
+
+def test_testing_config(app):
+    assert app.config['TESTING']
+    assert app.config['MONGO_CLIENT_FACTORY'] == TestingConfig.MONGO_CLIENT_FACTORY
+    assert app.config['WRITE_BEHIND_SECONDS'] == 0
+    assert app.config['MAINTENANCE_INTERVAL_SECONDS'] == 0
+    assert not app.config['DELETION_WORKER_ENABLED']
+
+
+def test_blueprints_registered(app):
+    assert {'health', 'auth', 'designs', 'sessions', 'admin', 'feedback', 'frontend'} <= set(app.blueprints)
+
+
+def test_apps_are_independent():
+    first, second = create_app('testing'), create_app('testing')
+    assert first.extensions['write_behind'] is not second.extensions['write_behind']
+
+
+def test_no_background_threads(client):
+    client.get('/api/health')
+    app = client.application
+    assert app.extensions['maintenance']._thread is None
+    assert app.extensions['user_deletion']._thread is None
+
+
+def test_health(client):
+    response = client.get('/api/health')
+    assert response.status_code == 200
+    assert response.get_json()['database'] == 'connected'
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from quart.testing.connections import WebsocketDisconnectError
+
+import asgi
+
+SESSION_ID = '507f1f77bcf86cd799439011'
+
+
+class Hub:
+    """Records joins; every session is missing, so the socket closes after the join"""
+
+    def __init__(self):
+        self.joined = []
+
+    async def join(self, session_id, user_id, client_id):
+        self.joined.append(session_id)
+        return None, None
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    hub = Hub()
+    monkeypatch.setattr(asgi, 'hub', hub)
+    monkeypatch.setitem(asgi.app.config, 'SECRET_KEY', 'test-secret')
+    return hub
+
+
+def connect(origin):
+    async def run():
+        client = asgi.app.test_client()
+        async with client.session_transaction() as session:
+            session.update(logged_in=True, user_id='u1', username='u1', role='user')
+        headers = {'Origin': origin} if origin else {}
+        with pytest.raises(WebsocketDisconnectError) as closed:
+            async with client.websocket(f'/api/sessions/{SESSION_ID}/live', headers=headers) as socket:
+                await socket.receive()
+        return closed.value.args[0]
+    return asyncio.run(run())
+
+
+def test_live_session_rejects_cross_site_origin(hub):
+    assert connect('https://attacker.example') == 1008
+    assert connect(None) == 1008
+    assert hub.joined == []
+
+
+def test_live_session_accepts_app_origins(hub):
+    connect('http://localhost:5173')
+    connect(asgi.app.config['APP_URL'])
+    assert hub.joined == [SESSION_ID, SESSION_ID]
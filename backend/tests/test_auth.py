@@ -0,0 +1,37 @@
+from conftest import PASSWORD, login, make_user
+
+
+def test_register(client, db):
+    response = client.post('/api/auth/register', json={
+        'username': 'newuser', 'email': 'newuser@example.com', 'password': PASSWORD
+    })
+    assert response.status_code == 201
+    assert 'password' not in response.get_json()['user']
+    stored = db.users.find_one({'username': 'newuser'})
+    assert stored['role'] == 'user'
+    assert not stored['email_verified']
+    assert stored['verification_token']
+
+
+def test_register_rejects_admin_and_duplicates(client, user):
+    body = {'username': 'other', 'email': 'other@example.com', 'password': PASSWORD, 'role': 'admin'}
+    assert client.post('/api/auth/register', json=body).status_code == 403
+    body = {'username': user['username'], 'email': 'other@example.com', 'password': PASSWORD}
+    assert client.post('/api/auth/register', json=body).status_code == 409
+
+
+def test_login_and_status(client, user):
+    assert client.get('/api/auth/status').get_json()['authenticated'] is False
+    response = login(client, user['username'])
+    assert response.status_code == 200
+    assert response.get_json()['user']['username'] == user['username']
+    assert client.get('/api/auth/status').get_json()['authenticated'] is True
+    client.post('/api/auth/logout')
+    assert client.get('/api/auth/status').get_json()['authenticated'] is False
+
+
+def test_login_failures(client, db, user):
+    assert client.post('/api/auth/login', json={'username': user['username'], 'password': 'wrong'}).status_code == 401
+    assert login(client, user['username'], role='admin').status_code == 401
+    make_user(db, 'unverified', verified=False)
+    assert login(client, 'unverified').status_code == 403
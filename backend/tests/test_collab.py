@@ -0,0 +1,121 @@
+import asyncio
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+from collab import OPS_COLLECTION, MongoOpStore
+from documents import session_document, session_update
+from element_codec import decode_wall_designs
+from wall_store import load_walls, save_blobs
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args):
+        self.cursor.sort(*args)
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.cursor:
+            yield document
+
+
+class AsyncCollection:
+    """The Motor calls MongoOpStore makes, over a mongomock collection"""
+
+    def __init__(self, collection, before_write=None):
+        self.collection = collection
+        self.before_write = before_write
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return self.collection.find_one(*args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        if self.before_write:
+            self.before_write()
+        return self.collection.update_one(*args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return self.collection.delete_many(*args, **kwargs)
+
+
+class AsyncDatabase:
+    def __init__(self, db):
+        self.db = db
+        self.before_session_write = None
+
+    def __getitem__(self, name):
+        before = (lambda: self.before_session_write and self.before_session_write()) if name == 'sessions' else None
+        return AsyncCollection(self.db[name], before)
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+def wall(wallpaper, elements=()):
+    return {'elements': list(elements), 'wallpaper': wallpaper}
+
+
+@pytest.fixture
+def store():
+    db = mongomock.MongoClient().db
+    design = {'session_name': 'Live', 'room_type': 'bedroom', 'wall_designs': {'front': wall('/wallpapers/design1.png')}}
+    document, blobs = session_document('u1', design, 100)
+    save_blobs(db, blobs)
+    session_id = str(db.sessions.insert_one(document).inserted_id)
+    element = {'id': 'e1', 'type': 'sticker', 'content': '/images/a.png', 'x': 1, 'y': 2, 'width': 100, 'height': 100}
+    db[OPS_COLLECTION].insert_one({'session_id': session_id, 'seq': 1, 'lamport': 1, 'wall': 'front',
+                                   'op': 'upsert', 'id': 'e1', 'element': element})
+    return db, session_id, MongoOpStore(AsyncDatabase(db))
+
+
+def front(db, session_id):
+    session = load_walls(db, [db.sessions.find_one({'_id': ObjectId(session_id)})])[0]
+    return decode_wall_designs(session['wall_designs'])['front']
+
+
+def test_compact_folds_ops(store):
+    db, session_id, ops = store
+    asyncio.run(ops.compact(session_id, 'u1', 1, 1))
+    assert [element['id'] for element in front(db, session_id)['elements']] == ['e1']
+    assert db.sessions.find_one({'_id': ObjectId(session_id)})['ops_seq'] == 1
+    assert db[OPS_COLLECTION].count_documents({}) == 0
+
+
+def test_compact_updates_session_size(store):
+    from documents import wall_bytes
+
+    db, session_id, ops = store
+    before = db.sessions.find_one({'_id': ObjectId(session_id)})
+    asyncio.run(ops.compact(session_id, 'u1', 1, 1))
+    after = db.sessions.find_one({'_id': ObjectId(session_id)})
+    assert after['wall_sizes']['front'] == wall_bytes(front(db, session_id))
+    assert after['size_bytes'] == before['size_bytes'] - before['wall_sizes']['front'] + after['wall_sizes']['front']
+
+
+def test_compact_refolds_over_a_concurrent_save(store):
+    db, session_id, ops = store
+    update, blobs = session_update({'session_name': 'Live', 'room_type': 'bedroom',
+                                    'wall_designs': {'front': wall('/wallpapers/design2.png')}})
+    save_blobs(db, blobs)
+    saves = [update]
+
+    def save_lands():
+        # A whole-session PUT written between compaction's read and its write
+        if saves:
+            db.sessions.update_one({'_id': ObjectId(session_id)}, {'$set': saves.pop()})
+
+    ops.db.before_session_write = save_lands
+    asyncio.run(ops.compact(session_id, 'u1', 1, 1))
+    wall_design = front(db, session_id)
+    assert wall_design['wallpaper'] == '/wallpapers/design2.png'
+    assert [element['id'] for element in wall_design['elements']] == ['e1']
@@ -0,0 +1,57 @@
+def wall_designs(wallpaper='/wallpapers/design1.png'):
+    return {'wallDesigns': {'front': {'elements': [], 'wallpaper': wallpaper}}}
+
+
+def test_wall_designs_round_trip(auth_client):
+    assert auth_client.post('/api/designs/wall-designs', json=wall_designs()).status_code == 200
+    response = auth_client.get('/api/designs/wall-designs')
+    assert response.status_code == 200
+    assert response.get_json()['wallDesigns']['front']['wallpaper'] == '/wallpapers/design1.png'
+
+
+def test_wall_designs_unknown_asset(auth_client):
+    response = auth_client.post('/api/designs/wall-designs', json=wall_designs('/wallpapers/missing.png'))
+    assert response.status_code == 400
+
+
+def test_templates(auth_client):
+    response = auth_client.get('/api/designs/templates')
+    assert response.status_code == 200
+
+
+def test_chunked_body_is_size_checked(app, auth_client):
+    import io
+    import json
+
+    app.config['MAX_DESIGN_PAYLOAD_BYTES'] = 100
+    body = json.dumps(wall_designs('/wallpapers/design1.png' + ' ' * 200)).encode()
+    # As a server passes a chunked body: no Content-Length, the stream ends on its own
+    response = auth_client.post('/api/designs/wall-designs', input_stream=io.BytesIO(body),
+                                headers={'Content-Type': 'application/json', 'Transfer-Encoding': 'chunked'},
+                                environ_overrides={'wsgi.input_terminated': True})
+    assert response.status_code == 413
+
+
+def test_templates_share_structure_only(auth_client, db):
+    from documents import session_document
+    from wall_store import save_blobs
+
+    photo = 'data:image/jpeg;base64,cHJpdmF0ZQ=='
+    design = {
+        'session_name': 'Shared layout',
+        'room_type': 'bedroom',
+        'wall_designs': {'front': {'wallpaper': '/wallpapers/design1.png', 'elements': [
+            {'id': 'a', 'type': 'frame', 'frameType': 'circle', 'content': photo,
+             'x': 101, 'y': 52, 'width': 200, 'height': 200, 'rotation': 14},
+        ]}},
+    }
+    for user_id in ('u1', 'u2', 'u3'):
+        document, blobs = session_document(user_id, design, 100)
+        save_blobs(db, blobs)
+        db.sessions.insert_one(document)
+
+    templates = auth_client.get('/api/designs/templates').get_json()['templates']
+    assert len(templates) == 1
+    assert templates[0]['wall_designs']['front'] == {'elements': [
+        {'type': 'frame', 'frameType': 'circle', 'x': 100, 'y': 50, 'width': 200, 'height': 200, 'rotation': 15},
+    ]}
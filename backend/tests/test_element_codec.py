@@ -0,0 +1,37 @@
+from element_codec import CODEC, decode_elements, encode_elements
+
+
+def elements(**columns):
+    count = len(next(iter(columns.values())))
+    return [{'id': f'el{i}', **{key: values[i] for key, values in columns.items()}} for i in range(count)]
+
+
+def round_trip(items):
+    decoded = decode_elements(encode_elements(items))
+    assert decoded == items
+    # == alone treats 1 and 1.0 as equal
+    assert [{k: type(v) for k, v in el.items()} for el in decoded] == \
+        [{k: type(v) for k, v in el.items()} for el in items]
+    return encode_elements(items)
+
+
+def test_typed_columns():
+    packed = round_trip(elements(x=list(range(10)), y=[i + 0.5 for i in range(10)], z=[i / 3 for i in range(10)]))
+    assert packed['codec'] == CODEC
+    assert {key: column['t'] for key, column in packed['columns'].items()} == {'id': 's', 'x': 'i', 'y': 'f', 'z': 'd'}
+
+
+def test_mixed_int_and_float_keep_their_types():
+    packed = round_trip(elements(x=[0, 1.5, 2, 3, 4.25, 5, 6, 7, 8, 9]))
+    assert 'x' not in packed['columns']
+
+
+def test_large_ints_keep_their_type():
+    packed = round_trip(elements(x=[2 ** 40 + i for i in range(10)]))
+    assert 'x' not in packed['columns']
+
+
+def test_short_and_legacy_lists_pass_through():
+    short = elements(x=[1, 2])
+    assert encode_elements(short) is short
+    assert decode_elements(short) is short
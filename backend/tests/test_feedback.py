@@ -0,0 +1,14 @@
+def test_submit_and_list(client):
+    body = {'name': 'Visitor', 'email': 'visitor@example.com', 'message': 'Lovely', 'rating': 5}
+    response = client.post('/api/feedback', json=body)
+    assert response.status_code == 201
+    assert 'email' not in response.get_json()['data']
+    entries = client.get('/api/feedback').get_json()['data']
+    assert [entry['message'] for entry in entries] == ['Lovely']
+    assert 'email' not in entries[0]
+
+
+def test_rating_validation(client):
+    body = {'name': 'Visitor', 'email': 'visitor@example.com', 'message': 'Hm', 'rating': 9}
+    assert client.post('/api/feedback', json=body).status_code == 400
+    assert client.post('/api/feedback', json={'name': 'Visitor'}).status_code == 400
@@ -0,0 +1,45 @@
+import itertools
+
+from geometry import MAX_PAIRS, element_arrays, overlaps
+
+
+def element(i, x=10, y=10, width=50, height=50):
+    return {'id': f'e{i}', 'type': 'sticker', 'x': x, 'y': y, 'width': width, 'height': height}
+
+
+def test_overlaps_match_pairwise():
+    elements = [element(i, x=(i * 37) % 800, y=(i * 53) % 500, width=40 + i % 60) for i in range(200)]
+    boxes = element_arrays(elements).tolist()
+    expected = [
+        (a, b) for a, b in itertools.combinations(range(len(boxes)), 2)
+        if min(boxes[a][2], boxes[b][2]) > max(boxes[a][0], boxes[b][0])
+        and min(boxes[a][3], boxes[b][3]) > max(boxes[a][1], boxes[b][1])
+    ]
+    pairs, _, truncated = overlaps(element_arrays(elements))
+    assert [tuple(pair) for pair in pairs.tolist()] == expected
+    assert not truncated
+
+
+def test_stacked_elements_are_capped():
+    # Every element on top of every other: 499,500 pairs uncapped
+    boxes = element_arrays([element(i) for i in range(1000)])
+    pairs, areas, truncated = overlaps(boxes, max_pairs=500)
+    assert truncated
+    assert len(pairs) == len(areas) == 500
+    assert len({tuple(pair) for pair in pairs.tolist()}) == 500
+
+
+def test_geometry_endpoint_reports_truncation(auth_client):
+    response = auth_client.post('/api/designs/geometry', json={
+        'elements': [element(i) for i in range(1000)], 'queries': ['overlaps'],
+    })
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['truncated'] is True
+    assert len(report['overlaps']) == MAX_PAIRS
+
+    response = auth_client.post('/api/designs/geometry', json={
+        'elements': [element(0), element(1, x=30)], 'queries': ['overlaps'],
+    })
+    assert response.get_json()['truncated'] is False
+    assert response.get_json()['overlaps'] == [{'a': 'e0', 'b': 'e1', 'area': 1500.0}]
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from config import ProductionConfig
+from conftest import make_user
+
+
+def old_unverified_user(db):
+    user = make_user(db, 'never-verified', verified=False)
+    db.users.update_one({'_id': user['_id']}, {'$set': {'created_at': datetime.now() - timedelta(days=90)}})
+    return user
+
+
+def test_scheduled_only_in_production(app):
+    assert app.extensions['maintenance'].interval == 0
+    assert ProductionConfig.MAINTENANCE_INTERVAL_SECONDS > 0
+
+
+def test_unverified_accounts_are_only_counted(app, db):
+    user = old_unverified_user(db)
+    report = app.extensions['maintenance'].run(sweeps=('unverified_accounts',))
+    assert report['sweeps']['unverified_accounts']['stale'] == 1
+    assert report['sweeps']['unverified_accounts']['dry_run']
+    assert db.users.find_one({'_id': user['_id']})
+
+
+def test_unverified_accounts_deleted_when_enabled(app, db):
+    user = old_unverified_user(db)
+    verified = make_user(db, 'verified')
+    db.users.update_one({'_id': verified['_id']}, {'$set': {'created_at': datetime.now() - timedelta(days=90)}})
+    app.config['MAINTENANCE_DELETE_UNVERIFIED'] = True
+    report = app.extensions['maintenance'].run(sweeps=('unverified_accounts',))
+    assert report['sweeps']['unverified_accounts']['deleted'] == 1
+    assert db.users.find_one({'_id': user['_id']}) is None
+    assert db.users.find_one({'_id': verified['_id']})
@@ -0,0 +1,20 @@
+def test_metrics_need_the_token_when_set(app, client):
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'scrape-secret'}).status_code == 401
+
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+
+
+def test_metrics_count_requests(client):
+    client.get('/api/health')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'endpoint="health.health_check"' in body
+
+
+def test_metrics_disabled(app, client):
+    app.config['METRICS_ENABLED'] = False
+    assert client.get('/metrics').status_code == 404
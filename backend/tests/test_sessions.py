@@ -0,0 +1,173 @@
+import pytest
+
+
+def payload(name='My altar', wallpaper='/wallpapers/design1.png'):
+    return {
+        'session_name': name,
+        'room_type': 'living_room',
+        'room_dimensions': {'length': 12, 'width': 10, 'height': 9},
+        'wall_designs': {
+            'front': {'elements': [], 'wallpaper': wallpaper},
+            'back': {'elements': [], 'wallpaper': None},
+            'left': {'elements': [], 'wallpaper': None},
+            'right': {'elements': [], 'wallpaper': None},
+        },
+        'selected_wall': 'front',
+    }
+
+
+@pytest.fixture
+def session_id(auth_client):
+    response = auth_client.post('/api/sessions', json=payload())
+    assert response.status_code == 201
+    return response.get_json()['session']['_id']
+
+
+def test_requires_login(client):
+    assert client.get('/api/sessions').status_code == 401
+    assert client.post('/api/sessions', json=payload()).status_code == 401
+
+
+def test_save_list_and_get(auth_client, session_id):
+    sessions = auth_client.get('/api/sessions').get_json()['sessions']
+    assert [s['_id'] for s in sessions] == [session_id]
+    session = auth_client.get(f'/api/sessions/{session_id}').get_json()['session']
+    assert session['session_name'] == 'My altar'
+    assert session['wall_designs']['front']['wallpaper'] == '/wallpapers/design1.png'
+
+
+def test_update_is_visible_at_once(auth_client, session_id):
+    response = auth_client.put(f'/api/sessions/{session_id}', json=payload('Renamed', '/wallpapers/design2.png'))
+    assert response.status_code == 200
+    session = auth_client.get(f'/api/sessions/{session_id}').get_json()['session']
+    assert session['session_name'] == 'Renamed'
+    assert session['wall_designs']['front']['wallpaper'] == '/wallpapers/design2.png'
+
+
+def test_delete(auth_client, session_id):
+    assert auth_client.delete(f'/api/sessions/{session_id}').status_code == 200
+    assert auth_client.get(f'/api/sessions/{session_id}').status_code == 404
+    assert auth_client.delete(f'/api/sessions/{session_id}').status_code == 404
+
+
+def test_invalid_payloads(auth_client):
+    assert auth_client.get('/api/sessions/not-an-id').status_code == 400
+    body = payload()
+    body['wall_designs']['front']['wallpaper'] = '/wallpapers/missing.png'
+    assert auth_client.post('/api/sessions', json=body).status_code == 400
+
+
+def test_sessions_are_per_user(app, db, session_id):
+    from conftest import login, make_user
+
+    other = app.test_client()
+    make_user(db, 'other')
+    login(other, 'other')
+    assert other.get(f'/api/sessions/{session_id}').status_code == 404
+    assert other.get('/api/sessions').get_json()['sessions'] == []
+
+
+def test_wall_etag(auth_client, session_id):
+    response = auth_client.get(f'/api/sessions/{session_id}/walls/front')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    cached = auth_client.get(f'/api/sessions/{session_id}/walls/front', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    wall = {'elements': [], 'wallpaper': '/wallpapers/design3.png'}
+    assert auth_client.put(f'/api/sessions/{session_id}/walls/front', json=wall,
+                           headers={'If-Match': etag}).status_code == 200
+    assert auth_client.put(f'/api/sessions/{session_id}/walls/front', json=wall,
+                           headers={'If-Match': etag}).status_code == 412
+
+
+def test_wall_save_near_quota(app, auth_client, db, session_id):
+    from bson import ObjectId
+
+    # The session fills the quota; replacing a wall must not count it twice
+    size_bytes = db.sessions.find_one({'_id': ObjectId(session_id)})['size_bytes']
+    app.config['USER_STORAGE_QUOTA_BYTES'] = size_bytes + 10
+    put = auth_client.put(f'/api/sessions/{session_id}/walls/front',
+                          json={'elements': [], 'wallpaper': '/wallpapers/design2.png'})
+    assert put.status_code == 200
+    patch = auth_client.patch(f'/api/sessions/{session_id}/walls/front', json={'wallpaper': '/wallpapers/design3.png'})
+    assert patch.status_code == 200
+
+
+def test_pending_save_does_not_overwrite_compacted_ops(app, auth_client, db, session_id):
+    from bson import ObjectId
+
+    buffer = app.extensions['write_behind']
+    buffer.window = 60  # Held until flushed
+    try:
+        assert auth_client.put(f'/api/sessions/{session_id}', json=payload('Stale')).status_code == 200
+        # Live-editing ops are folded into the session while the save is pending
+        db.sessions.update_one({'_id': ObjectId(session_id)}, {'$set': {'ops_seq': 5, 'session_name': 'Live'}})
+        buffer.flush()
+    finally:
+        buffer.window = 0
+    assert db.sessions.find_one({'_id': ObjectId(session_id)})['session_name'] == 'Live'
+    assert buffer.stats()['stale'] == 1
+
+
+def test_clone_keeps_shared_blobs_alive(auth_client, db, session_id):
+    from datetime import datetime, timedelta
+    from bson import ObjectId
+    from documents import WALL_NAMES
+    from wall_store import BLOB_COLLECTION, release_blobs
+
+    ref = db.sessions.find_one({'_id': ObjectId(session_id)})['wall_designs']['front']['ref']
+    long_ago = datetime.utcnow() - timedelta(days=30)
+    db[BLOB_COLLECTION].update_one({'_id': ref}, {'$set': {'used_at': long_ago}})
+    started = datetime.utcnow().replace(microsecond=0)  # Mongo keeps milliseconds
+
+    response = auth_client.post(f'/api/sessions/{session_id}/clone', json={'session_name': 'Copy'})
+    assert response.status_code == 201
+    assert db[BLOB_COLLECTION].find_one({'_id': ref})['used_at'] >= started
+
+    # A sweep that started before the clone and no longer sees the parent keeps the blob
+    db.sessions.delete_many({})
+    assert release_blobs(db, [ref], WALL_NAMES, before=started) == 0
+
+
+def test_wall_saves_keep_session_size(app, auth_client, db, session_id):
+    from bson import ObjectId
+
+    def stored():
+        return db.sessions.find_one({'_id': ObjectId(session_id)})
+
+    elements = [{'id': f'e{i}', 'type': 'sticker', 'x': i, 'y': 0, 'width': 10, 'height': 10} for i in range(50)]
+    before = stored()['size_bytes']
+    assert auth_client.put(f'/api/sessions/{session_id}/walls/back',
+                           json={'elements': elements, 'wallpaper': None}).status_code == 200
+    grown = stored()['size_bytes']
+    assert grown > before + 1000
+
+    # The same elements on a second wall no longer fit
+    app.config['USER_STORAGE_QUOTA_BYTES'] = grown + 100
+    patch = auth_client.patch(f'/api/sessions/{session_id}/walls/left', json={'upsert': elements})
+    assert patch.status_code == 413
+    assert auth_client.put(f'/api/sessions/{session_id}/walls/back',
+                           json={'elements': [], 'wallpaper': None}).status_code == 200
+    assert stored()['size_bytes'] == before
+
+
+def test_bulk_only_touches_own_sessions(app, auth_client, db, session_id):
+    from bson import ObjectId
+    from conftest import login, make_user
+
+    other = app.test_client()
+    make_user(db, 'other')
+    login(other, 'other')
+    theirs = other.post('/api/sessions', json=payload('Theirs')).get_json()['session']['_id']
+
+    fetched = auth_client.post('/api/sessions/bulk', json={'action': 'fetch', 'ids': [session_id, theirs]})
+    assert [(r['id'], r['status']) for r in fetched.get_json()['results']] == [(session_id, 200), (theirs, 404)]
+    assert 'session' not in fetched.get_json()['results'][1]
+
+    renamed = auth_client.post('/api/sessions/bulk', json={'action': 'rename', 'names': {theirs: 'Mine now'}})
+    assert renamed.get_json()['results'][0]['status'] == 404
+    deleted = auth_client.post('/api/sessions/bulk', json={'action': 'delete', 'ids': [theirs, session_id]})
+    assert [r['status'] for r in deleted.get_json()['results']] == [404, 200]
+
+    assert db.sessions.find_one({'_id': ObjectId(theirs)})['session_name'] == 'Theirs'
+    assert db.sessions.find_one({'_id': ObjectId(session_id)}) is None
@@ -0,0 +1,39 @@
+import json
+import logging
+
+from structured_logging import REQUEST_ID_HEADER, JsonFormatter, TextFormatter
+
+TOKEN = 'eyJ1c2VyIjoiNjYxIn0.ZxY1aQ.c2lnbmF0dXJlLW9mLXRoZS10b2tlbg'
+
+
+def record(msg, *args, **extra):
+    entry = logging.LogRecord('auth', logging.INFO, __file__, 1, msg, args, None)
+    entry.__dict__.update(extra)
+    return entry
+
+
+def test_json_lines_redact_emails_and_tokens():
+    line = JsonFormatter().format(record(
+        'Verification mail for %s with %s', 'jane.doe@example.com', f'/verify?token={TOKEN}',
+        email='jane.doe@example.com', password='hunter2',
+        headers={'Authorization': 'Bearer abc', 'Cookie': 'session=xyz', 'Accept': 'text/html'},
+    ))
+    assert 'jane.doe' not in line and TOKEN not in line and 'hunter2' not in line
+    entry = json.loads(line)
+    assert entry['msg'] == 'Verification mail for j***@example.com with /verify?token=[token]'
+    assert entry['email'] == 'j***@example.com'
+    assert entry['password'] == '[redacted]'
+    assert entry['headers'] == {'Authorization': '[redacted]', 'Cookie': '[redacted]', 'Accept': 'text/html'}
+
+
+def test_text_lines_redact_the_same_way():
+    line = TextFormatter().format(record('Login %s sent Authorization: Bearer %s', 'ops@example.org', TOKEN))
+    assert 'o***@example.org' in line
+    assert 'Bearer [token]' in line
+    assert TOKEN not in line
+
+
+def test_request_id_is_echoed_only_when_sane(client):
+    assert client.get('/api/health', headers={REQUEST_ID_HEADER: 'edge-42'}).headers[REQUEST_ID_HEADER] == 'edge-42'
+    replaced = client.get('/api/health', headers={REQUEST_ID_HEADER: 'x' * 65}).headers[REQUEST_ID_HEADER]
+    assert replaced != 'x' * 65 and len(replaced) == 32
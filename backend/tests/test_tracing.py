@@ -0,0 +1,51 @@
+import pytest
+
+import tracing
+from app import create_app
+from config import TestingConfig
+from tracing import TRACEPARENT_HEADER, parse_traceparent, read_spans
+
+TRACE = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT = '00f067aa0ba902b7'
+
+
+@pytest.fixture
+def traces(monkeypatch, tmp_path):
+    """A client of an app that traces no request on its own, and its span file"""
+    path = tmp_path / 'traces.jsonl'
+    monkeypatch.setattr(tracing, '_exporter', None)
+    monkeypatch.setattr(TestingConfig, 'TRACING_ENABLED', True)
+    monkeypatch.setattr(TestingConfig, 'TRACE_FILE', str(path))
+    monkeypatch.setattr(TestingConfig, 'TRACE_SAMPLE_RATE', 0.0)
+    app = create_app('testing')
+
+    def spans():
+        app.extensions['tracing'].flush()
+        return list(read_spans(path)) if path.exists() else []
+    return app.test_client(), spans
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(f'00-{TRACE}-{PARENT}-01') == (TRACE, PARENT, True)
+    assert parse_traceparent(f'00-{TRACE}-{PARENT}-00') == (TRACE, PARENT, False)
+    assert parse_traceparent(f'00-{"0" * 32}-{PARENT}-01') is None
+    assert parse_traceparent(f'00-{TRACE.upper()}-{PARENT}-01') is None
+    assert parse_traceparent(f'01-{TRACE}-{PARENT}-01') is None
+    assert parse_traceparent(None) is None
+
+
+def test_sampled_traceparent_joins_the_trace(traces):
+    client, spans = traces
+    assert client.get('/api/health', headers={TRACEPARENT_HEADER: f'00-{TRACE}-{PARENT}-01'}).status_code == 200
+    (root,) = spans()
+    assert (root['traceId'], root['parentSpanId'], root['name']) == (TRACE, PARENT, 'GET /api/health')
+    attributes = {a['key']: a['value'] for a in root['attributes']}
+    assert attributes['http.response.status_code'] == {'intValue': '200'}
+
+
+def test_unsampled_or_invalid_traceparent_is_not_traced(traces):
+    client, spans = traces
+    client.get('/api/health', headers={TRACEPARENT_HEADER: f'00-{TRACE}-{PARENT}-00'})
+    client.get('/api/health', headers={TRACEPARENT_HEADER: 'not-a-traceparent'})
+    client.get('/api/health')
+    assert spans() == []
@@ -0,0 +1,90 @@
+import pytest
+from bson import ObjectId
+
+import write_behind
+from test_sessions import payload
+from write_behind import write_behind_window
+
+
+@pytest.fixture
+def buffer(app):
+    """The app's buffer holding saves until flushed, as with a window in production"""
+    buffer = app.extensions['write_behind']
+    buffer.window = 60
+    yield buffer
+    buffer.window = 0
+
+
+@pytest.fixture
+def session_id(auth_client):
+    return auth_client.post('/api/sessions', json=payload()).get_json()['session']['_id']
+
+
+def failing_writes(monkeypatch):
+    def write_entry(db, entry):
+        raise ConnectionError('primary unavailable')
+    monkeypatch.setattr(write_behind, 'write_entry', write_entry)
+
+
+def test_window_needs_pinned_users():
+    assert write_behind_window({'WRITE_BEHIND_SECONDS': 2.0}) == 0
+    assert write_behind_window({'WRITE_BEHIND_SECONDS': 2.0, 'WRITE_BEHIND_PINNED': True}) == 2.0
+    assert write_behind_window({}) == 0
+
+
+def test_failed_write_is_reported_at_once(monkeypatch, auth_client, session_id):
+    failing_writes(monkeypatch)
+    response = auth_client.put(f'/api/sessions/{session_id}', json=payload('Lost'))
+    assert response.status_code == 503
+    # Not left pending for a retry nobody would make
+    assert auth_client.application.extensions['write_behind'].stats()['pending'] == 0
+
+
+def test_dropped_save_is_reported_on_next_read(monkeypatch, buffer, auth_client, session_id):
+    assert auth_client.put(f'/api/sessions/{session_id}', json=payload('Lost')).status_code == 200
+    failing_writes(monkeypatch)
+    for _ in range(write_behind.MAX_ATTEMPTS):
+        buffer.flush()
+    assert buffer.stats()['dropped'] == 1
+
+    session = auth_client.get(f'/api/sessions/{session_id}').get_json()
+    assert session['session']['session_name'] == 'My altar'
+    assert session['save_error']
+    # Reported once
+    assert 'save_error' not in auth_client.get(f'/api/sessions/{session_id}').get_json()
+
+
+def test_stale_save_is_reported(buffer, auth_client, db, session_id):
+    assert auth_client.put(f'/api/sessions/{session_id}', json=payload('Stale')).status_code == 200
+    db.sessions.update_one({'_id': ObjectId(session_id)}, {'$set': {'ops_seq': 5}})
+    buffer.flush()
+    response = auth_client.put(f'/api/sessions/{session_id}', json=payload('Next'))
+    assert response.status_code == 409
+    # The rejected save is not queued; the one after it is accepted and written
+    assert buffer.stats()['pending'] == 0
+    assert auth_client.put(f'/api/sessions/{session_id}', json=payload('Reloaded')).status_code == 200
+    buffer.flush()
+    assert db.sessions.find_one({'_id': ObjectId(session_id)})['session_name'] == 'Reloaded'
+
+
+def test_reading_pending_wall_designs_leaves_them_packed(buffer, auth_client, db):
+    elements = [{'id': f'el{i}', 'type': 'sticker', 'content': '/images/Intensestick1.png',
+                 'x': i * 10, 'y': 5, 'width': 100, 'height': 100} for i in range(10)]
+    body = {'wallDesigns': {'front': {'elements': elements, 'wallpaper': None}}}
+    assert auth_client.post('/api/designs/wall-designs', json=body).status_code == 200
+    assert auth_client.get('/api/designs/wall-designs').get_json()['wallDesigns']['front']['elements'] == elements
+    buffer.flush()
+    stored = db.wall_designs.find_one()
+    assert stored['wall_designs']['front']['elements']['codec']
+
+
+def test_buffers_do_not_keep_apps_alive():
+    import gc
+    import weakref
+    from app import create_app
+
+    first = weakref.ref(create_app('testing'))
+    second = create_app('testing')
+    gc.collect()
+    assert first() is None
+    assert second.extensions['write_behind'] in write_behind._exit_buffers
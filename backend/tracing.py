@@ -0,0 +1,533 @@
+"""
+Tracing spans for requests, MongoDB commands and emails
+
+A sampled request gets a trace:
+- a server span for the request,
+- a client span for every MongoDB command it runs, from a pymongo
+  ``CommandListener``,
+- spans for the email helpers and their SMTP send, and for password hashing.
+
+Together they show where a slow registration spent its time: the
+``find`` on users, hashing, the insert and update, or the SMTP send.
+
+Spans follow the OpenTelemetry data model. They are exported in batches
+from a background thread as OTLP/JSON (``ExportTraceServiceRequest``):
+POSTed to an OTLP/HTTP collector at ``TRACE_ENDPOINT``
+(``http://localhost:4318/v1/traces``), or appended one batch per line to
+``TRACE_FILE``. Both formats are read by the OpenTelemetry Collector.
+Without a collector::
+
+    python tracing.py collect --port 4318 --out traces.jsonl   # stand-in collector
+    python tracing.py show [--file traces.jsonl] [--min-ms 100] [--last 20]
+
+A request carrying a W3C ``traceparent`` header joins that trace and keeps
+its sampling decision. Other requests are sampled at ``TRACE_SAMPLE_RATE``.
+Work outside a sampled request creates no spans: ``span()`` returns a
+shared no-op after one context variable lookup. With ``TRACING_ENABLED``
+off no hooks or listeners are installed.
+"""
+import argparse
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pymongo import monitoring
+
+from slow_queries import command_shape
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds and status codes
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_ERROR = 2
+
+TRACEPARENT_HEADER = 'traceparent'
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current = contextvars.ContextVar('trace_span', default=None)
+_exporter = None
+
+
+def _new_id(bits):
+    return f'{random.getrandbits(bits) or 1:0{bits // 4}x}'
+
+
+class Span:
+    """One timed operation; a context manager that makes it the current span"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'attributes',
+                 'start_ns', 'end_ns', 'status', 'message', '_token')
+
+    def __init__(self, name, trace_id, parent_id=None, kind=INTERNAL, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = None
+        self.message = None
+        self._token = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def error(self, message):
+        self.status = STATUS_ERROR
+        self.message = str(message)[:500]
+
+    def end(self, end_ns=None):
+        self.end_ns = end_ns or time.time_ns()
+        if _exporter is not None:
+            _exporter.add(self)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc is not None:
+            self.error(f'{exc_type.__name__}: {exc}')
+        self.end()
+        return False
+
+
+class _NoSpan:
+    """Stands in for a span that is not recorded"""
+
+    def set(self, key, value):
+        pass
+
+    def error(self, message):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+def current_span():
+    return _current.get()
+
+
+def trace_id():
+    """Trace id of the current span, or None"""
+    current = _current.get()
+    return current.trace_id if current is not None else None
+
+
+def span(name, kind=INTERNAL, attributes=None):
+    """A child of the current span, or ``NO_SPAN`` when this work is not traced"""
+    parent = _current.get()
+    if parent is None:
+        return NO_SPAN
+    return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+
+def traced(name):
+    """Run the decorated function in a span named ``name`` when it is traced"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(name, attributes={'code.function': fn.__qualname__}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def parse_traceparent(value):
+    """(trace id, parent span id, sampled) from a W3C ``traceparent``, or None"""
+    match = _TRACEPARENT.match(value or '')
+    if not match or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+def start_trace(name, traceparent=None, sample_rate=1.0, attributes=None):
+    """Start and enter a server span, or return None if the request is not sampled"""
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace, parent_id, sampled = parent
+    else:
+        trace, parent_id, sampled = _new_id(128), None, random.random() < sample_rate
+    if not sampled:
+        return None
+    root = Span(name, trace, parent_id, SERVER, attributes)
+    _current.set(root)
+    return root
+
+
+def end_trace(root, status_code=None, exc=None):
+    _current.set(None)
+    if status_code is not None:
+        root.set('http.response.status_code', status_code)
+        if status_code >= 500:
+            root.error(f'HTTP {status_code}')
+    if exc is not None:
+        root.error(f'{type(exc).__name__}: {exc}')
+    root.end()
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """A client span per command of a traced request; runs in the thread that issued it"""
+
+    def __init__(self):
+        self._spans = {}
+
+    def started(self, event):
+        parent = _current.get()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        attributes = {
+            'db.system': 'mongodb',
+            'db.name': event.database_name,
+            'db.operation': event.command_name,
+            'db.query.text': json.dumps(command_shape(event.command), default=str),
+        }
+        if isinstance(collection, str):
+            attributes['db.mongodb.collection'] = collection
+        if isinstance(event.connection_id, tuple):
+            attributes['server.address'], attributes['server.port'] = event.connection_id[:2]
+        name = f'{event.command_name} {collection}' if isinstance(collection, str) else event.command_name
+        self._spans[(event.connection_id, event.request_id)] = Span(
+            name, parent.trace_id, parent.span_id, CLIENT, attributes)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, error=event.failure.get('errmsg', 'failed'))
+
+    def _finish(self, event, error=None):
+        command_span = self._spans.pop((event.connection_id, event.request_id), None)
+        if command_span is None:
+            return
+        if error is not None:
+            command_span.error(error)
+        command_span.end(command_span.start_ns + event.duration_micros * 1000)
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+def otlp_span(finished):
+    entry = {
+        'traceId': finished.trace_id,
+        'spanId': finished.span_id,
+        'name': finished.name,
+        'kind': finished.kind,
+        'startTimeUnixNano': str(finished.start_ns),
+        'endTimeUnixNano': str(finished.end_ns),
+        'attributes': [_attribute(key, value) for key, value in finished.attributes.items()],
+    }
+    if finished.parent_id:
+        entry['parentSpanId'] = finished.parent_id
+    if finished.status:
+        entry['status'] = {'code': finished.status, 'message': finished.message or ''}
+    return entry
+
+
+def otlp_payload(spans, service_name):
+    """An OTLP/JSON ``ExportTraceServiceRequest``"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [_attribute('service.name', service_name)]},
+        'scopeSpans': [{'scope': {'name': 'altarmaker.tracing'}, 'spans': [otlp_span(s) for s in spans]}],
+    }]}
+
+
+class SpanExporter:
+    """Batches finished spans and exports them from a background thread"""
+
+    def __init__(self, path=None, endpoint=None, service_name='altarmaker',
+                 batch_size=512, interval=5.0, max_pending=10000):
+        self.path = path
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(max_pending)
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def add(self, finished):
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+        if self._thread is None:
+            with self._lock:
+                # Started on first use, so forking servers do not copy it
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            # Every ``interval``, or sooner once a full batch is waiting
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Export what is queued now, in the calling thread"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self.export(batch)
+
+    def export(self, spans):
+        body = json.dumps(otlp_payload(spans, self.service_name), separators=(',', ':'))
+        try:
+            if self.endpoint:
+                post = urllib.request.Request(self.endpoint, data=body.encode(), method='POST',
+                                              headers={'Content-Type': 'application/json'})
+                with urllib.request.urlopen(post, timeout=10) as response:
+                    response.read()
+            else:
+                with self._write_lock:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    with open(self.path, 'a') as fh:
+                        fh.write(body + '\n')
+            self.exported += len(spans)
+        except (OSError, ValueError) as e:
+            self.failed += len(spans)
+            logger.warning(f"Could not export {len(spans)} spans to {self.endpoint or self.path}: {e}")
+
+    def stats(self):
+        return {'pending': self._queue.qsize(), 'exported': self.exported,
+                'dropped': self.dropped, 'failed': self.failed}
+
+
+def configure_tracing(config, default_dir):
+    """Set the process's exporter from ``config``; returns None when tracing is disabled"""
+    global _exporter
+    if not config.get('TRACING_ENABLED', False):
+        return None
+    endpoint = config.get('TRACE_ENDPOINT')
+    _exporter = SpanExporter(
+        path=None if endpoint else config.get('TRACE_FILE') or os.path.join(default_dir, 'traces.jsonl'),
+        endpoint=endpoint,
+        service_name=config.get('TRACE_SERVICE_NAME', 'altarmaker'),
+    )
+    return _exporter
+
+
+def _flush_exporter():
+    if _exporter is not None:
+        _exporter.flush()
+
+
+atexit.register(_flush_exporter)
+
+
+def tracing_collector(exporter):
+    def collect():
+        stats = exporter.stats()
+        yield 'trace_spans_pending', 'gauge', 'Finished spans waiting to be exported.', stats['pending']
+        for key in ('exported', 'dropped', 'failed'):
+            yield f'trace_spans_{key}_total', 'counter', f'Spans {key} since start.', stats[key]
+    return collect
+
+
+def init_tracing(app):
+    """Trace a sample of the Flask app's requests and their Mongo commands"""
+    from flask import g, request
+    from metrics import REGISTRY
+
+    exporter = configure_tracing(app.config, app.instance_path)
+    if exporter is None:
+        return
+    app.extensions['tracing'] = exporter
+    app.extensions['mongo'].listeners.append(MongoCommandTracer())
+    REGISTRY.collector('tracing', tracing_collector(exporter))
+    sample_rate = app.config.get('TRACE_SAMPLE_RATE', 0.1)
+
+    @app.before_request
+    def start_request_span():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g.trace_span = start_trace(
+            f'{request.method} {rule}', request.headers.get(TRACEPARENT_HEADER), sample_rate,
+            {'http.request.method': request.method, 'http.route': rule, 'url.path': request.path,
+             'endpoint': request.endpoint or 'unmatched'},
+        )
+
+    @app.after_request
+    def record_status(response):
+        root = g.get('trace_span')
+        if root is not None:
+            root.set('http.response.status_code', response.status_code)
+        return response
+
+    @app.teardown_request
+    def end_request_span(exc=None):
+        root = g.pop('trace_span', None)
+        if root is not None:
+            end_trace(root, root.attributes.get('http.response.status_code'), exc)
+
+
+def read_spans(path):
+    """Spans from an OTLP/JSON file, as the dicts of their payloads"""
+    with open(path) as fh:
+        for line in fh:
+            try:
+                payload = json.loads(line)
+            except ValueError:
+                continue
+            for resource_spans in payload.get('resourceSpans', []):
+                for scope_spans in resource_spans.get('scopeSpans', []):
+                    yield from scope_spans.get('spans', [])
+
+
+def _duration_ms(entry):
+    return (int(entry['endTimeUnixNano']) - int(entry['startTimeUnixNano'])) / 1e6
+
+
+def trace_lines(spans):
+    """One trace as indented lines: offset, duration and name of each span"""
+    start = min(int(entry['startTimeUnixNano']) for entry in spans)
+    children = {}
+    ids = {entry['spanId'] for entry in spans}
+    for entry in spans:
+        parent = entry.get('parentSpanId') if entry.get('parentSpanId') in ids else None
+        children.setdefault(parent, []).append(entry)
+    lines = []
+
+    def walk(parent, depth):
+        for entry in sorted(children.get(parent, []), key=lambda e: int(e['startTimeUnixNano'])):
+            offset = (int(entry['startTimeUnixNano']) - start) / 1e6
+            status = entry.get('status', {})
+            error = f" ERROR {status.get('message', '')}" if status.get('code') == STATUS_ERROR else ''
+            lines.append(f"{offset:>9.1f}ms {_duration_ms(entry):>9.1f}ms  {'  ' * depth}{entry['name']}{error}")
+            walk(entry['spanId'], depth + 1)
+
+    walk(None, 0)
+    return lines
+
+
+def show(path, min_ms=0, last=20, trace=None):
+    traces = {}
+    for entry in read_spans(path):
+        traces.setdefault(entry['traceId'], []).append(entry)
+    if trace:
+        traces = {key: spans for key, spans in traces.items() if key.startswith(trace)}
+    rows = []
+    for key, spans in traces.items():
+        ids = {entry['spanId'] for entry in spans}
+        roots = [entry for entry in spans if entry.get('parentSpanId') not in ids]
+        root = max(roots, key=_duration_ms)
+        if _duration_ms(root) >= min_ms:
+            rows.append((int(root['startTimeUnixNano']), key, root, spans))
+    for _, key, root, spans in sorted(rows, key=lambda row: row[0])[-last:]:
+        logger.info(f"trace {key}  {root['name']}  {_duration_ms(root):.1f}ms  {len(spans)} spans")
+        for line in trace_lines(spans):
+            logger.info(line)
+    logger.info(f"{len(rows)} traces")
+
+
+def collect(port, out):
+    """Accept OTLP/JSON on /v1/traces and append each request body to ``out``"""
+    write_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip('/') != '/v1/traces':
+                self.send_error(404)
+                return
+            if 'json' not in self.headers.get('Content-Type', ''):
+                self.send_error(415, 'Only OTLP/JSON is accepted')
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                self.send_error(400, 'Invalid JSON')
+                return
+            with write_lock, open(out, 'a') as fh:
+                fh.write(json.dumps(payload, separators=(',', ':')) + '\n')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    logger.info(f"Collecting traces on http://127.0.0.1:{port}/v1/traces into {out}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    default_file = os.getenv('TRACE_FILE') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'traces.jsonl')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    show_parser = commands.add_parser('show', help='print traces as span trees')
+    show_parser.add_argument('--file', default=default_file)
+    show_parser.add_argument('--min-ms', type=float, default=0, help='only traces at least this slow')
+    show_parser.add_argument('--last', type=int, default=20, help='how many of the latest traces')
+    show_parser.add_argument('--trace', help='only the trace whose id starts with this')
+    collect_parser = commands.add_parser('collect', help='run a stand-in OTLP/HTTP collector')
+    collect_parser.add_argument('--port', type=int, default=4318)
+    collect_parser.add_argument('--out', default=default_file)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.command == 'collect':
+        collect(args.port, args.out)
+        return
+    if not os.path.exists(args.file):
+        logger.error(f"No traces at {args.file}")
+        raise SystemExit(1)
+    show(args.file, args.min_ms, args.last, args.trace)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""
+Background deletion of a user's data
+
+Deleting a user from the admin panel only removes the ``users`` document
+(so they can no longer log in) and queues a job in ``deletion_jobs``; the
+request returns straight away. A worker thread then removes everything the
+user owned in batches of ``DELETION_BATCH_SIZE``:
+
+- ``sessions``, with their live-editing op logs (``session_ops``) and the
+  wall blobs no other session references any more,
+- ``wall_designs``,
+- ``feedback`` left under the user's email.
+
+The job document is keyed by the user's id and records per-collection
+progress after every batch, so ``GET /api/admin/deletion-jobs/<user_id>``
+can report it. Jobs survive restarts: a running job whose heartbeat is older
+than ``DELETION_STALE_SECONDS`` is picked up again, and every step is
+idempotent.
+
+Every ``DELETION_SWEEP_SECONDS`` the worker also looks for data whose owner
+no longer exists (users deleted before this module, saves that landed after
+a job finished) and queues jobs for those owners.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from documents import WALL_NAMES
+from wall_store import blob_refs, release_blobs
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = 'deletion_jobs'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Progress counters, in the order the job works through them
+STEPS = ('sessions', 'session_ops', 'wall_blobs', 'wall_designs', 'feedback')
+
+
+def job_document(user, requested_by=None):
+    """A queued job for ``user``: a users document, or just {'_id': ...}"""
+    now = datetime.utcnow()
+    return {
+        '_id': str(user['_id']),
+        'status': QUEUED,
+        'username': user.get('username'),
+        'email': user.get('email'),  # Removed again when the job is done
+        'requested_by': requested_by,
+        'progress': {step: 0 for step in STEPS},
+        'batches': 0,
+        'error': None,
+        'created_at': now,
+        'updated_at': now,
+        'heartbeat_at': None,
+        'finished_at': None,
+    }
+
+
+def enqueue(db, user, requested_by=None):
+    """Queue the deletion of a user's data and return the job.
+
+    Queuing a user whose job is already queued or running returns that job;
+    a finished or failed job is queued again, e.g. for data saved since.
+    """
+    job = job_document(user, requested_by)
+    try:
+        db[JOBS_COLLECTION].insert_one(job)
+        return job
+    except DuplicateKeyError:
+        pass
+    reset = {key: value for key, value in job.items() if key not in ('_id', 'created_at')}
+    requeued = db[JOBS_COLLECTION].find_one_and_update(
+        {'_id': job['_id'], 'status': {'$in': [DONE, FAILED]}},
+        {'$set': reset, '$unset': {'started_at': ''}},
+        return_document=ReturnDocument.AFTER,
+    )
+    return requeued or db[JOBS_COLLECTION].find_one({'_id': job['_id']})
+
+
+def claim(db, stale_seconds):
+    """Mark the oldest queued (or abandoned) job running and return it"""
+    now = datetime.utcnow()
+    return db[JOBS_COLLECTION].find_one_and_update(
+        {'$or': [
+            {'status': QUEUED},
+            {'status': RUNNING, 'heartbeat_at': {'$lt': now - timedelta(seconds=stale_seconds)}},
+        ]},
+        {'$set': {'status': RUNNING, 'heartbeat_at': now, 'updated_at': now}, '$min': {'started_at': now}},
+        sort=[('created_at', 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _record(db, job, counts):
+    """Add one batch's counts to the job's progress"""
+    now = datetime.utcnow()
+    db[JOBS_COLLECTION].update_one(
+        {'_id': job['_id']},
+        {
+            '$inc': dict({f'progress.{step}': count for step, count in counts.items() if count}, batches=1),
+            '$set': {'heartbeat_at': now, 'updated_at': now},
+        },
+    )
+
+
+def _delete_sessions(db, job, batch_size, pause):
+    user_id = job['_id']
+    while True:
+        batch = list(db.sessions.find({'user_id': user_id}, {'wall_designs': 1}).limit(batch_size))
+        if not batch:
+            return
+        ids = [session['_id'] for session in batch]
+        released_before = datetime.utcnow()
+        sessions = db.sessions.delete_many({'_id': {'$in': ids}, 'user_id': user_id}).deleted_count
+        ops = db.session_ops.delete_many({'session_id': {'$in': [str(i) for i in ids]}}).deleted_count
+        blobs = release_blobs(db, blob_refs(batch), WALL_NAMES, released_before)
+        _record(db, job, {'sessions': sessions, 'session_ops': ops, 'wall_blobs': blobs})
+        time.sleep(pause)
+
+
+def _delete_wall_designs(db, job, batch_size, pause):
+    user_id = job['_id']
+    while True:
+        ids = [doc['_id'] for doc in db.wall_designs.find({'user_id': user_id}, {'_id': 1}).limit(batch_size)]
+        if not ids:
+            return
+        deleted = db.wall_designs.delete_many({'_id': {'$in': ids}}).deleted_count
+        _record(db, job, {'wall_designs': deleted})
+        time.sleep(pause)
+
+
+def run_job(db, job, batch_size=500, pause=0.0):
+    """Delete everything a claimed job's user owned"""
+    try:
+        if db.users.find_one({'_id': _object_id(job['_id'])}, {'_id': 1}):
+            raise RuntimeError('User still exists')
+        _delete_sessions(db, job, batch_size, pause)
+        _delete_wall_designs(db, job, batch_size, pause)
+        if job.get('email'):
+            _record(db, job, {'feedback': db.feedback.delete_many({'email': job['email']}).deleted_count})
+    except Exception as e:
+        logger.error(f"Deletion job {job['_id']} failed: {e}")
+        _finish(db, job, FAILED, str(e))
+        return False
+    _finish(db, job, DONE)
+    return True
+
+
+def _finish(db, job, status, error=None):
+    now = datetime.utcnow()
+    update = {'$set': {'status': status, 'error': error, 'finished_at': now, 'updated_at': now}}
+    if status == DONE:
+        update['$set']['email'] = None
+    db[JOBS_COLLECTION].update_one({'_id': job['_id']}, update)
+
+
+def _object_id(user_id):
+    return ObjectId(user_id) if ObjectId.is_valid(user_id) else user_id
+
+
+def orphaned_owners(db):
+    """Owners of sessions or wall designs that are not users any more"""
+    users = {str(user['_id']) for user in db.users.find({}, {'_id': 1})}
+    owners = set(db.sessions.distinct('user_id')) | set(db.wall_designs.distinct('user_id'))
+    return sorted(owner for owner in owners if owner and owner not in users)
+
+
+def sweep(db):
+    """Queue jobs for orphaned data; returns the owners found"""
+    owners = orphaned_owners(db)
+    for owner in owners:
+        enqueue(db, {'_id': owner}, requested_by='sweeper')
+    if owners:
+        logger.info(f"Deletion sweep queued {len(owners)} orphaned owners")
+    return owners
+
+
+def job_response(job):
+    """A job as returned by the admin API"""
+    if job is None:
+        return None
+    job = {key: value for key, value in job.items() if key not in ('email', 'heartbeat_at')}
+    job['user_id'] = job.pop('_id')
+    return job
+
+
+class DeletionJobs:
+    """Runs queued jobs on a daemon thread and sweeps for orphans periodically"""
+
+    def __init__(self, app, batch_size=500, pause=0.05, poll_seconds=30,
+                 sweep_seconds=3600, stale_seconds=300, enabled=True):
+        self.app = app
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.pause = pause
+        self.poll_seconds = poll_seconds
+        self.sweep_seconds = sweep_seconds
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._swept_at = None  # Sweeps on the first run
+
+    def start(self):
+        """Start the worker; called per request, so forking servers do not copy it"""
+        if self._thread is None and self.enabled:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='deletion-jobs', daemon=True)
+                    self._thread.start()
+
+    def enqueue(self, db, user, requested_by=None):
+        job = enqueue(db, user, requested_by)
+        self.start()
+        self._wake.set()
+        return job
+
+    def run_pending(self):
+        """Run jobs until none is queued; returns how many ran"""
+        from extensions import get_db
+
+        ran = 0
+        with self.app.app_context():
+            db = get_db()
+            if self.sweep_seconds and (self._swept_at is None or time.monotonic() - self._swept_at >= self.sweep_seconds):
+                self._swept_at = time.monotonic()
+                sweep(db)
+            while True:
+                job = claim(db, self.stale_seconds)
+                if job is None:
+                    return ran
+                run_job(db, job, self.batch_size, self.pause)
+                ran += 1
+
+    def _run(self):
+        while True:
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.error(f"Deletion jobs failed: {e}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+
+def init_user_deletion(app):
+    jobs = app.extensions['user_deletion'] = DeletionJobs(
+        app,
+        batch_size=app.config.get('DELETION_BATCH_SIZE', 500),
+        pause=app.config.get('DELETION_BATCH_PAUSE', 0.05),
+        poll_seconds=app.config.get('DELETION_POLL_SECONDS', 30),
+        sweep_seconds=app.config.get('DELETION_SWEEP_SECONDS', 3600),
+        stale_seconds=app.config.get('DELETION_STALE_SECONDS', 300),
+        enabled=app.config.get('DELETION_WORKER_ENABLED', True),
+    )
+    app.before_request(jobs.start)
+
+
+def get_user_deletion():
+    from flask import current_app
+    return current_app.extensions['user_deletion']
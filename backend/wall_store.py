@@ -0,0 +1,163 @@
+"""
+Content-addressed wall storage for sessions
+
+Sessions do not embed their walls. Every wall with content is stored once in
+``wall_blobs`` under the SHA-256 of its content, and the session keeps
+``wall_designs.<wall> = {'ref': <hash>}``. The same altar saved as several
+sessions, or by several users, shares its blobs. Empty walls stay inline, and
+sessions written before this embed their walls and read unchanged.
+
+Blobs are immutable: saving a changed wall writes a new blob and moves the
+reference. ``used_at`` is bumped on every save so a sweep of unreferenced
+blobs can skip ones a save is about to point at.
+
+The pure helpers are shared by the Flask and ASGI apps; each has a sync and
+an ``_async`` (Motor) variant for the I/O.
+"""
+import hashlib
+import json
+from datetime import datetime
+
+from element_codec import encode_wall_designs
+
+BLOB_COLLECTION = 'wall_blobs'
+
+
+def wall_hash(wall):
+    """Exact content hash of a decoded wall"""
+    payload = json.dumps(wall, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def has_content(wall):
+    return isinstance(wall, dict) and bool(wall.get('elements') or wall.get('wallpaper'))
+
+
+def split_wall_designs(wall_designs):
+    """(walls as stored on the session, {hash: wall blob}) for a decoded design"""
+    if not isinstance(wall_designs, dict):
+        return wall_designs, {}
+    stored, blobs = {}, {}
+    for name, wall in wall_designs.items():
+        if not has_content(wall):
+            stored[name] = wall
+            continue
+        key = wall_hash(wall)
+        blobs[key] = encode_wall_designs({name: wall})[name]
+        stored[name] = {'ref': key}
+    return stored, blobs
+
+
+def blob_upserts(blobs):
+    """(filter, update) upserts storing ``blobs``; existing blobs are only touched.
+
+    A session has at most four walls, so these run as single upserts.
+    """
+    now = datetime.utcnow()
+    return [
+        ({'_id': key}, {'$setOnInsert': {'wall': wall, 'created_at': now}, '$set': {'used_at': now}})
+        for key, wall in blobs.items()
+    ]
+
+
+def blob_refs(documents):
+    """Blob hashes referenced by some session documents"""
+    refs = set()
+    for document in documents:
+        for wall in (document.get('wall_designs') or {}).values():
+            if isinstance(wall, dict) and 'ref' in wall:
+                refs.add(wall['ref'])
+    return refs
+
+
+def unstored_blobs(blobs, current):
+    """The blobs a session document does not reference yet.
+
+    Walls an update leaves unchanged keep their hash, so only edited walls
+    are written.
+    """
+    if not current:
+        return blobs
+    refs = blob_refs([current])
+    return {key: wall for key, wall in blobs.items() if key not in refs}
+
+
+def join_walls(documents, blobs):
+    """Swap references for the stored walls (still encoded), in place.
+
+    A reference whose blob is missing becomes an empty wall.
+    """
+    for document in documents:
+        wall_designs = document.get('wall_designs')
+        if not isinstance(wall_designs, dict):
+            continue
+        for name, wall in wall_designs.items():
+            if isinstance(wall, dict) and 'ref' in wall:
+                stored = blobs.get(wall['ref'])
+                wall_designs[name] = dict(stored) if stored else {'elements': [], 'wallpaper': None}
+    return documents
+
+
+def ref_query(refs, wall_names):
+    """Sessions that point at any of ``refs``"""
+    refs = list(refs)
+    return {'$or': [{f'wall_designs.{name}.ref': {'$in': refs}} for name in wall_names]}
+
+
+def release_blobs(db, refs, wall_names, before):
+    """Delete the blobs among ``refs`` that no session references any more.
+
+    Call it after removing sessions that pointed at ``refs``. Blobs used at
+    or after ``before`` are kept, since a save may be about to point at them;
+    they are left for a later sweep. Returns how many blobs were deleted.
+    """
+    if not refs:
+        return 0
+    kept = blob_refs(db.sessions.find(ref_query(refs, wall_names), {'wall_designs': 1}))
+    released = [key for key in refs if key not in kept]
+    if not released:
+        return 0
+    return db[BLOB_COLLECTION].delete_many({'_id': {'$in': released}, 'used_at': {'$lt': before}}).deleted_count
+
+
+def save_blobs(db, blobs):
+    for query, update in blob_upserts(blobs):
+        db[BLOB_COLLECTION].update_one(query, update, upsert=True)
+
+
+def touch_blobs(db, documents):
+    """Bump ``used_at`` on the blobs some documents reference, before another
+    document starts pointing at them without saving them (a clone)"""
+    refs = blob_refs(documents)
+    if refs:
+        db[BLOB_COLLECTION].update_many({'_id': {'$in': list(refs)}}, {'$set': {'used_at': datetime.utcnow()}})
+
+
+def load_walls(db, documents):
+    """Resolve wall references on session documents with one query"""
+    refs = blob_refs(documents)
+    blobs = {}
+    if refs:
+        blobs = {blob['_id']: blob['wall'] for blob in db[BLOB_COLLECTION].find({'_id': {'$in': list(refs)}})}
+    return join_walls(documents, blobs)
+
+
+async def save_blobs_async(db, blobs):
+    for query, update in blob_upserts(blobs):
+        await db[BLOB_COLLECTION].update_one(query, update, upsert=True)
+
+
+async def touch_blobs_async(db, documents):
+    refs = blob_refs(documents)
+    if refs:
+        await db[BLOB_COLLECTION].update_many({'_id': {'$in': list(refs)}}, {'$set': {'used_at': datetime.utcnow()}})
+
+
+async def load_walls_async(db, documents):
+    refs = blob_refs(documents)
+    blobs = {}
+    if refs:
+        async for blob in db[BLOB_COLLECTION].find({'_id': {'$in': list(refs)}}):
+            blobs[blob['_id']] = blob['wall']
+    return join_walls(documents, blobs)
+
@@ -0,0 +1,402 @@
+"""
+Write-behind buffer for autosaves
+
+While an element is dragged the editor can save the same session (PUT
+/api/sessions/<id>) or the user's wall designs (POST
+/api/designs/wall-designs) several times a second. Every save carries the
+full state, so only the last one of a burst has to reach Mongo. Saves are
+held per (user, session) until ``WRITE_BEHIND_SECONDS`` pass without a new
+one and then written once; a steady stream of saves is still written every
+``WRITE_BEHIND_MAX_DELAY`` seconds. ``WRITE_BEHIND_SECONDS`` is 0 by
+default: every save is written before its request returns.
+
+- Reads see pending saves: the GET routes overlay them, and routes that
+  read a session in other ways flush its key first.
+- Wall blobs of walls replaced within a burst are never stored.
+- A session save carries a ``guard``, the session's ``ops_seq`` when it
+  was accepted. If live-editing ops were folded into the session since
+  (``collab.MongoOpStore.compact``), the save is stale and is not written
+  over them.
+- The buffer is flushed on shutdown (one ``atexit`` hook for every live
+  Flask buffer, ``after_serving`` for the ASGI app).
+- A save that is finally not written (stale, or failed ``MAX_ATTEMPTS``
+  times) is reported to the client: the next save of the same key is
+  rejected with its status and not queued, or the next read of it carries
+  ``save_error``. A save that is queued is never failed for an earlier
+  one. Without a window a failed write is not retried; its own request
+  reports it.
+- ``stats()`` reports saves, writes and the coalescing ratio.
+
+Buffers are per process, and other workers do not see pending saves. A
+window is therefore only used with ``WRITE_BEHIND_PINNED`` set, for
+deployments that route every user to one worker (or run just one).
+"""
+import asyncio
+import atexit
+import threading
+import time
+import weakref
+
+from bson import ObjectId
+
+from wall_store import blob_refs, save_blobs, save_blobs_async, unstored_blobs
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SESSION = 'session'
+WALL_DESIGNS = 'wall_designs'
+
+MAX_ATTEMPTS = 3  # Failed writes are retried with the next flush, then dropped
+
+# What the client is told about a save that was not written
+STALE_SAVE = 409, 'The design was changed by live editing since this save; reload it and save again'
+FAILED_SAVE = 503, 'The design could not be saved; save again'
+
+
+# Flask buffers flushed at exit. Held weakly, so apps that are gone (tests
+# create many) are not kept alive until then.
+_exit_buffers = weakref.WeakSet()
+
+
+def _flush_at_exit():
+    for buffer in list(_exit_buffers):
+        try:
+            buffer.flush()
+        except Exception as e:
+            logger.error(f"Write-behind flush at exit failed: {e}")
+
+
+atexit.register(_flush_at_exit)
+
+
+class StaleSave(Exception):
+    """The session changed under a pending save in a way it must not overwrite"""
+
+
+def write_behind_window(config):
+    """``WRITE_BEHIND_SECONDS``, or 0 unless users are pinned to one worker"""
+    window = config.get('WRITE_BEHIND_SECONDS', 0)
+    if window > 0 and not config.get('WRITE_BEHIND_PINNED', False):
+        logger.warning("WRITE_BEHIND_SECONDS is ignored without WRITE_BEHIND_PINNED: other workers "
+                       "would not see pending saves. Writing every save.")
+        return 0
+    return window
+
+
+def session_key(user_id, session_id):
+    return SESSION, user_id, session_id
+
+
+def wall_designs_key(user_id):
+    return WALL_DESIGNS, user_id
+
+
+class PendingSave:
+    """The latest save for one key and how many saves it stands for"""
+
+    def __init__(self, key, now):
+        self.key = key
+        self.document = None
+        self.guard = None
+        self.blobs = {}
+        self.saves = 0
+        self.first_at = now
+        self.last_at = now
+        self.attempts = 0
+
+    def stored_blobs(self):
+        """The blobs the latest save still references"""
+        refs = blob_refs([self.document])
+        return {key: wall for key, wall in self.blobs.items() if key in refs}
+
+
+def overlay_session(session_data, entry):
+    """A stored session with a pending update applied, in place.
+
+    Walls whose blobs are not stored yet are taken from the pending save;
+    the others still need ``load_walls``.
+    """
+    session_data.update(entry.document)
+    walls = {}
+    for name, wall in (entry.document.get('wall_designs') or {}).items():
+        if isinstance(wall, dict) and wall.get('ref') in entry.blobs:
+            wall = entry.blobs[wall['ref']]
+        walls[name] = dict(wall) if isinstance(wall, dict) else wall
+    session_data['wall_designs'] = walls
+    return session_data
+
+
+class WriteBuffer:
+    """Pending saves by key; the drivers below decide when they are written"""
+
+    def __init__(self, window=1.0, max_delay=5.0, clock=time.monotonic):
+        self.window = window
+        self.max_delay = max_delay
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._writing = {}
+        self._failures = {}  # Key -> the last save that was not written, until reported
+        self._counts = {
+            'saves': 0, 'writes': 0, 'saves_written': 0, 'failed': 0, 'dropped': 0, 'discarded': 0, 'stale': 0
+        }
+
+    def submit(self, key, document, blobs=None, guard=None):
+        """Hold a save; ``guard`` is extra filter the stored document must still match"""
+        now = self.clock()
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = PendingSave(key, now)
+            entry.document = document
+            entry.guard = guard
+            entry.blobs.update(blobs or {})
+            entry.saves += 1
+            entry.last_at = now
+            self._counts['saves'] += 1
+        return entry
+
+    def pending(self, key):
+        """The save a read of ``key`` must see, if it is not stored yet"""
+        with self._lock:
+            return self._pending.get(key) or self._writing.get(key)
+
+    def pending_for(self, kind, user_id):
+        with self._lock:
+            entries = dict(self._writing)
+            entries.update(self._pending)
+        return [entry for key, entry in entries.items() if key[:2] == (kind, user_id)]
+
+    def due_at(self, entry):
+        return min(entry.last_at + self.window, entry.first_at + self.max_delay)
+
+    def next_due(self):
+        with self._lock:
+            return min((self.due_at(entry) for entry in self._pending.values()), default=None)
+
+    def take(self, key=None, due_only=False):
+        """Remove entries to write now: one key, all, or all that are due"""
+        now = self.clock()
+        with self._lock:
+            if key is not None:
+                keys = [key] if key in self._pending else []
+            else:
+                keys = [k for k, entry in self._pending.items() if not due_only or self.due_at(entry) <= now]
+            entries = [self._pending.pop(k) for k in keys]
+            for entry in entries:
+                self._writing[entry.key] = entry
+        return entries
+
+    def discard(self, key):
+        """Drop a pending save, e.g. of a session being deleted"""
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            if entry is not None:
+                self._counts['discarded'] += entry.saves
+
+    def written(self, entry, error=None):
+        with self._lock:
+            if self._writing.get(entry.key) is entry:
+                del self._writing[entry.key]
+            if error is None:
+                self._counts['writes'] += 1
+                self._counts['saves_written'] += entry.saves
+                self._failures.pop(entry.key, None)
+                return
+            if isinstance(error, StaleSave):
+                # Retrying cannot help; a newer pending save has its own guard
+                self._counts['stale'] += entry.saves
+                self._failures[entry.key] = STALE_SAVE
+                logger.warning(f"Dropping save of {entry.key}: {error}")
+                return
+            self._counts['failed'] += 1
+            entry.attempts += 1
+            # Without a window the request is still waiting: it reports the failure instead
+            if entry.attempts >= MAX_ATTEMPTS or self.window <= 0:
+                self._counts['dropped'] += entry.saves
+                self._failures[entry.key] = FAILED_SAVE
+                logger.error(f"Dropping save of {entry.key} after {entry.attempts} failed writes: {error}")
+                return
+            newer = self._pending.get(entry.key)
+            if newer is None:
+                # Retried after another window rather than straight away
+                entry.first_at = entry.last_at = self.clock()
+                self._pending[entry.key] = entry
+            else:
+                # Keep the newer save but the failed one's blobs it may reference
+                newer.blobs = dict(entry.blobs, **newer.blobs)
+                newer.saves += entry.saves
+                newer.first_at = min(newer.first_at, entry.first_at)
+        logger.warning(f"Write of {entry.key} failed, will retry: {error}")
+
+    def failure(self, key):
+        """(status, message) for the last save of ``key`` that was not written, once; else None"""
+        with self._lock:
+            return self._failures.pop(key, None)
+
+    def stats(self):
+        """Counters; ``coalescing_ratio`` is saves per Mongo write"""
+        with self._lock:
+            counts = dict(self._counts, pending=len(self._pending) + len(self._writing))
+        counts['coalesced'] = counts['saves_written'] - counts['writes']
+        counts['coalescing_ratio'] = (
+            round(counts['saves_written'] / counts['writes'], 2) if counts['writes'] else None
+        )
+        return counts
+
+
+def write_entry(db, entry):
+    kind, user_id = entry.key[:2]
+    if kind == WALL_DESIGNS:
+        db.wall_designs.insert_one(dict(entry.document))
+        return
+    query = {'_id': ObjectId(entry.key[2]), 'user_id': user_id}
+    current = db.sessions.find_one(query, {'wall_designs': 1})
+    if current is None:
+        return  # Deleted while the save was pending
+    save_blobs(db, unstored_blobs(entry.stored_blobs(), current))
+    result = db.sessions.update_one(dict(query, **(entry.guard or {})), {'$set': entry.document})
+    if result.matched_count == 0 and entry.guard:
+        raise StaleSave(f"session changed since the save was accepted ({entry.guard})")
+
+
+async def write_entry_async(db, entry):
+    kind, user_id = entry.key[:2]
+    if kind == WALL_DESIGNS:
+        await db.wall_designs.insert_one(dict(entry.document))
+        return
+    query = {'_id': ObjectId(entry.key[2]), 'user_id': user_id}
+    current = await db.sessions.find_one(query, {'wall_designs': 1})
+    if current is None:
+        return  # Deleted while the save was pending
+    await save_blobs_async(db, unstored_blobs(entry.stored_blobs(), current))
+    result = await db.sessions.update_one(dict(query, **(entry.guard or {})), {'$set': entry.document})
+    if result.matched_count == 0 and entry.guard:
+        raise StaleSave(f"session changed since the save was accepted ({entry.guard})")
+
+
+class WriteBehind(WriteBuffer):
+    """Flask driver: a daemon thread writes due saves in an app context"""
+
+    def __init__(self, app, window=1.0, max_delay=5.0):
+        super().__init__(window, max_delay)
+        self.app = app
+        self._write_lock = threading.Lock()  # Keeps writes of one key in order
+        self._wake = threading.Event()
+        self._thread = None
+
+    def save(self, key, document, blobs=None, guard=None):
+        """Hold or write a save. Returns a (status, message) failure for the
+        caller to report, or None: an earlier save of the key that was
+        dropped, in which case this one is not queued, or without a window
+        this save's own"""
+        failure = self.failure(key)
+        if failure:
+            return failure
+        self.submit(key, document, blobs, guard)
+        if self.window <= 0:
+            self.flush(key)
+            return self.failure(key)
+        if self._thread is None:
+            with self._lock:
+                # Started on first use, so forking servers do not copy it
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                    self._thread.start()
+        self._wake.set()
+        return None
+
+    def flush(self, key=None, due_only=False):
+        """Write pending saves now: one key, all, or the due ones"""
+        from extensions import get_db
+
+        with self._write_lock:
+            entries = self.take(key, due_only)
+            if not entries:
+                return
+            with self.app.app_context():
+                db = get_db()
+                for entry in entries:
+                    try:
+                        write_entry(db, entry)
+                        self.written(entry)
+                    except Exception as e:
+                        self.written(entry, e)
+
+    def _run(self):
+        while True:
+            due = self.next_due()
+            self._wake.wait(None if due is None else max(0, due - self.clock()))
+            self._wake.clear()
+            try:
+                self.flush(due_only=True)
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+
+
+class AsyncWriteBehind(WriteBuffer):
+    """ASGI driver: an asyncio task writes due saves with Motor"""
+
+    def __init__(self, db, window=1.0, max_delay=5.0):
+        super().__init__(window, max_delay)
+        self.db = db
+        self._write_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task = None
+
+    async def save(self, key, document, blobs=None, guard=None):
+        """Hold or write a save, reporting failures like ``WriteBehind.save``"""
+        failure = self.failure(key)
+        if failure:
+            return failure
+        self.submit(key, document, blobs, guard)
+        if self.window <= 0:
+            await self.flush(key)
+            return self.failure(key)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        self._wake.set()
+        return None
+
+    async def flush(self, key=None, due_only=False):
+        async with self._write_lock:
+            for entry in self.take(key, due_only):
+                try:
+                    await write_entry_async(self.db, entry)
+                    self.written(entry)
+                except Exception as e:
+                    self.written(entry, e)
+
+    async def _run(self):
+        while True:
+            due = self.next_due()
+            try:
+                await asyncio.wait_for(self._wake.wait(), None if due is None else max(0, due - self.clock()))
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush(due_only=True)
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        await self.flush()
+
+
+def init_write_behind(app):
+    buffer = app.extensions['write_behind'] = WriteBehind(
+        app,
+        window=write_behind_window(app.config),
+        max_delay=app.config.get('WRITE_BEHIND_MAX_DELAY', 5.0),
+    )
+    _exit_buffers.add(buffer)
+
+
+def get_write_behind():
+    from flask import current_app
+    return current_app.extensions['write_behind']
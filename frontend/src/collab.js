@@ -0,0 +1,159 @@
+// Live editing channel of a saved session (backend/collab.py).
+//
+// Local edits are sent as element ops (upsert / delete / wallpaper), ops from
+// other tabs are applied last-writer-wins per element by (lamport, client),
+// the same order the server uses, so every tab converges.
+
+const SEND_INTERVAL = 50; // ms of local edits gathered into one message
+const RECONNECT_DELAYS = [500, 1000, 2000, 5000, 10000];
+const WALLPAPER = '#wallpaper';
+
+const opKey = (op) => `${op.wall}\u0000${op.op === 'wallpaper' ? WALLPAPER : op.id}`;
+
+// Element ops between two wallDesigns states; elements are compared by reference
+export function diffWallDesigns(previous, next) {
+  const ops = [];
+  for (const wall of Object.keys(next || {})) {
+    const before = (previous || {})[wall] || {};
+    const after = next[wall] || {};
+    if ((before.wallpaper || null) !== (after.wallpaper || null)) {
+      ops.push({ op: 'wallpaper', wall, wallpaper: after.wallpaper || null });
+    }
+    if (before.elements === after.elements) continue;
+    const old = new Map((before.elements || []).map(element => [element.id, element]));
+    for (const element of after.elements || []) {
+      if (old.get(element.id) !== element) {
+        ops.push({ op: 'upsert', wall, element });
+      }
+      old.delete(element.id);
+    }
+    for (const id of old.keys()) {
+      ops.push({ op: 'delete', wall, id });
+    }
+  }
+  return ops;
+}
+
+// wallDesigns with ops applied; upserted elements are the op's own objects
+export function applyLiveOps(wallDesigns, ops) {
+  const next = { ...wallDesigns };
+  for (const op of ops) {
+    const wall = { elements: [], wallpaper: null, ...(next[op.wall] || {}) };
+    if (op.op === 'wallpaper') {
+      wall.wallpaper = op.wallpaper;
+    } else if (op.op === 'delete') {
+      wall.elements = wall.elements.filter(element => element.id !== op.id);
+    } else {
+      const index = wall.elements.findIndex(element => element.id === op.element.id);
+      wall.elements = index === -1
+        ? [...wall.elements, op.element]
+        : wall.elements.map((element, i) => (i === index ? op.element : element));
+    }
+    next[op.wall] = wall;
+  }
+  return next;
+}
+
+// Connect to a session's room. onOps(ops) gets the remote ops that won,
+// onResync() is called when the tab must reload the session.
+export function openLiveSession(sessionId, { since = 0, onOps, onResync }) {
+  let socket = null;
+  let client = null;
+  let seq = since;
+  let counter = 0;
+  let lamport = 0;
+  let attempts = 0;
+  let closed = false;
+  let timer = null;
+  const registers = new Map(); // key -> [lamport, client] of the winning write
+  const queued = new Map(); // Local ops not sent yet, one per element
+  let unacked = []; // Sent ops not yet echoed back by the server
+
+  const wins = (op, stamp) => {
+    const current = registers.get(opKey(op));
+    return !current || stamp[0] > current[0] || (stamp[0] === current[0] && stamp[1] > current[1]);
+  };
+
+  const flush = () => {
+    timer = null;
+    if (!queued.size || !socket || socket.readyState !== WebSocket.OPEN || !client) return;
+    const ops = [...queued.values()];
+    queued.clear();
+    for (const op of ops) {
+      op.counter = ++counter;
+      op.lamport = ++lamport;
+      registers.set(opKey(op), [op.lamport, client]);
+    }
+    unacked.push(...ops);
+    socket.send(JSON.stringify({ type: 'ops', ops }));
+  };
+
+  const connect = () => {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const params = new URLSearchParams({ since: String(seq) });
+    if (client) params.set('client', client);
+    socket = new WebSocket(`${protocol}//${window.location.host}/api/sessions/${sessionId}/live?${params}`);
+
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'hello') {
+        attempts = 0;
+        client = message.client;
+        lamport = Math.max(lamport, message.lamport);
+        // Resend what the server did not apply before the disconnect
+        const applied = message.vector[client] || 0;
+        unacked = unacked.filter(op => op.counter > applied);
+        counter = Math.max(counter, applied);
+        if (unacked.length) {
+          socket.send(JSON.stringify({ type: 'ops', ops: unacked }));
+        }
+        flush();
+      } else if (message.type === 'ops') {
+        const remote = [];
+        for (const op of message.ops) {
+          seq = Math.max(seq, op.seq);
+          lamport = Math.max(lamport, op.lamport);
+          if (op.client === client) {
+            unacked = unacked.filter(sent => sent.counter !== op.counter);
+            continue;
+          }
+          const stamp = [op.lamport, op.client];
+          if (wins(op, stamp)) {
+            registers.set(opKey(op), stamp);
+            remote.push(op);
+          }
+        }
+        if (remote.length) onOps(remote);
+      } else if (message.type === 'resync') {
+        onResync();
+      } else if (message.type === 'error') {
+        console.error('Live editing error:', message.error);
+      }
+    };
+
+    socket.onclose = () => {
+      socket = null;
+      if (closed) return;
+      const delay = RECONNECT_DELAYS[Math.min(attempts++, RECONNECT_DELAYS.length - 1)];
+      setTimeout(() => { if (!closed) connect(); }, delay);
+    };
+  };
+
+  connect();
+
+  return {
+    // Queue the local edits between two wallDesigns states
+    send(previous, next) {
+      for (const op of diffWallDesigns(previous, next)) {
+        queued.set(opKey(op), op);
+      }
+      if (queued.size && !timer) timer = setTimeout(flush, SEND_INTERVAL);
+    },
+    close() {
+      closed = true;
+      clearTimeout(timer);
+      flush();
+      if (socket) socket.close();
+    },
+  };
+}
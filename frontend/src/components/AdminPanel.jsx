@@ -134,7 +134,7 @@ const AdminPanel = ({ user, onClose }) => {
           if (response.ok) {
             // Remove user from list
             setUsers(prev => prev.filter(user => user._id !== userId));
-            showAlert('Success', `✅ User "${username}" deleted successfully.\n\nAll associated data has been removed.`, 'success');
+            showAlert('Success', `✅ User "${username}" deleted successfully.\n\nTheir sessions and designs are being removed in the background.`, 'success');
           } else {
             const errorData = await response.json();
             showAlert('Error', `❌ Error deleting user: ${errorData.error || 'Unknown error'}`, 'error');
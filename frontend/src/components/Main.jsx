@@ -10,6 +10,7 @@ import AlertModal from "./AlertModal";
 import InputModal from "./InputModal";
 import AdminPanel from "./AdminPanel";
 import { API_BASE_URL } from '../config';
+import { applyLiveOps, openLiveSession } from '../collab';
 import "./Main.css";
 
 // Helper to generate a random color (same as in Canvas.jsx)
@@ -63,6 +64,16 @@ const Main = ({ user, onLogout }) => {
   // Track loaded session key and name
   const [loadedSessionKey, setLoadedSessionKey] = React.useState(null);
   const [loadedSessionName, setLoadedSessionName] = React.useState(null);
+  // Designs as last saved or loaded; while unchanged, the 3D view loads the compiled scene
+  const [savedDesign, setSavedDesign] = React.useState(null);
+
+  // Live editing of the loaded session with its other open tabs
+  const wallDesignsRef = useRef(wallDesigns);
+  wallDesignsRef.current = wallDesigns;
+  const liveRef = useRef(null);
+  const liveBaselineRef = useRef(null); // wallDesigns as last sent or received
+  const liveSinceRef = useRef(0); // Op sequence the loaded session includes
+  const [liveEpoch, setLiveEpoch] = React.useState(0);
   
   // Session modal state
   const [isSessionModalOpen, setIsSessionModalOpen] = React.useState(false);
@@ -253,6 +264,32 @@ const Main = ({ user, onLogout }) => {
     }
   }, []);
 
+  // Re-saving a session after wall edits only: PUT just the edited walls
+  // (wall objects are replaced when edited, so unchanged ones compare equal).
+  // Returns null when a full save is needed. The selected wall is UI state
+  // and is only stored by full saves.
+  const saveChangedWalls = useCallback(async (sessionId, sessionName) => {
+    if (!savedDesign || savedDesign.sessionId !== sessionId || savedDesign.sessionName !== sessionName ||
+        savedDesign.roomType !== roomType || savedDesign.roomDimensions !== roomDimensions ||
+        !savedDesign.wallDesigns) {
+      return null;
+    }
+    const changed = Object.keys(wallDesigns).filter(wall => wallDesigns[wall] !== savedDesign.wallDesigns[wall]);
+    let response = new Response('{}', { status: 200 });
+    for (const wall of changed) {
+      response = await fetch(`/api/sessions/${sessionId}/walls/${wall}`, {
+        method: 'PUT',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        credentials: 'include',
+        body: JSON.stringify(wallDesigns[wall] || { elements: [], wallpaper: null }),
+      });
+      if (!response.ok) break;
+    }
+    return response;
+  }, [savedDesign, roomType, roomDimensions, wallDesigns]);
+
   // Function to save entire room design as session to backend
   const saveRoomDesign = useCallback(async () => {
     try {
@@ -296,15 +333,18 @@ const Main = ({ user, onLogout }) => {
 
       let response;
       if (isUpdate) {
-        // Update existing session
-        response = await fetch(`/api/sessions/${sessionId}`, {
-          method: 'PUT',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          credentials: 'include',
-          body: JSON.stringify(sessionData),
-        });
+        // Update existing session, wall by wall when only walls changed
+        response = await saveChangedWalls(sessionId, sessionData.session_name);
+        if (!response) {
+          response = await fetch(`/api/sessions/${sessionId}`, {
+            method: 'PUT',
+            headers: {
+              'Content-Type': 'application/json',
+            },
+            credentials: 'include',
+            body: JSON.stringify(sessionData),
+          });
+        }
       } else {
         // Create new session
         response = await fetch(`/api/sessions`, {
@@ -324,6 +364,9 @@ const Main = ({ user, onLogout }) => {
         }
         setLoadedSessionKey(sessionId);
         setLoadedSessionName(sessionName.trim());
+        setSavedDesign({
+          wallDesigns, roomDimensions, roomType, sessionId, sessionName: sessionName.trim(), version: Date.now()
+        });
         console.log(`Room design ${isUpdate ? 'updated' : 'saved'} as session successfully`);
         showAlert('Success', `Room design ${isUpdate ? 'updated' : 'saved'} as session!`, 'success');
       } else {
@@ -334,7 +377,7 @@ const Main = ({ user, onLogout }) => {
       console.error('Error saving room design session:', error);
       showAlert('Error', 'Error saving room design session. Please try again.', 'error');
     }
-  }, [roomType, selectedWall, roomDimensions, wallDesigns, loadedSessionKey, loadedSessionName]);
+  }, [roomType, selectedWall, roomDimensions, wallDesigns, loadedSessionKey, loadedSessionName, saveChangedWalls]);
 
   // Helper function to save room design with a specific name
   const saveRoomDesignWithName = useCallback(async (sessionName, isUpdate) => {
@@ -351,15 +394,18 @@ const Main = ({ user, onLogout }) => {
 
       let response;
       if (isUpdate) {
-        // Update existing session
-        response = await fetch(`/api/sessions/${sessionId}`, {
-          method: 'PUT',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          credentials: 'include',
-          body: JSON.stringify(sessionData),
-        });
+        // Update existing session, wall by wall when only walls changed
+        response = await saveChangedWalls(sessionId, sessionData.session_name);
+        if (!response) {
+          response = await fetch(`/api/sessions/${sessionId}`, {
+            method: 'PUT',
+            headers: {
+              'Content-Type': 'application/json',
+            },
+            credentials: 'include',
+            body: JSON.stringify(sessionData),
+          });
+        }
       } else {
         // Create new session
         response = await fetch(`/api/sessions`, {
@@ -379,6 +425,7 @@ const Main = ({ user, onLogout }) => {
         }
         setLoadedSessionKey(sessionId);
         setLoadedSessionName(sessionName);
+        setSavedDesign({ wallDesigns, roomDimensions, roomType, sessionId, sessionName, version: Date.now() });
         console.log(`Room design ${isUpdate ? 'updated' : 'saved'} as session successfully`);
         showAlert('Success', `Room design ${isUpdate ? 'updated' : 'saved'} as session!`, 'success');
       } else {
@@ -389,7 +436,7 @@ const Main = ({ user, onLogout }) => {
       console.error('Error saving room design session:', error);
       showAlert('Error', 'Error saving room design session. Please try again.', 'error');
     }
-  }, [roomType, selectedWall, roomDimensions, wallDesigns, loadedSessionKey]);
+  }, [roomType, selectedWall, roomDimensions, wallDesigns, loadedSessionKey, saveChangedWalls]);
 
   // Function to open session modal and load available sessions
   const openSessionModal = useCallback(async () => {
@@ -448,8 +495,18 @@ const Main = ({ user, onLogout }) => {
           });
         }
         
+        liveSinceRef.current = roomDesign.ops_seq || 0;
+        setLiveEpoch(epoch => epoch + 1);
         setLoadedSessionKey(sessionId);
         setLoadedSessionName(roomDesign.session_name || '');
+        setSavedDesign({
+          wallDesigns: roomDesign.wall_designs,
+          roomDimensions: roomDesign.room_dimensions,
+          roomType: roomDesign.room_type || '',
+          sessionId,
+          sessionName: roomDesign.session_name || '',
+          version: Date.now()
+        });
         
         // Restore current wall elements and wallpaper
         if (roomDesign.selected_wall && roomDesign.wall_designs && roomDesign.wall_designs[roomDesign.selected_wall]) {
@@ -523,6 +580,7 @@ const Main = ({ user, onLogout }) => {
         setWallpaper(null);
         setLoadedSessionKey(null);
         setLoadedSessionName(null);
+        setSavedDesign(null);
         console.log('New session started - all walls cleared');
         showAlert('Success', 'New session started! All walls have been cleared.', 'success');
       }
@@ -567,6 +625,9 @@ const Main = ({ user, onLogout }) => {
             const sessionId = data.session._id;
             setLoadedSessionKey(sessionId);
             setLoadedSessionName(sessionName.trim());
+            setSavedDesign({
+              wallDesigns, roomDimensions, roomType, sessionId, sessionName: sessionName.trim(), version: Date.now()
+            });
             console.log('Room design saved as new session successfully');
             showAlert('Success', 'Room design saved as new session!', 'success');
           } else {
@@ -699,6 +760,61 @@ const Main = ({ user, onLogout }) => {
     });
   }, []);
 
+  // Apply ops from other tabs to the designs and to the wall being edited
+  const applyRemoteOps = useCallback((ops) => {
+    liveBaselineRef.current = applyLiveOps(liveBaselineRef.current || {}, ops);
+    setWallDesigns(prev => applyLiveOps(prev, ops));
+
+    const wall = selectedWallRef.current;
+    const wallOps = ops.filter(op => op.wall === wall);
+    if (wallOps.some(op => op.op !== 'wallpaper')) {
+      setElements(prev => applyLiveOps({ [wall]: { elements: prev, wallpaper: null } }, wallOps)[wall].elements);
+    }
+    const wallpaperOp = wallOps.filter(op => op.op === 'wallpaper').pop();
+    if (wallpaperOp) {
+      setWallpaper(wallpaperOp.wallpaper);
+    }
+  }, []);
+
+  // Join the loaded session's live channel (reconnects when another session is loaded)
+  React.useEffect(() => {
+    if (!loadedSessionKey) return undefined;
+    liveBaselineRef.current = wallDesignsRef.current;
+    const live = openLiveSession(loadedSessionKey, {
+      since: liveSinceRef.current,
+      onOps: applyRemoteOps,
+      onResync: async () => {
+        // Missed too many ops: reload the session and rejoin from there
+        live.close();
+        const response = await fetch(`/api/sessions/${loadedSessionKey}`, { credentials: 'include' });
+        if (!response.ok) return;
+        const { session } = await response.json();
+        if (session.wall_designs) {
+          const current = session.wall_designs[selectedWallRef.current];
+          wallDesignsRef.current = session.wall_designs;
+          setWallDesigns(session.wall_designs);
+          setElements(current?.elements || []);
+          setWallpaper(current?.wallpaper || null);
+        }
+        liveSinceRef.current = session.ops_seq || 0;
+        setLiveEpoch(epoch => epoch + 1);
+      },
+    });
+    liveRef.current = live;
+    return () => {
+      live.close();
+      liveRef.current = null;
+    };
+  }, [loadedSessionKey, liveEpoch, applyRemoteOps]);
+
+  // Send local edits as element ops
+  React.useEffect(() => {
+    if (liveRef.current && liveBaselineRef.current && liveBaselineRef.current !== wallDesigns) {
+      liveRef.current.send(liveBaselineRef.current, wallDesigns);
+    }
+    liveBaselineRef.current = wallDesigns;
+  }, [wallDesigns]);
+
   // Update canvas size on window resize
   React.useEffect(() => {
     const handleResize = () => {
@@ -719,7 +835,7 @@ const Main = ({ user, onLogout }) => {
     console.log('Elements length:', elements.length);
   }, [elements]);
 
-  const STICKER_CATEGORIES = {
+  const DEFAULT_STICKER_CATEGORIES = {
     Flowers: [
       "/images/flower1.png",
       "/images/flower2.png",
@@ -784,6 +900,30 @@ const Main = ({ user, onLogout }) => {
       "/images/table7.png",
     ],
   };
+  // Catalog from the backend; the hard-coded list above is the fallback
+  const [catalogCategories, setCatalogCategories] = useState(null);
+
+  React.useEffect(() => {
+    const loadCatalog = async () => {
+      try {
+        const response = await fetch(`/api/catalog?tag=decoration`);
+        if (!response.ok) return;
+        const data = await response.json();
+        const categories = {};
+        data.assets.forEach((asset) => {
+          (categories[asset.category_label] = categories[asset.category_label] || []).push(asset.src);
+        });
+        if (Object.keys(categories).length > 0) {
+          setCatalogCategories(categories);
+        }
+      } catch (error) {
+        console.error('Error fetching catalog:', error);
+      }
+    };
+    loadCatalog();
+  }, []);
+
+  const STICKER_CATEGORIES = catalogCategories || DEFAULT_STICKER_CATEGORIES;
   const STICKER_CATEGORY_LIST = Object.keys(STICKER_CATEGORIES);
 
   const addImage = () => {
@@ -934,6 +1074,12 @@ const Main = ({ user, onLogout }) => {
               dimensions={roomDimensions}
               roomType={roomType}
               wallDesigns={wallDesigns}
+              sceneUrl={
+                loadedSessionKey && savedDesign &&
+                savedDesign.wallDesigns === wallDesigns && savedDesign.roomDimensions === roomDimensions
+                  ? `/api/sessions/${loadedSessionKey}/scene.glb?v=${savedDesign.version}`
+                  : null
+              }
             />
           ) : (
             <Canvas
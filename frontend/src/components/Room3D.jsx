@@ -1,6 +1,6 @@
-import React, { useMemo, useState, useEffect, useCallback } from 'react';
+import React, { useMemo, useState, useEffect, useCallback, Suspense } from 'react';
 import { Canvas, useLoader } from '@react-three/fiber';
-import { OrbitControls } from '@react-three/drei';
+import { OrbitControls, useGLTF } from '@react-three/drei';
 import * as THREE from 'three';
 import { Text } from '@react-three/drei';
 import Sofa from './Sofa';
@@ -234,8 +234,40 @@ function Others({ dimensions, wallColors = {}, wallTextures = {} }) {
   );
 }
 
-const Room3D = ({ dimensions, roomType, wallDesigns }) => {
+// Wall designs compiled by the backend: one request, one atlas texture
+function CompiledWalls({ url }) {
+  const { scene } = useGLTF(url);
+  return <primitive object={scene} />;
+}
+
+class SceneErrorBoundary extends React.Component {
+  constructor(props) {
+    super(props);
+    this.state = { failed: false };
+  }
+
+  static getDerivedStateFromError() {
+    return { failed: true };
+  }
+
+  componentDidCatch(error) {
+    console.error('Error loading compiled scene:', error);
+    this.props.onError();
+  }
+
+  render() {
+    return this.state.failed ? null : this.props.children;
+  }
+}
+
+const Room3D = ({ dimensions, roomType, wallDesigns, sceneUrl = null }) => {
   const [wallTextures, setWallTextures] = useState({});
+  const [sceneFailed, setSceneFailed] = useState(false);
+  const useCompiledScene = Boolean(sceneUrl) && !sceneFailed;
+
+  useEffect(() => {
+    setSceneFailed(false);
+  }, [sceneUrl]);
 
   // Convert 2D wall designs to complete wall textures
   const generateWallTextures = useCallback(async () => {
@@ -394,10 +426,14 @@ const Room3D = ({ dimensions, roomType, wallDesigns }) => {
     setWallTextures(textures);
   }, [wallDesigns]);
 
-  // Generate textures when wallDesigns change
+  // Generate textures when wallDesigns change, unless the compiled scene has them
   useEffect(() => {
+    if (useCompiledScene) {
+      setWallTextures({});
+      return;
+    }
     generateWallTextures();
-  }, [generateWallTextures]);
+  }, [generateWallTextures, useCompiledScene]);
 
   let RoomComponent;
   if (roomType === 'livingroom') RoomComponent = LivingRoom;
@@ -409,6 +445,13 @@ const Room3D = ({ dimensions, roomType, wallDesigns }) => {
     <div style={{ width: '100%', height: '500px', border: '2px solid #ddd', borderRadius: '8px', backgroundColor: '#ffffff' }}>
       <Canvas shadows camera={{ position: [0, 2, 8], fov: 50 }}>
         <RoomComponent dimensions={dimensions} wallTextures={wallTextures} />
+        {useCompiledScene && (
+          <SceneErrorBoundary key={sceneUrl} onError={() => setSceneFailed(true)}>
+            <Suspense fallback={null}>
+              <CompiledWalls url={sceneUrl} />
+            </Suspense>
+          </SceneErrorBoundary>
+        )}
         <OrbitControls
           enablePan={true}
           enableZoom={true}
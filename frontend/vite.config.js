@@ -8,6 +8,12 @@ export default defineConfig({
     port: 5173,
     strictPort: true,
     proxy: {
+      // Live editing WebSockets are served by the async app (backend/asgi.py)
+      '^/api/sessions/[^/]+/live': {
+        target: 'ws://localhost:5001',
+        ws: true,
+        changeOrigin: true,
+      },
       '/api': {
         target: 'http://localhost:5000',
         changeOrigin: true,